@@ -0,0 +1,136 @@
+import time
+from datetime import datetime, timezone
+
+from apps.stock.cache import get_versions
+from apps.stock.models import (
+    BrandStock,
+    ProductInventory,
+    ProductStock,
+    SupplierStock,
+)
+from apps.stock.routers import read_current
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast
+
+WIDGET_KEY = "dashboard:widget:%s"
+WIDGETS = {}
+
+
+def widget(name, *sources):
+    """
+    Register a KPI widget computed from the summary tables; ``sources``
+    name the versions whose changes make the cached figures stale.
+    """
+
+    def register(func):
+        WIDGETS[name] = (func, sources or ("inventory",))
+        return func
+
+    return register
+
+
+def get_widget(name):
+    """
+    The cached figures of a widget with their staleness metadata.
+
+    A widget is recomputed when it was never computed, or when its sources
+    changed after it was and it has been shown for longer than
+    ``DASHBOARD_WIDGET_MAX_STALENESS`` seconds since.
+    """
+    func, sources = WIDGETS[name]
+    changed_at = max(get_versions(*sources).values())
+    now = time.time()
+    entry = cache.get(WIDGET_KEY % name)
+    if entry is None or (
+        entry["computed_at"] < changed_at
+        and now - entry["computed_at"]
+        >= settings.DASHBOARD_WIDGET_MAX_STALENESS
+    ):
+        # Figures are kept until their sources change again, so they must
+        # not come from a replica that lags behind the latest change.
+        with read_current(changed_at):
+            entry = {"data": func(), "computed_at": now}
+        cache.set(WIDGET_KEY % name, entry, timeout=None)
+    return dict(
+        entry,
+        name=name,
+        computed=datetime.fromtimestamp(entry["computed_at"], timezone.utc),
+        stale=entry["computed_at"] < changed_at,
+    )
+
+
+def get_widgets():
+    return {name: get_widget(name) for name in WIDGETS}
+
+
+def defect_rates(model, owner, limit=10):
+    return list(
+        model.objects.filter(quantity__gt=0)
+        .annotate(
+            rate=Cast("defective", FloatField())
+            / Cast("quantity", FloatField())
+        )
+        .order_by("-rate")
+        .values(
+            "pk", "quantity", "defective", "rate", name=F("%s__name" % owner)
+        )[:limit]
+    )
+
+
+@widget("totals", "inventory", "reorder")
+def totals():
+    """
+    Inventory-wide totals, summed over the few brand summary rows.
+
+    Low stock counts the items flagged for reorder against their own
+    thresholds, read off the partial reorder index, rather than the
+    summaries' global ``STOCK_LOW_STOCK_THRESHOLD`` count.
+    """
+    data = BrandStock.objects.aggregate(
+        quantity=Sum("quantity"),
+        sold=Sum("sold"),
+        available=Sum("available"),
+        defective=Sum("defective"),
+        stock_value=Sum("stock_value"),
+    )
+    data["low_stock"] = ProductInventory.objects.filter(
+        needs_reorder=True
+    ).count()
+    return data
+
+
+@widget("low_stock_suppliers", "reorder", "supplier")
+def low_stock_suppliers(limit=10):
+    """
+    The suppliers with the most items flagged for reorder.
+    """
+    return list(
+        ProductInventory.objects.filter(needs_reorder=True)
+        .values("supplier")
+        .annotate(low_stock=Count("pk"))
+        .order_by("-low_stock")
+        .values("low_stock", pk=F("supplier"), name=F("supplier__name"))[
+            :limit
+        ]
+    )
+
+
+@widget("supplier_defect_rates")
+def supplier_defect_rates():
+    return defect_rates(SupplierStock, "supplier")
+
+
+@widget("brand_defect_rates")
+def brand_defect_rates():
+    return defect_rates(BrandStock, "brand")
+
+
+@widget("top_sellers", "inventory", "product")
+def top_sellers(limit=10):
+    return list(
+        ProductStock.objects.filter(sold__gt=0)
+        .order_by("-sold")
+        .values("pk", "sold", "available", name=F("product__name"))[:limit]
+    )
@@ -1,3 +1,96 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from apps.dashboard.kpis import get_widget
+from apps.stock.inventory import apply_movement
+from apps.stock.models import Brand, StockMovement
+from apps.stock.tests.tests import (
+    make_inventory,
+    make_product,
+    make_supplier,
+    make_user,
+)
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+@override_settings(STOCK_LOW_STOCK_THRESHOLD=5)
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.acme = Brand.objects.create(name="Acme")
+        cls.globex = Brand.objects.create(name="Globex")
+        cls.wholesale = make_supplier("Wholesale")
+        cls.pixel = make_product("Pixel")
+        cls.tab = make_product("Tab")
+        cls.pixel_item = make_inventory(
+            cls.pixel,
+            "PX-1",
+            cls.acme,
+            cls.wholesale,
+            quantity=20,
+            available=20,
+        )
+        cls.tab_item = make_inventory(
+            cls.tab,
+            "TB-1",
+            cls.globex,
+            cls.wholesale,
+            quantity=4,
+            available=4,
+            defective=1,
+            reorder_level=5,
+            reorder_threshold=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(make_user())
+
+    def test_widgets_read_the_summaries(self):
+        apply_movement(self.pixel_item.pk, StockMovement.SELL, 3)
+        apply_movement(self.tab_item.pk, StockMovement.SELL, 1)
+
+        totals = get_widget("totals")["data"]
+        self.assertEqual(totals["available"], 20)
+        self.assertEqual(totals["low_stock"], 1)
+        self.assertEqual(totals["stock_value"], Decimal("160"))
+        self.assertEqual(
+            [row["name"] for row in get_widget("top_sellers")["data"]],
+            ["Pixel", "Tab"],
+        )
+        brands = get_widget("brand_defect_rates")["data"]
+        self.assertEqual(brands[0]["name"], "Globex")
+        self.assertAlmostEqual(brands[0]["rate"], 0.25)
+        self.assertEqual(
+            get_widget("low_stock_suppliers")["data"][0]["low_stock"], 1
+        )
+
+    def test_cached_widgets_report_staleness(self):
+        first = get_widget("totals")
+        self.assertFalse(first["stale"])
+
+        with override_settings(DASHBOARD_WIDGET_MAX_STALENESS=3600):
+            apply_movement(self.pixel_item.pk, StockMovement.SELL, 3)
+            cached = get_widget("totals")
+        self.assertTrue(cached["stale"])
+        self.assertEqual(cached["computed_at"], first["computed_at"])
+        self.assertEqual(cached["data"]["sold"], 0)
+
+        with override_settings(DASHBOARD_WIDGET_MAX_STALENESS=0):
+            fresh = get_widget("totals")
+        self.assertFalse(fresh["stale"])
+        self.assertEqual(fresh["data"]["sold"], 3)
+
+    def test_home_page_is_served_from_the_widget_cache(self):
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, "Top sellers")
+        self.assertContains(response, "Globex")
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("home"))
+        self.assertFalse(
+            [q for q in ctx.captured_queries if "stock_" in q["sql"]]
+        )
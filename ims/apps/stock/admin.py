@@ -3,19 +3,33 @@ from django.contrib import admin
 from .models import (
     Address,
     Brand,
+    BrandStock,
     Category,
+    CategoryStock,
     Media,
     Product,
     ProductInventory,
+    ProductStock,
     ProductType,
+    RejectedSale,
+    ReorderAlert,
+    StockMovement,
     Supplier,
+    SupplierStock,
 )
 
 admin.site.register(Address)
 admin.site.register(Brand)
+admin.site.register(BrandStock)
 admin.site.register(Category)
+admin.site.register(CategoryStock)
 admin.site.register(Media)
 admin.site.register(Product)
 admin.site.register(ProductInventory)
+admin.site.register(ProductStock)
 admin.site.register(ProductType)
+admin.site.register(RejectedSale)
+admin.site.register(ReorderAlert)
+admin.site.register(StockMovement)
 admin.site.register(Supplier)
+admin.site.register(SupplierStock)
@@ -0,0 +1,414 @@
+import copy
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Q,
+    Sum,
+    When,
+)
+
+from .cache import bump_version
+
+TOTAL_FIELDS = (
+    "quantity",
+    "sold",
+    "available",
+    "defective",
+    "low_stock",
+    "stock_value",
+)
+COUNTER_FIELDS = ("quantity", "sold", "available", "defective")
+
+
+def _model(name, apps=global_apps):
+    return apps.get_model("stock", name)
+
+
+def zero_totals():
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+def item_totals(quantity, sold, available, defective, price):
+    """
+    What a single inventory item contributes to the aggregates.
+    """
+    return {
+        "quantity": quantity,
+        "sold": sold,
+        "available": available,
+        "defective": defective,
+        "low_stock": int(available <= settings.STOCK_LOW_STOCK_THRESHOLD),
+        "stock_value": Decimal(price) * available,
+    }
+
+
+def snapshot(item):
+    """
+    ``((product_id, brand_id, supplier_id), totals)`` of an inventory item
+    instance.
+    """
+    return (item.product_id, item.brand_id, item.supplier_id), item_totals(
+        item.quantity, item.sold, item.available, item.defective, item.price
+    )
+
+
+class StockDeltas:
+    """
+    Accumulates per-item changes to the totals, to be written with
+    ``apply()`` in the caller's transaction.
+    """
+
+    def __init__(self):
+        self.items = defaultdict(zero_totals)
+
+    def add(self, key, totals, sign=1):
+        delta = self.items[key]
+        for field, value in totals.items():
+            delta[field] += sign * value
+
+    def change(self, before, after):
+        """
+        Record an item going from the ``before`` to the ``after`` snapshot;
+        either may be ``None`` for a created or deleted item.
+        """
+        if before is not None:
+            self.add(*before, sign=-1)
+        if after is not None:
+            self.add(*after)
+
+    def apply(self):
+        """
+        Write the accumulated changes to the product, category, brand and
+        supplier aggregates.
+        """
+        groups = {
+            "product": defaultdict(zero_totals),
+            "brand": defaultdict(zero_totals),
+            "supplier": defaultdict(zero_totals),
+        }
+        for key, delta in self.items.items():
+            for name, pk in zip(("product", "brand", "supplier"), key):
+                for field, value in delta.items():
+                    groups[name][pk][field] += value
+        self.items.clear()
+
+        deltas = {
+            name: {pk: d for pk, d in group.items() if any(d.values())}
+            for name, group in groups.items()
+        }
+        if not any(deltas.values()):
+            return
+        apply_product_deltas(deltas["product"])
+        apply_group_deltas(_model("BrandStock"), "brand_id", deltas["brand"])
+        apply_group_deltas(
+            _model("SupplierStock"), "supplier_id", deltas["supplier"]
+        )
+        bump_version("inventory")
+        transaction.on_commit(lambda: bump_version("inventory"))
+
+
+def apply_product_deltas(deltas):
+    """
+    Add ``{product_id: {field: delta}}`` to the product aggregates and to
+    the aggregates of every category above each product, with one
+    ``UPDATE ... SET x = x + n`` per row.
+    """
+    if not deltas:
+        return
+    ProductStock = _model("ProductStock")
+    CategoryStock = _model("CategoryStock")
+
+    for product_id in sorted(deltas):
+        _increment(
+            ProductStock, {"product_id": product_id}, deltas[product_id]
+        )
+
+    categories = defaultdict(zero_totals)
+    for product_id, ancestors in product_ancestors(deltas).items():
+        for category_id in ancestors:
+            for field, value in deltas[product_id].items():
+                categories[category_id][field] += value
+    for category_id in sorted(categories):
+        _increment(
+            CategoryStock,
+            {"category_id": category_id},
+            categories[category_id],
+        )
+
+
+def apply_group_deltas(model, key, deltas):
+    for pk in sorted(deltas):
+        _increment(model, {key: pk}, deltas[pk])
+
+
+def _increment(model, lookup, delta):
+    changes = {
+        field: F(field) + value for field, value in delta.items() if value
+    }
+    if changes:
+        model.objects.filter(**lookup).update(**changes)
+
+
+def product_ancestors(product_ids, apps=global_apps):
+    """
+    ``{product_id: {category ids}}``: each product's categories and all of
+    their ancestors, found with one membership query and one range query.
+    """
+    Category = _model("Category", apps)
+    through = _model("Product", apps).category.through
+
+    memberships = through.objects.filter(
+        product_id__in=list(product_ids)
+    ).values_list(
+        "product_id", "category__tree_id", "category__lft", "category__rght"
+    )
+    nodes = defaultdict(set)
+    for product_id, tree_id, lft, rght in memberships:
+        nodes[product_id].add((tree_id, lft, rght))
+    if not nodes:
+        return {}
+
+    containing = Q()
+    for tree_id, lft, rght in set().union(*nodes.values()):
+        containing |= Q(tree_id=tree_id, lft__lte=lft, rght__gte=rght)
+    candidates = defaultdict(list)
+    for pk, tree_id, lft, rght in Category.objects.filter(
+        containing
+    ).values_list("pk", "tree_id", "lft", "rght"):
+        candidates[tree_id].append((pk, lft, rght))
+
+    ancestors = {}
+    for product_id, product_nodes in nodes.items():
+        ancestors[product_id] = {
+            pk
+            for tree_id, lft, rght in product_nodes
+            for pk, a_lft, a_rght in candidates[tree_id]
+            if a_lft <= lft and a_rght >= rght
+        }
+    return ancestors
+
+
+def product_totals(product_id):
+    ProductStock = _model("ProductStock")
+    totals = (
+        ProductStock.objects.filter(product_id=product_id)
+        .values(*TOTAL_FIELDS)
+        .first()
+    )
+    return totals or zero_totals()
+
+
+def move_product_categories(product_id, sign):
+    """
+    Take a product's totals out of (``sign=-1``) or put them back into
+    (``sign=1``) every category above it, around a membership change.
+    """
+    totals = product_totals(product_id)
+    if not any(totals.values()):
+        return
+    CategoryStock = _model("CategoryStock")
+    for category_id in sorted(
+        product_ancestors([product_id]).get(product_id, ())
+    ):
+        _increment(
+            CategoryStock,
+            {"category_id": category_id},
+            {field: sign * value for field, value in totals.items()},
+        )
+
+
+class CategoryLineage:
+    """
+    The categories above each category, followed through ``parent_id``
+    rather than the tree fields, which mptt leaves inconsistent while it
+    moves or deletes a node.
+    """
+
+    def __init__(self, apps=global_apps):
+        self.apps = apps
+        self.parents = dict(
+            _model("Category", apps).objects.values_list("pk", "parent_id")
+        )
+        self.lineage = {}
+
+    def ancestors(self, pk):
+        """
+        ``pk`` and the ids of every category above it.
+        """
+        if pk not in self.lineage:
+            parent = self.parents[pk]
+            self.lineage[pk] = {pk} | (
+                self.ancestors(parent) if parent else set()
+            )
+        return self.lineage[pk]
+
+    def moved(self, pk, parent_id):
+        """
+        The lineage once category ``pk`` is under ``parent_id``.
+        """
+        lineage = copy.copy(self)
+        lineage.parents = {**self.parents, pk: parent_id}
+        lineage.lineage = {}
+        return lineage
+
+    def subtree(self, pk):
+        return {node for node in self.parents if pk in self.ancestors(node)}
+
+    def products(self, product_ids, exclude=()):
+        """
+        ``{product_id: {category ids}}``: the categories at or above those
+        of each product, leaving out its memberships in ``exclude``.
+        """
+        through = _model("Product", self.apps).category.through
+        categories = {pk: set() for pk in product_ids}
+        for product_id, category_id in through.objects.filter(
+            product_id__in=list(product_ids)
+        ).values_list("product_id", "category_id"):
+            if category_id not in exclude:
+                categories[product_id] |= self.ancestors(category_id)
+        return categories
+
+
+def move_categories(before, after):
+    """
+    Move the totals of each product from the categories it had ``before``
+    to those it has ``after``, both ``{product_id: {category ids}}``; only
+    the categories that differ are updated.
+    """
+    ProductStock = _model("ProductStock")
+    CategoryStock = _model("CategoryStock")
+    categories = defaultdict(zero_totals)
+    for row in ProductStock.objects.filter(product_id__in=list(before)).values(
+        "product_id", *TOTAL_FIELDS
+    ):
+        old = before[row["product_id"]]
+        new = after.get(row["product_id"], set())
+        for category_id, sign in [(pk, -1) for pk in old - new] + [
+            (pk, 1) for pk in new - old
+        ]:
+            for field in TOTAL_FIELDS:
+                categories[category_id][field] += sign * row[field]
+    for category_id in sorted(categories):
+        _increment(
+            CategoryStock,
+            {"category_id": category_id},
+            categories[category_id],
+        )
+
+
+def _inventory_sums(key, apps, batch_size):
+    """
+    ``{key: totals}`` summed over the inventory rows with one ``GROUP BY``.
+    """
+    ProductInventory = _model("ProductInventory", apps)
+    sums = {"%s_sum" % field: Sum(field) for field in COUNTER_FIELDS}
+    sums["low_stock_sum"] = Sum(
+        Case(
+            When(available__lte=settings.STOCK_LOW_STOCK_THRESHOLD, then=1),
+            default=0,
+            output_field=IntegerField(),
+        )
+    )
+    sums["stock_value_sum"] = Sum(
+        ExpressionWrapper(
+            F("price") * F("available"),
+            output_field=DecimalField(max_digits=18, decimal_places=2),
+        )
+    )
+    return {
+        row[key]: {field: row["%s_sum" % field] for field in TOTAL_FIELDS}
+        for row in ProductInventory.objects.order_by()
+        .values(key)
+        .annotate(**sums)
+        .iterator(chunk_size=batch_size)
+    }
+
+
+def _rebuild_totals(name, owner, key, apps, batch_size):
+    """
+    Replace every row of the ``name`` aggregate, one per ``owner`` row.
+    """
+    Owner = _model(owner, apps)
+    Totals = _model(name, apps)
+    sums = _inventory_sums(key, apps, batch_size)
+
+    Totals.objects.all().delete()
+    Totals.objects.bulk_create(
+        (
+            Totals(pk=pk, **sums.get(pk, zero_totals()))
+            for pk in Owner.objects.values_list("pk", flat=True).iterator(
+                chunk_size=batch_size
+            )
+        ),
+        batch_size=batch_size,
+    )
+
+
+def rebuild_product_stock(apps=global_apps, batch_size=2000):
+    """
+    Recompute every product aggregate from the inventory rows with a single
+    ``GROUP BY`` pass.
+    """
+    _rebuild_totals("ProductStock", "Product", "product_id", apps, batch_size)
+
+
+def rebuild_supplier_stock(apps=global_apps, batch_size=2000):
+    _rebuild_totals(
+        "SupplierStock", "Supplier", "supplier_id", apps, batch_size
+    )
+
+
+def rebuild_brand_stock(apps=global_apps, batch_size=2000):
+    _rebuild_totals("BrandStock", "Brand", "brand_id", apps, batch_size)
+
+
+def rebuild_category_stock(apps=global_apps, batch_size=2000):
+    """
+    Recompute every category aggregate from the product aggregates, adding
+    each product once to each category at or above its own categories.
+    """
+    CategoryStock = _model("CategoryStock", apps)
+    ProductStock = _model("ProductStock", apps)
+    through = _model("Product", apps).category.through
+    lineage = CategoryLineage(apps)
+
+    product_categories = defaultdict(set)
+    for product_id, category_id in through.objects.values_list(
+        "product_id", "category_id"
+    ).iterator(chunk_size=batch_size):
+        product_categories[product_id] |= lineage.ancestors(category_id)
+
+    categories = {pk: zero_totals() for pk in lineage.parents}
+    for row in ProductStock.objects.values(
+        "product_id", *TOTAL_FIELDS
+    ).iterator(chunk_size=batch_size):
+        for category_id in product_categories.get(row["product_id"], ()):
+            for field in TOTAL_FIELDS:
+                categories[category_id][field] += row[field]
+
+    CategoryStock.objects.all().delete()
+    CategoryStock.objects.bulk_create(
+        (
+            CategoryStock(category_id=pk, **totals)
+            for pk, totals in categories.items()
+        ),
+        batch_size=batch_size,
+    )
+
+
+def rebuild_stock_aggregates(apps=global_apps):
+    with transaction.atomic():
+        rebuild_product_stock(apps)
+        rebuild_brand_stock(apps)
+        rebuild_supplier_stock(apps)
+        rebuild_category_stock(apps)
+    bump_version("inventory")
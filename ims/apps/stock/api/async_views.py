@@ -0,0 +1,136 @@
+from apps.stock.facets import facet_counts, facet_index
+from apps.stock.models import Category, Product
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+
+from .conditional import async_conditional_get
+from .filters import ProductFilter
+from .fragments import category_fragments, load_products, product_fragments
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
+from .serializer import ProductSerializer
+from .sparse import get_fieldset
+from .views import ProductByCategoryAPIView
+
+
+def render(data, status=200):
+    return HttpResponse(
+        ORJSONRenderer().render(data),
+        content_type="application/json",
+        status=status,
+    )
+
+
+class AsyncAPIView(View):
+    """
+    Base of the async counterparts of the product and category endpoints,
+    served through ``ims.asgi``: same payloads, but a slow client holds an
+    idle coroutine instead of a worker. Page queries run on the async ORM
+    and payloads come from the object cache; the few sync-only steps run
+    in a thread.
+
+    The Django request gets the ``query_params`` the shared pagination and
+    filter code reads, and API errors are rendered the way DRF does.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.query_params = request.GET
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return render(
+                exc.detail
+                if isinstance(exc.detail, (list, dict))
+                else {"detail": exc.detail},
+                status=exc.status_code,
+            )
+
+
+class AsyncProductPageMixin:
+    fragments = product_fragments
+
+    async def get_payloads(self, request, ids):
+        fieldset = get_fieldset(request, ProductSerializer)
+        if fieldset is None:
+            return await self.fragments.aget_many(ids)
+        return await sync_to_async(load_products)(ids, *fieldset)
+
+    async def page(self, request, queryset):
+        paginator = KeysetPagination()
+        rows = paginator.page_queryset(queryset, request)
+        rows = paginator.set_page([row async for row in rows.aiterator()])
+        payloads = await self.get_payloads(request, [row.pk for row in rows])
+        return paginator.get_paginated_response(
+            [payloads[row.pk] for row in rows if row.pk in payloads]
+        ).data
+
+
+class AsyncCategoryAPIView(AsyncAPIView):
+    """
+    Async variant of ``CategoryAPIView``
+    """
+
+    @async_conditional_get("category")
+    async def get(self, request):
+        ids = [
+            pk
+            async for pk in Category.objects.values_list(
+                "pk", flat=True
+            ).aiterator()
+        ]
+        payloads = await category_fragments.aget_many(ids)
+        return render([payloads[pk] for pk in ids if pk in payloads])
+
+
+class AsyncProductAPIView(AsyncProductPageMixin, AsyncAPIView):
+    """
+    Async variant of ``ProductAPIView``
+    """
+
+    @async_conditional_get(
+        "product",
+        "category",
+        "inventory",
+        "media",
+        indexes={"facets": facet_index},
+    )
+    async def get(self, request):
+        filterset = ProductFilter(
+            request.query_params, queryset=Product.objects.for_pages()
+        )
+        if not filterset.is_valid():
+            return render(filterset.errors, status=400)
+        # A category filter resolves its subtree while building the query.
+        queryset = await sync_to_async(lambda: filterset.qs)()
+        data = await self.page(request, queryset)
+        data.update(
+            await sync_to_async(facet_counts)(filterset.form.cleaned_data)
+        )
+        return render(data)
+
+
+class AsyncProductByCategoryAPIView(AsyncProductPageMixin, AsyncAPIView):
+    """
+    Async variant of ``ProductByCategoryAPIView``
+    """
+
+    @async_conditional_get("product", "category", "media")
+    async def get(self, request, slug):
+        view = ProductByCategoryAPIView(request=request, kwargs={"slug": slug})
+        queryset = await sync_to_async(view.get_queryset)()
+        return render(await self.page(request, queryset))
+
+
+class AsyncSingleProductAPIView(AsyncProductPageMixin, AsyncAPIView):
+    """
+    Async variant of ``SingleProductAPIView``
+    """
+
+    @async_conditional_get("product", "category", "media")
+    async def get(self, request, id):
+        data = (await self.get_payloads(request, [id])).get(id)
+        if data is None:
+            raise NotFound()
+        return render(data)
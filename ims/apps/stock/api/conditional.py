@@ -0,0 +1,124 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+
+from apps.stock.cache import get_versions, shared_versions
+from apps.stock.routers import read_current
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .sparse import expansion_versions
+
+
+def make_etag(request, names, versions):
+    key = "|".join(
+        [
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+        ]
+        + ["%s=%r" % (name, versions[name]) for name in names]
+    )
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_validators(request, names, indexes):
+    """
+    The versions of ``names`` and of the expansions of ``request``, and
+    the build time of each of the named ``ProcessIndex`` ``indexes``; a
+    response built from an index lags behind the versions it is built
+    from until the index is rebuilt.
+    """
+    versions = get_versions(*names, *expansion_versions(request))
+    for name, index in (indexes or {}).items():
+        versions["index:%s" % name] = index.version()
+    return versions
+
+
+def conditional_get(*names, indexes=None):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` on an API view method
+    from the version counters of the given models, and the build times of
+    the ``indexes`` it serves, before any query runs or anything is
+    serialized.
+
+    The validators come from the current versions, so the body is read
+    from the primary until the replicas caught up with the latest of them;
+    rows from a lagging replica would be revalidated under an ETag that
+    claims they are current. Without ``shared_versions()`` the view always
+    answers in full.
+    """
+
+    def versions(request):
+        if not hasattr(request, "_stock_versions"):
+            request._stock_versions = get_validators(request, names, indexes)
+        return request._stock_versions
+
+    def etag(request, *args, **kwargs):
+        found = versions(request)
+        return make_etag(request, sorted(found), found)
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(
+            max(versions(request).values()), tz=timezone.utc
+        )
+
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            with read_current(max(versions(request).values())):
+                return func(request, *args, **kwargs)
+
+        conditional = condition(
+            etag_func=etag, last_modified_func=last_modified
+        )(inner)
+
+        @functools.wraps(func)
+        def view(request, *args, **kwargs):
+            if not shared_versions():
+                # Validators from one process's versions would go on
+                # matching after another process's writes.
+                return func(request, *args, **kwargs)
+            return conditional(request, *args, **kwargs)
+
+        return view
+
+    return method_decorator(decorator)
+
+
+def async_conditional_get(*names, indexes=None):
+    """
+    ``conditional_get`` for the ``async def`` methods of async views, which
+    Django's ``condition`` decorator cannot wrap.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            if not shared_versions():
+                return await method(self, request, *args, **kwargs)
+            versions = await sync_to_async(get_validators)(
+                request, names, indexes
+            )
+            etag = quote_etag(make_etag(request, sorted(versions), versions))
+            last_modified = int(max(versions.values()))
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                with read_current(max(versions.values())):
+                    response = await method(self, request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(
+                        last_modified
+                    )
+                if not response.has_header("ETag"):
+                    response.headers["ETag"] = etag
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,53 @@
+import django_filters
+from apps.stock.models import Product, ProductInventory
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Product filters whose semantics match the facet counts of
+    ``apps.stock.facets``: a product matches a brand, supplier or price
+    range when any of its inventory items does.
+    """
+
+    brand = django_filters.NumberFilter(method="filter_items")
+    supplier = django_filters.NumberFilter(method="filter_items")
+    type = django_filters.NumberFilter(field_name="type")
+    category = django_filters.CharFilter(method="filter_category")
+    min_price = django_filters.NumberFilter(method="filter_price")
+    max_price = django_filters.NumberFilter(method="filter_price")
+    in_stock = django_filters.BooleanFilter(method="filter_in_stock")
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_items(self, queryset, name, value):
+        return self.with_items(queryset, **{name + "_id": value})
+
+    def filter_price(self, queryset, name, value):
+        # Both bounds must hold for the same item, so the range is applied
+        # once, by whichever bound comes last.
+        data = self.form.cleaned_data
+        if name == "min_price" and data.get("max_price") is not None:
+            return queryset
+        lookups = {}
+        if data.get("min_price") is not None:
+            lookups["price__gte"] = data["min_price"]
+        if data.get("max_price") is not None:
+            lookups["price__lte"] = data["max_price"]
+        return self.with_items(queryset, **lookups)
+
+    def with_items(self, queryset, **lookups):
+        return queryset.filter(
+            pk__in=ProductInventory.objects.filter(**lookups).values(
+                "product_id"
+            )
+        )
+
+    def filter_category(self, queryset, name, value):
+        return queryset.in_category(value, include_descendants=True)
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock__available__gt=0)
+        return queryset.exclude(stock__available__gt=0)
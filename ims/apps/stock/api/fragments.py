@@ -0,0 +1,180 @@
+from apps.stock.cache import ObjectCache
+from apps.stock.models import Category, Media, Product, ProductInventory
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .rows import RowSerializer
+from .serializer import (
+    CategorySerializer,
+    MediaSerializer,
+    ProductSerializer,
+    SKULookupSerializer,
+    rendition_urls,
+)
+from .sparse import get_fieldset, sparse_products
+
+product_rows = RowSerializer(
+    ProductSerializer,
+    {
+        "id": "id",
+        "name": "name",
+        "type": "type_id",
+        "slug": "slug",
+        "summary": "summary",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+        "content": "content",
+    },
+)
+category_rows = RowSerializer(
+    CategorySerializer,
+    {
+        "id": "id",
+        "name": "name",
+        "slug": "slug",
+        "is_active": "is_active",
+        "content": "content",
+        "parent": "parent_id",
+    },
+)
+media_rows = RowSerializer(
+    MediaSerializer,
+    {
+        "id": "id",
+        "product_inventory": "product_inventory_id",
+        "image": "image",
+        "alt_text": "alt_text",
+        "is_feature": "is_feature",
+    },
+    convert={
+        "image": lambda name: Media._meta.get_field("image").storage.url(name)
+    },
+)
+
+
+def load_products(ids, fields=None, expand=()):
+    """
+    ``{id: payload}`` of the products ``ids``, the same payloads as
+    ``ProductSerializer`` built from plain rows; ``fields`` and ``expand``
+    build a sparse or expanded payload with the serializer instead.
+    """
+    if fields is not None or expand:
+        products = list(
+            sparse_products(Product.objects.filter(pk__in=ids), fields, expand)
+        )
+        serializer = ProductSerializer(
+            products, many=True, fields=fields, expand=expand
+        )
+        # Payloads need not carry their id.
+        return {
+            product.pk: dict(payload)
+            for product, payload in zip(products, serializer.data)
+        }
+
+    payloads, featured = {}, {}
+    rows = product_rows.rows(
+        Product.objects.filter(pk__in=ids).with_featured_image(),
+        "featured_image_id",
+    )
+    for payload, (featured_image_id,) in rows:
+        payload["category"] = []
+        payloads[payload["id"]] = payload
+        if featured_image_id is not None:
+            featured[featured_image_id] = payload
+    # In the order of the prefetch the serializer reads.
+    for product_id, category_id in Category.objects.filter(
+        category__in=payloads
+    ).values_list("category", "pk"):
+        payloads[product_id]["category"].append(category_id)
+    for media, (renditions,) in media_rows.rows(
+        Media.objects.filter(pk__in=featured), "renditions"
+    ):
+        media["renditions"] = rendition_urls(media["id"], renditions)
+        featured[media["id"]]["featured_image"] = media
+    return payloads
+
+
+def load_categories(ids):
+    return {
+        payload["id"]: payload
+        for payload, _ in category_rows.rows(
+            Category.objects.filter(pk__in=ids)
+        )
+    }
+
+
+def load_skus(skus):
+    return {
+        item.sku: dict(SKULookupSerializer(item).data)
+        for item in ProductInventory.objects.select_related(
+            "product", "brand", "supplier"
+        ).filter(sku__in=skus)
+    }
+
+
+def sku_tags(sku, payload):
+    return [
+        "%s:%s" % (name, payload[name]["id"])
+        for name in ("product", "brand", "supplier")
+    ]
+
+
+product_fragments = ObjectCache(
+    "product", load_products, "STOCK_OBJECT_CACHE_TIMEOUT"
+)
+category_fragments = ObjectCache(
+    "category", load_categories, "STOCK_OBJECT_CACHE_TIMEOUT"
+)
+sku_fragments = ObjectCache(
+    "sku", load_skus, "STOCK_SKU_CACHE_TIMEOUT", tags=sku_tags
+)
+
+
+class FragmentMixin:
+    """
+    Payloads come from the cached ``fragments``, unless the request picks
+    its own ``?fields=`` or ``?expand=`` and the view has a
+    ``load_fieldset(ids, fields, expand)``: those are built for it with a
+    query trimmed to match, and are not cached.
+    """
+
+    fragments = None
+    load_fieldset = None
+
+    def get_payloads(self, ids):
+        fieldset = None
+        if self.load_fieldset is not None:
+            fieldset = get_fieldset(self.request, self.get_serializer_class())
+        if fieldset is None:
+            return self.fragments.get_many(ids)
+        return self.load_fieldset(ids, *fieldset)
+
+
+class FragmentListModelMixin(FragmentMixin):
+    """
+    List a queryset that only loads what pagination needs, and fill the
+    page from the cached payloads of ``fragments``.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        payloads = self.get_payloads([row.pk for row in rows])
+        data = [payloads[row.pk] for row in rows if row.pk in payloads]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class FragmentRetrieveModelMixin(FragmentMixin):
+    """
+    Retrieve one object's payload from ``fragments`` by its URL id.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        data = self.get_payloads([pk]).get(pk)
+        if data is None:
+            raise NotFound()
+        return Response(data)
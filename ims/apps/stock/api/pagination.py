@@ -0,0 +1,173 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique ``(column, id)`` ordering.
+
+    Every page is fetched with a ``WHERE (column, id) > (x, y) LIMIT n``
+    style query, so no ``COUNT(*)`` or ``OFFSET`` is ever issued and deep
+    pages cost the same as the first one.
+    """
+
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    orderings = {
+        "created": "created_at",
+        "name": "name",
+    }
+    default_ordering = "created"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """
+        The query for the page asked for, one row longer to tell whether
+        another page follows; async views evaluate it themselves and hand
+        the rows to ``set_page``.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        field = self.orderings[self.ordering.lstrip("-")]
+        descending = self.ordering.startswith("-") != self.reverse
+        order_by = ("-%s" if descending else "%s") % field
+        id_order_by = "-id" if descending else "id"
+        queryset = queryset.order_by(order_by, id_order_by)
+
+        if self.position is not None:
+            value, pk = self.position
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{"%s__%s" % (field, lookup): value})
+                | Q(**{field: value, "id__%s" % lookup: pk})
+            )
+        self.field = field
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, rows):
+        has_following = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(
+            self.ordering_query_param, self.default_ordering
+        )
+        if ordering.lstrip("-") not in self.orderings:
+            return self.default_ordering
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            padding = "=" * (-len(encoded) % 4)
+            data = json.loads(urlsafe_b64decode(encoded + padding))
+            value, pk = data["p"]
+            reverse = bool(data.get("r", False))
+            pk = int(pk)
+            if not isinstance(value, str):
+                raise TypeError
+            if data["o"] != self.ordering:
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if self.orderings[self.ordering.lstrip("-")] == "created_at":
+            value = parse_datetime(value) if value else None
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field)
+        if self.field == "created_at":
+            value = value.isoformat()
+        data = {"o": self.ordering, "p": [value, instance.pk]}
+        if reverse:
+            data["r"] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(data, separators=(",", ":")).encode()
+        )
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, encoded.decode().rstrip("=")
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+class ReorderAlertPagination(KeysetPagination):
+    orderings = {
+        "created": "created_at",
+    }
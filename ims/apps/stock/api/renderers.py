@@ -0,0 +1,58 @@
+import re
+
+import orjson
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    # Dates, decimals and the rest go through DRF's encoder, so they come
+    # out exactly as ``JSONRenderer`` writes them.
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+# Floats that orjson writes differently from ``repr()``: exponents
+# (``1e16`` for ``1e+16``, ``1e-7`` for ``1e-07``) and small fractions
+# (``0.00001`` for ``1e-05``). A match inside a string is harmless; it
+# only sends that payload down the slow path.
+DIFFERING_FLOAT = re.compile(
+    rb"[:,\[]-?(?:\d+(?:\.\d+)?e-?\d+|0\.0000\d*)(?=[,}\]])"
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` output, byte for byte, encoded by orjson. Only the
+    compact form is sped up; indented output, and data orjson cannot
+    encode the same way (such as integers beyond 64 bits or floats it
+    formats differently), is left to ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (
+            not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=JSONEncoder().default, option=OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if DIFFERING_FLOAT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            # As JSONRenderer, keep the output a strict JavaScript subset.
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
+
+
+FAST_RENDERERS = [ORJSONRenderer, BrowsableAPIRenderer]
@@ -0,0 +1,51 @@
+from functools import cached_property
+
+from rest_framework.relations import RelatedField
+
+
+class RowSerializer:
+    """
+    The payloads of ``serializer_class`` built straight from
+    ``values_list()`` rows, without a serializer per object.
+
+    ``columns`` maps the plain fields to their columns; the
+    ``to_representation`` of each is looked up once, and related fields
+    keep the primary key as it is, which is what their serializer field
+    outputs. ``convert`` overrides the conversion of a field. The other
+    fields are left ``None`` in their serializer position for the caller
+    to fill in.
+    """
+
+    def __init__(self, serializer_class, columns, convert=None):
+        self.serializer_class = serializer_class
+        self.columns = columns
+        self.convert = convert or {}
+
+    @cached_property
+    def plan(self):
+        fields = self.serializer_class().fields
+        converters = []
+        for name in self.columns:
+            if name in self.convert:
+                converter = self.convert[name]
+            elif isinstance(fields[name], RelatedField):
+                converter = None
+            else:
+                converter = fields[name].to_representation
+            converters.append((name, converter))
+        return list(fields), converters
+
+    def rows(self, queryset, *extra):
+        """
+        ``(payload, extra values)`` for every row of ``queryset``, with
+        the ``extra`` columns read alongside.
+        """
+        names, converters = self.plan
+        size = len(converters)
+        for row in queryset.values_list(*self.columns.values(), *extra):
+            payload = dict.fromkeys(names)
+            for (name, convert), value in zip(converters, row):
+                if value is not None and convert is not None:
+                    value = convert(value)
+                payload[name] = value
+            yield payload, row[size:]
@@ -2,12 +2,18 @@ from apps.stock.models import (
     Address,
     Brand,
     Category,
+    CategoryStock,
     Media,
     Product,
     ProductInventory,
+    ProductStock,
     ProductType,
+    ReorderAlert,
+    StockMovement,
     Supplier,
 )
+from apps.stock.renditions import rendition_keys
+from django.urls import reverse
 from rest_framework import serializers
 
 
@@ -28,11 +34,47 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    Load the featured images of a whole page of products in one query.
+    """
+
+    def to_representation(self, data):
+        products = list(data.all() if hasattr(data, "all") else data)
+        if "featured_image" in self.child.fields:
+            featured = Media.objects.in_bulk(
+                {product.featured_image_id for product in products} - {None}
+            )
+            for product in products:
+                product.featured_image = featured.get(
+                    product.featured_image_id
+                )
+        return super().to_representation(products)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """
-    Serializer for Product model
+    Serializer for Product model; querysets come from
+    ``Product.objects.for_serializer()``, or from
+    ``apps.stock.api.sparse.sparse_products()`` for the ``fields`` and
+    ``expand`` picked by a request
     """
 
+    featured_image = serializers.SerializerMethodField()
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand:
+            self.fields["inventory"] = InventorySerializer(
+                source="product_inventory",
+                many=True,
+                read_only=True,
+                expand=expand,
+            )
+
     class Meta:
         model = Product
         fields = [
@@ -45,4 +87,234 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
             "content",
+            "featured_image",
+        ]
+        list_serializer_class = ProductListSerializer
+
+    def get_featured_image(self, product):
+        if not hasattr(product, "featured_image"):
+            product.featured_image = Media.objects.filter(
+                pk=product.featured_image_id
+            ).first()
+        if product.featured_image is None:
+            return None
+        return MediaSerializer(product.featured_image).data
+
+
+class InventorySerializer(serializers.ModelSerializer):
+    """
+    Serializer for ProductInventory model as expanded into a product, with
+    its brand, supplier and media inlined when those are expanded too
+    """
+
+    class Meta:
+        model = ProductInventory
+        fields = [
+            "id",
+            "sku",
+            "brand",
+            "supplier",
+            "mrp",
+            "price",
+            "discount",
+            "quantity",
+            "sold",
+            "available",
+            "defective",
         ]
+
+    def __init__(self, *args, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in ("brand", "supplier"):
+            if name in expand:
+                self.fields[name] = serializers.SerializerMethodField()
+        if "media" in expand:
+            self.fields["media"] = MediaSerializer(
+                source="media_product_inventory", many=True, read_only=True
+            )
+
+    def get_brand(self, item):
+        return {"id": item.brand_id, "name": item.brand.name}
+
+    def get_supplier(self, item):
+        return {"id": item.supplier_id, "name": item.supplier.name}
+
+
+class InventoryRecordSerializer(serializers.Serializer):
+    """
+    One row of a bulk inventory upload, keyed by ``sku``.
+
+    Related objects are given as plain ids and checked for the whole batch
+    at once by ``apps.stock.inventory.upsert_inventory``.
+    """
+
+    sku = serializers.CharField(max_length=100)
+    product = serializers.IntegerField(required=False)
+    brand = serializers.IntegerField(required=False)
+    supplier = serializers.IntegerField(required=False)
+    mrp = serializers.FloatField(required=False)
+    price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    discount = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    sold = serializers.IntegerField(min_value=0, required=False)
+    available = serializers.IntegerField(min_value=0, required=False)
+    defective = serializers.IntegerField(required=False)
+    reorder_level = serializers.IntegerField(
+        min_value=0, allow_null=True, required=False
+    )
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    """
+    Serializer for StockMovement model
+    """
+
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = StockMovement
+        fields = [
+            "id",
+            "product_inventory",
+            "kind",
+            "quantity",
+            "note",
+            "created_at",
+        ]
+        read_only_fields = ["product_inventory"]
+
+
+class ProductStockSerializer(serializers.ModelSerializer):
+    """
+    Serializer for ProductStock model
+    """
+
+    class Meta:
+        model = ProductStock
+        fields = [
+            "product",
+            "quantity",
+            "sold",
+            "available",
+            "defective",
+            "stock_value",
+        ]
+
+
+class CategoryStockSerializer(serializers.ModelSerializer):
+    """
+    Serializer for CategoryStock model
+    """
+
+    class Meta:
+        model = CategoryStock
+        fields = [
+            "category",
+            "quantity",
+            "sold",
+            "available",
+            "defective",
+            "stock_value",
+        ]
+
+
+class ReorderAlertSerializer(serializers.ModelSerializer):
+    """
+    Serializer for ReorderAlert model
+    """
+
+    sku = serializers.CharField(source="product_inventory.sku")
+
+    class Meta:
+        model = ReorderAlert
+        fields = [
+            "id",
+            "product_inventory",
+            "sku",
+            "available",
+            "threshold",
+            "created_at",
+        ]
+
+
+class SKULookupSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one ProductInventory row with its product, brand and
+    supplier inlined, as a scanner needs it
+    """
+
+    product = serializers.SerializerMethodField()
+    brand = serializers.SerializerMethodField()
+    supplier = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductInventory
+        fields = [
+            "id",
+            "sku",
+            "product",
+            "brand",
+            "supplier",
+            "mrp",
+            "price",
+            "discount",
+            "quantity",
+            "sold",
+            "available",
+            "defective",
+            "needs_reorder",
+        ]
+
+    def get_product(self, item):
+        return {
+            "id": item.product_id,
+            "name": item.product.name,
+            "slug": item.product.slug,
+            "type": item.product.type_id,
+        }
+
+    def get_brand(self, item):
+        return {"id": item.brand_id, "name": item.brand.name}
+
+    def get_supplier(self, item):
+        return {"id": item.supplier_id, "name": item.supplier.name}
+
+
+class MediaSerializer(serializers.ModelSerializer):
+    """
+    Serializer for Media model, with the URL of every rendition; those not
+    rendered yet point at the view that renders them on first request
+    """
+
+    renditions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Media
+        fields = [
+            "id",
+            "product_inventory",
+            "image",
+            "alt_text",
+            "is_feature",
+            "renditions",
+        ]
+
+    def get_renditions(self, media):
+        return rendition_urls(media.pk, media.renditions)
+
+
+def rendition_urls(pk, renditions):
+    """
+    ``{key: URL}`` of every rendition of the ``Media`` ``pk``.
+    """
+    storage = Media._meta.get_field("image").storage
+    return {
+        key: storage.url(renditions[key])
+        if key in renditions
+        else reverse("media_rendition", args=[pk, key])
+        for key in rendition_keys()
+    }
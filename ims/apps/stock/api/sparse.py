@@ -0,0 +1,102 @@
+from apps.stock.models import Category, Media, ProductInventory
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+
+# What each ``?expand=`` adds to a product, with the versions it is built
+# from; brand, supplier and media are inlined into the inventory items.
+EXPANSIONS = {
+    "inventory": ("sku", "inventory"),
+    "media": ("sku", "inventory", "media"),
+    "brand": ("sku", "inventory", "brand"),
+    "supplier": ("sku", "inventory", "supplier"),
+}
+PRODUCT_COLUMNS = (
+    "name",
+    "type",
+    "slug",
+    "summary",
+    "created_at",
+    "updated_at",
+    "content",
+)
+
+
+def split_param(request, name):
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    return list(dict.fromkeys(part for part in value.split(",") if part))
+
+
+def get_fieldset(request, serializer_class):
+    """
+    The ``(fields, expand)`` picked with ``?fields=`` and ``?expand=``,
+    or ``None`` when the request asks for the default representation.
+    ``fields`` is ``None`` when only expansions were asked for.
+    """
+    fields = split_param(request, "fields")
+    expand = split_param(request, "expand")
+    if fields is None and not expand:
+        return None
+    errors = {}
+    if fields is not None:
+        unknown = set(fields) - set(serializer_class.Meta.fields)
+        if unknown:
+            errors["fields"] = "Unknown fields: %s." % ", ".join(
+                sorted(unknown)
+            )
+        elif not fields:
+            errors["fields"] = "Pick at least one field."
+    unknown = set(expand or ()) - set(EXPANSIONS)
+    if unknown:
+        errors["expand"] = "Unknown expansions: %s." % ", ".join(
+            sorted(unknown)
+        )
+    if errors:
+        raise ValidationError(errors)
+    return fields, tuple(expand or ())
+
+
+def expansion_versions(request):
+    """
+    The versions the expansions of ``request`` are built from, for the
+    conditional GET of a view that allows them.
+    """
+    names = []
+    for name in split_param(request, "expand") or ():
+        names.extend(EXPANSIONS.get(name, ()))
+    return tuple(dict.fromkeys(names))
+
+
+def sparse_products(queryset, fields, expand):
+    """
+    ``queryset`` trimmed to the columns of ``fields`` (every field when
+    ``None``), with only the prefetches ``fields`` and ``expand`` need.
+    """
+    if fields is None:
+        fields = PRODUCT_COLUMNS + ("category", "featured_image")
+    queryset = queryset.only(
+        "id", *(name for name in fields if name in PRODUCT_COLUMNS)
+    )
+    if "category" in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch("category", queryset=Category.objects.only("id"))
+        )
+    if "featured_image" in fields:
+        queryset = queryset.with_featured_image()
+    if expand:
+        items = ProductInventory.objects.order_by("pk")
+        related = [name for name in ("brand", "supplier") if name in expand]
+        if related:
+            items = items.select_related(*related)
+        if "media" in expand:
+            items = items.prefetch_related(
+                Prefetch(
+                    "media_product_inventory",
+                    queryset=Media.objects.order_by("-is_feature", "pk"),
+                )
+            )
+        queryset = queryset.prefetch_related(
+            Prefetch("product_inventory", queryset=items)
+        )
+    return queryset
@@ -1,18 +1,93 @@
 from django.urls import include, path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("", views.ProductAPIView.as_view(), name="products_api"),
     path("category/", views.CategoryAPIView.as_view(), name="categories_api"),
+    path(
+        "tree/",
+        views.CategoryTreeAPIView.as_view(),
+        name="category_tree_api",
+    ),
     path(
         "category/<slug:slug>/",
         views.ProductByCategoryAPIView.as_view(),
         name="category_api",
     ),
     path(
-        "p/<str:id>/",
+        "async/",
+        async_views.AsyncProductAPIView.as_view(),
+        name="async_products_api",
+    ),
+    path(
+        "async/category/",
+        async_views.AsyncCategoryAPIView.as_view(),
+        name="async_categories_api",
+    ),
+    path(
+        "async/category/<slug:slug>/",
+        async_views.AsyncProductByCategoryAPIView.as_view(),
+        name="async_category_api",
+    ),
+    path(
+        "async/p/<int:id>/",
+        async_views.AsyncSingleProductAPIView.as_view(),
+        name="async_product_api",
+    ),
+    path(
+        "inventory/bulk/",
+        views.InventoryBulkAPIView.as_view(),
+        name="inventory_bulk_api",
+    ),
+    path(
+        "inventory/<int:id>/movements/",
+        views.StockMovementAPIView.as_view(),
+        name="stock_movement_api",
+    ),
+    path(
+        "inventory/<int:id>/media/",
+        views.InventoryMediaAPIView.as_view(),
+        name="inventory_media_api",
+    ),
+    path(
+        "inventory/<int:id>/stock/",
+        views.StockLevelAPIView.as_view(),
+        name="stock_level_api",
+    ),
+    path(
+        "sku/<str:sku>/",
+        views.SKULookupAPIView.as_view(),
+        name="sku_api",
+    ),
+    path(
+        "autocomplete/",
+        views.AutocompleteAPIView.as_view(),
+        name="autocomplete_api",
+    ),
+    path(
+        "search/",
+        views.ProductSearchAPIView.as_view(),
+        name="product_search_api",
+    ),
+    path(
+        "reorder-alerts/",
+        views.ReorderAlertAPIView.as_view(),
+        name="reorder_alerts_api",
+    ),
+    path(
+        "p/<int:id>/",
         views.SingleProductAPIView.as_view(),
         name="product_api",
     ),
+    path(
+        "p/<int:id>/stock/",
+        views.ProductStockAPIView.as_view(),
+        name="product_stock_api",
+    ),
+    path(
+        "category/<int:id>/stock/",
+        views.CategoryStockAPIView.as_view(),
+        name="category_stock_api",
+    ),
 ]
@@ -1,56 +1,398 @@
-from apps.stock.models import Category, Product
-from rest_framework import generics, mixins
+from apps.stock.autocomplete import autocomplete
+from apps.stock.cache import get_category_tree_json
+from apps.stock.counters import buffer_sale, stock_levels
+from apps.stock.facets import facet_counts, facet_index
+from apps.stock.inventory import (
+    INVALID,
+    InsufficientStock,
+    apply_movement,
+    upsert_inventory,
+)
+from apps.stock.models import (
+    Category,
+    CategoryStock,
+    Media,
+    Product,
+    ProductInventory,
+    ProductStock,
+    ReorderAlert,
+    StockMovement,
+)
+from apps.stock.search import search_products
+from django.http import HttpResponse
+from rest_framework import generics, mixins, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .serializer import CategorySerializer, ProductSerializer
+from .conditional import conditional_get
+from .filters import ProductFilter
+from .fragments import (
+    FragmentListModelMixin,
+    FragmentMixin,
+    FragmentRetrieveModelMixin,
+    category_fragments,
+    load_products,
+    product_fragments,
+    sku_fragments,
+)
+from .pagination import KeysetPagination, ReorderAlertPagination
+from .renderers import FAST_RENDERERS
+from .serializer import (
+    CategorySerializer,
+    CategoryStockSerializer,
+    InventoryRecordSerializer,
+    MediaSerializer,
+    ProductSerializer,
+    ProductStockSerializer,
+    ReorderAlertSerializer,
+    StockMovementSerializer,
+)
 
 
-class CategoryAPIView(generics.GenericAPIView, mixins.ListModelMixin):
+class CategoryAPIView(generics.GenericAPIView, FragmentListModelMixin):
     """
     API endpoint that returns all Categories
     """
 
-    queryset = Category.objects.c
+    queryset = Category.objects.only("id")
+    renderer_classes = FAST_RENDERERS
     serializer_class = CategorySerializer
+    fragments = category_fragments
 
+    @conditional_get("category")
     def get(self, request):
         return self.list(request)
 
 
-class ProductByCategoryAPIView(APIView):
+class CategoryTreeAPIView(APIView):
     """
-    Return product by category
+    API endpoint that returns every Category nested under its parent.
+
+    The rendered tree is cached and dropped whenever a Category is saved,
+    deleted or moved, so most requests never reach the database.
+    """
+
+    @conditional_get("category")
+    def get(self, request):
+        return HttpResponse(
+            get_category_tree_json(), content_type="application/json"
+        )
+
+
+class ProductByCategoryAPIView(
+    generics.GenericAPIView, FragmentListModelMixin
+):
+    """
+    Return product by category, one keyset page at a time.
+
+    Pass ``?include_descendants=true`` to also return products attached to
+    any child category.
     """
 
+    renderer_classes = FAST_RENDERERS
+    serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    fragments = product_fragments
+    load_fieldset = staticmethod(load_products)
+
+    def get_queryset(self):
+        include_descendants = self.request.query_params.get(
+            "include_descendants", ""
+        ).lower() in ("1", "true", "yes")
+        return Product.objects.in_category(
+            self.kwargs["slug"], include_descendants
+        ).for_pages()
+
+    @conditional_get("product", "category", "media")
     def get(self, request, slug=None):
-        queryset = Product.objects.filter(category__slug=slug)
-        serializer = ProductSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
 
-class ProductAPIView(generics.GenericAPIView, mixins.ListModelMixin):
+class ProductAPIView(generics.GenericAPIView, FragmentListModelMixin):
     """
-    API endpoint that returns all products
+    API endpoint that returns the filtered products, one keyset page at a
+    time, with the match count and facet counts of the whole result
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_pages()
+    renderer_classes = FAST_RENDERERS
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    fragments = product_fragments
+    load_fieldset = staticmethod(load_products)
+
+    def get_filterset(self):
+        filterset = ProductFilter(
+            self.request.query_params, queryset=super().get_queryset()
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return filterset
+
+    def get_queryset(self):
+        return self.filterset.qs
 
+    @conditional_get(
+        "product",
+        "category",
+        "inventory",
+        "media",
+        indexes={"facets": facet_index},
+    )
     def get(self, request):
-        return self.list(request)
+        self.filterset = self.get_filterset()
+        response = self.list(request)
+        response.data.update(facet_counts(self.filterset.form.cleaned_data))
+        return response
 
 
 class SingleProductAPIView(
     generics.GenericAPIView,
-    mixins.RetrieveModelMixin,
+    FragmentRetrieveModelMixin,
 ):
     """
     API endpoint that returns single product
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_serializer()
     serializer_class = ProductSerializer
+    lookup_url_kwarg = "id"
+    fragments = product_fragments
+    load_fieldset = staticmethod(load_products)
+
+    @conditional_get("product", "category", "media")
+    def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+
+class InventoryBulkAPIView(APIView):
+    """
+    API endpoint that creates or updates a batch of inventory rows keyed by
+    ``sku`` and reports the outcome of every row.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    max_records = 10000
+
+    def post(self, request):
+        records = request.data
+        if not isinstance(records, list):
+            raise ValidationError("Expected a list of inventory records.")
+        if len(records) > self.max_records:
+            raise ValidationError(
+                "At most %d records can be sent at once." % self.max_records
+            )
+
+        field = InventoryRecordSerializer()
+        results = [None] * len(records)
+        rows, positions = [], []
+        for index, record in enumerate(records):
+            try:
+                rows.append(field.run_validation(record))
+            except ValidationError as exc:
+                results[index] = (INVALID, exc.detail)
+            else:
+                positions.append(index)
+
+        for index, result in zip(positions, upsert_inventory(rows)):
+            results[index] = result
+
+        payload = [
+            {
+                "sku": record.get("sku") if isinstance(record, dict) else None,
+                "status": result,
+                "errors": errors,
+            }
+            for record, (result, errors) in zip(records, results)
+        ]
+        counts = {}
+        for row in payload:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return Response({"counts": counts, "results": payload})
+
+
+class SKULookupAPIView(APIView):
+    """
+    API endpoint that returns the inventory item with a given SKU, with its
+    product, brand and supplier, from one joined query on the unique SKU
+    index.
+
+    Lookups are cached for ``STOCK_SKU_CACHE_TIMEOUT`` seconds; writes to the
+    item drop its entry, and changes to its product, brand or supplier
+    retire it through their tags.
+    """
+
+    def get(self, request, sku):
+        data = sku_fragments.get(sku)
+        if data is None:
+            raise NotFound()
+        return Response(data)
+
+
+class InventoryMediaAPIView(generics.GenericAPIView, mixins.ListModelMixin):
+    """
+    API endpoint that returns the images of an inventory item with their
+    renditions, featured image first
+    """
+
+    serializer_class = MediaSerializer
+
+    def get_queryset(self):
+        return Media.objects.filter(
+            product_inventory_id=self.kwargs["id"]
+        ).order_by("-is_feature", "pk")
+
+    def get(self, request, id):
+        return self.list(request)
+
+
+class StockMovementAPIView(APIView):
+    """
+    API endpoint that receives, sells, returns or writes off stock of one
+    inventory item and records the movement in the ledger.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, id):
+        serializer = StockMovementSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            movement = apply_movement(id, **serializer.validated_data)
+        except ProductInventory.DoesNotExist:
+            raise NotFound()
+        except InsufficientStock as exc:
+            return Response(
+                {"detail": str(exc)}, status=status.HTTP_409_CONFLICT
+            )
+        return Response(
+            StockMovementSerializer(movement).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class StockLevelAPIView(APIView):
+    """
+    API endpoint for hot SKUs: sales posted here are buffered and flushed
+    to the inventory row in batches, and reads include the pending sales.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, id):
+        levels = stock_levels([id])
+        if id not in levels:
+            raise NotFound()
+        return Response(dict(levels[id], id=id))
+
+    def post(self, request, id):
+        serializer = StockMovementSerializer(
+            data={
+                "kind": StockMovement.SELL,
+                "quantity": request.data.get("quantity"),
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            pending = buffer_sale(id, serializer.validated_data["quantity"])
+        except ProductInventory.DoesNotExist:
+            raise NotFound()
+        except InsufficientStock as exc:
+            return Response(
+                {"detail": str(exc)}, status=status.HTTP_409_CONFLICT
+            )
+        return Response(
+            {"id": id, "pending": pending}, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class ProductStockAPIView(generics.GenericAPIView, mixins.RetrieveModelMixin):
+    """
+    API endpoint that returns the stock totals of a product
+    """
+
+    queryset = ProductStock.objects.all()
+    serializer_class = ProductStockSerializer
+    lookup_url_kwarg = "id"
 
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
+
+
+class CategoryStockAPIView(generics.GenericAPIView, mixins.RetrieveModelMixin):
+    """
+    API endpoint that returns the stock totals of a category subtree
+    """
+
+    queryset = CategoryStock.objects.all()
+    serializer_class = CategoryStockSerializer
+    lookup_url_kwarg = "id"
+
+    def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+
+class ReorderAlertAPIView(generics.GenericAPIView, mixins.ListModelMixin):
+    """
+    API endpoint that returns the open reorder alerts, oldest first
+    """
+
+    queryset = ReorderAlert.objects.filter(
+        resolved_at__isnull=True
+    ).select_related("product_inventory")
+    serializer_class = ReorderAlertSerializer
+    pagination_class = ReorderAlertPagination
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return self.list(request)
+
+
+class ProductSearchAPIView(generics.GenericAPIView, FragmentMixin):
+    """
+    API endpoint that returns the products matching ``?q=``, best match
+    first, from the full-text index
+    """
+
+    serializer_class = ProductSerializer
+    fragments = product_fragments
+    load_fieldset = staticmethod(load_products)
+    default_limit = 20
+    max_limit = 100
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params["limit"])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request):
+        ids = search_products(
+            request.query_params.get("q", ""), self.get_limit()
+        )
+        products = self.get_payloads(ids)
+        return Response(
+            {"results": [products[pk] for pk in ids if pk in products]}
+        )
+
+
+class AutocompleteAPIView(APIView):
+    """
+    API endpoint that completes a typed prefix of a product name or SKU
+    from the in-process prefix index, without touching the database
+    """
+
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+        return Response(
+            {"results": autocomplete(request.query_params.get("q", ""), limit)}
+        )
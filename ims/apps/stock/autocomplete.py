@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_left
+
+from .cache import ProcessIndex
+from .models import Product, ProductInventory
+
+AUTOCOMPLETE_SOURCES = ("product", "sku")
+PRODUCT = 0
+SKU = 1
+
+
+class PrefixIndex:
+    """
+    Sorted lowercase keys with parallel ``(kind, id)`` arrays, searched with
+    ``bisect``. Every word of a product name is a key of its own, so
+    "pix" finds "Google Pixel 7".
+    """
+
+    def __init__(self, products, skus):
+        entries = []
+        self.names = {}
+        for pk, name in products:
+            self.names[pk] = name
+            words = name.lower().split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), PRODUCT, pk))
+        self.skus = {}
+        for pk, sku, product_id in skus:
+            self.skus[pk] = (sku, product_id)
+            entries.append((sku.lower(), SKU, pk))
+        entries.sort()
+
+        self.keys = [key for key, _, _ in entries]
+        self.kinds = array("b", (kind for _, kind, _ in entries))
+        self.ids = array("q", (pk for _, _, pk in entries))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=10):
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        results, seen = [], set()
+        index = bisect_left(self.keys, prefix)
+        while (
+            index < len(self.keys)
+            and self.keys[index].startswith(prefix)
+            and len(results) < limit
+        ):
+            match = (self.kinds[index], self.ids[index])
+            if match not in seen:
+                seen.add(match)
+                results.append(self.describe(*match))
+            index += 1
+        return results
+
+    def describe(self, kind, pk):
+        if kind == PRODUCT:
+            return {"type": "product", "id": pk, "label": self.names[pk]}
+        sku, product_id = self.skus[pk]
+        return {"type": "sku", "id": pk, "product": product_id, "label": sku}
+
+
+def build_prefix_index():
+    return PrefixIndex(
+        Product.objects.values_list("pk", "name").iterator(chunk_size=5000),
+        ProductInventory.objects.values_list(
+            "pk", "sku", "product_id"
+        ).iterator(chunk_size=5000),
+    )
+
+
+autocomplete_index = ProcessIndex(
+    build_prefix_index,
+    AUTOCOMPLETE_SOURCES,
+    "STOCK_AUTOCOMPLETE_MAX_STALENESS",
+)
+
+
+def autocomplete(prefix, limit=10):
+    return autocomplete_index.get().search(prefix, limit)
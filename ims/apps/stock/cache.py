@@ -0,0 +1,318 @@
+import threading
+import time
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.renderers import JSONRenderer
+
+from .models import Category
+from .routers import read_current, replicas_caught_up
+
+CATEGORY_TREE_KEY = "stock:category-tree"
+VERSION_KEY = "stock:version:%s"
+OBJECT_KEY = "stock:object:%s:%s"
+
+CATEGORY_TREE_FIELDS = (
+    "id",
+    "name",
+    "slug",
+    "is_active",
+    "content",
+    "parent",
+)
+
+
+def build_category_tree():
+    """
+    Nest every category under its parent.
+
+    Rows come back in ``(tree_id, lft)`` order, so a parent is always seen
+    before its children and the tree is assembled in one linear pass.
+    """
+    roots = []
+    nodes = {}
+    rows = Category.objects.order_by("tree_id", "lft").values_list(
+        "id", "name", "slug", "is_active", "content", "parent_id"
+    )
+    for row in rows:
+        node = dict(zip(CATEGORY_TREE_FIELDS, row))
+        node["children"] = []
+        nodes[node["id"]] = node
+        if node["parent"] is None:
+            roots.append(node)
+        else:
+            nodes[node["parent"]]["children"].append(node)
+    return roots
+
+
+def shared_versions():
+    """
+    Whether every process serving the site sees the same versions: the
+    default cache is shared, or ``STOCK_SINGLE_PROCESS`` says there is
+    only one process.
+    """
+    return settings.STOCK_SINGLE_PROCESS or not isinstance(
+        caches[DEFAULT_CACHE_ALIAS], LocMemCache
+    )
+
+
+def get_category_tree_json():
+    """
+    The rendered category tree, served from the cache when possible.
+    """
+    if not shared_versions():
+        # Other processes could not delete this process's copy.
+        return JSONRenderer().render(build_category_tree())
+    tree = cache.get(CATEGORY_TREE_KEY)
+    if tree is None:
+        with read_current(get_versions("category")["category"]):
+            tree = JSONRenderer().render(build_category_tree())
+        cache.set(CATEGORY_TREE_KEY, tree, timeout=None)
+    return tree
+
+
+def invalidate_category_tree():
+    cache.delete(CATEGORY_TREE_KEY)
+
+
+def object_key(name, pk):
+    # SKUs may hold spaces and other characters memcached keys cannot.
+    return OBJECT_KEY % (name, quote(str(pk), safe=""))
+
+
+def invalidate_skus(skus):
+    cache.delete_many([object_key("sku", sku) for sku in skus])
+
+
+def get_versions(*names):
+    """
+    The current version of each named model, as a change timestamp.
+
+    A version that fell out of the cache is restarted at the current time,
+    which can only make clients refetch, never serve them stale data. For
+    the same reason, versions a per-process cache cannot share are always
+    the current time.
+    """
+    if not shared_versions():
+        return dict.fromkeys(names, time.time())
+    keys = {VERSION_KEY % name: name for name in names}
+    versions = cache.get_many(keys)
+    now = time.time()
+    for key in keys.keys() - versions.keys():
+        cache.add(key, now, timeout=None)
+        versions[key] = cache.get(key, now)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_version(name):
+    cache.set(VERSION_KEY % name, time.time(), timeout=None)
+
+
+def tag_versions(tags):
+    """
+    Like ``get_versions`` for the tags of ``ObjectCache`` payloads, in two
+    round trips however many tags are missing; a restart raced by another
+    process only retires a few payloads early.
+    """
+    if not shared_versions():
+        return dict.fromkeys(tags, time.time())
+    keys = {VERSION_KEY % tag: tag for tag in tags}
+    versions = cache.get_many(list(keys))
+    missing = {key: time.time() for key in keys.keys() - versions.keys()}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(tags):
+    """
+    Retire every ``ObjectCache`` payload built under one of ``tags``.
+    """
+    now = time.time()
+    cache.set_many({VERSION_KEY % tag: now for tag in tags}, timeout=None)
+
+
+class ObjectCache:
+    """
+    Serialized payloads of one kind of object, one cache entry each.
+
+    ``load(ids)`` builds ``{id: payload}`` for the ids missing from the
+    cache, and ``tags(id, payload)`` names what else a payload was built
+    from, e.g. ``["brand:3"]``. Every payload is stored with the versions
+    of its tags and of its own ``"<name>:<id>"`` tag, and is only served
+    while those are current, so ``invalidate_tags`` retires it without
+    knowing its key; this works on every cache backend that every process
+    shares, and payloads are loaded afresh on a per-process one.
+    """
+
+    def __init__(self, name, load, timeout, tags=None):
+        self.name = name
+        self.load = load
+        self.timeout = timeout
+        self.tags = tags
+
+    def tag(self, pk):
+        return "%s:%s" % (self.name, quote(str(pk), safe=""))
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def get_many(self, ids):
+        """
+        ``{id: payload}`` for the ``ids`` that exist, read with a single
+        ``get_many`` when the payloads are cached and carry no extra tags.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not shared_versions():
+            return self.load(ids)
+        found = cache.get_many(self.lookup_keys(ids))
+        extra = self.extra_keys(found)
+        if extra:
+            found.update(cache.get_many(extra))
+        payloads = self.current(ids, found)
+        missing = [pk for pk in ids if pk not in payloads]
+        if missing:
+            payloads.update(self.fill(missing))
+        return payloads
+
+    async def aget_many(self, ids):
+        """
+        ``get_many`` for async views. The cache is read in one thread hop
+        instead of one per key, and payloads that need building are built
+        by ``fill`` in the thread that owns the database connection.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not shared_versions():
+            return await sync_to_async(self.load)(ids)
+        get_many = sync_to_async(cache.get_many, thread_sensitive=False)
+        found = await get_many(self.lookup_keys(ids))
+        extra = self.extra_keys(found)
+        if extra:
+            found.update(await get_many(extra))
+        payloads = self.current(ids, found)
+        missing = [pk for pk in ids if pk not in payloads]
+        if missing:
+            payloads.update(await sync_to_async(self.fill)(missing))
+        return payloads
+
+    async def aget(self, pk):
+        return (await self.aget_many([pk])).get(pk)
+
+    def lookup_keys(self, ids):
+        return [object_key(self.name, pk) for pk in ids] + [
+            VERSION_KEY % self.tag(pk) for pk in ids
+        ]
+
+    def extra_keys(self, found):
+        """
+        The versions the cached payloads in ``found`` depend on beyond
+        their own.
+        """
+        prefix = OBJECT_KEY % (self.name, "")
+        return list(
+            {
+                VERSION_KEY % tag
+                for key, entry in found.items()
+                if key.startswith(prefix)
+                for tag in entry[0]
+            }
+            - found.keys()
+        )
+
+    def current(self, ids, found):
+        payloads = {}
+        for pk in ids:
+            entry = found.get(object_key(self.name, pk))
+            if entry is None:
+                continue
+            versions, payload = entry
+            if all(
+                found.get(VERSION_KEY % tag) == version
+                for tag, version in versions.items()
+            ):
+                payloads[pk] = payload
+        return payloads
+
+    def fill(self, ids):
+        # Own versions are read before loading, so a write that lands in
+        # between leaves the new payload already retired.
+        before = tag_versions([self.tag(pk) for pk in ids])
+        # Cached payloads outlive replica lag, so they come from the primary
+        # until the replicas caught up with the objects' last change.
+        changed_at = max(before.values())
+        with read_current(changed_at):
+            loaded = self.load(ids)
+        extra = {
+            pk: self.tags(pk, payload) if self.tags else []
+            for pk, payload in loaded.items()
+        }
+        after = tag_versions({tag for tags in extra.values() for tag in tags})
+        entries = {}
+        for pk, payload in loaded.items():
+            versions = {tag: after[tag] for tag in extra[pk]}
+            # A replica read may predate a recent change to an extra tag;
+            # such a payload is served once but not cached.
+            if replicas_caught_up(changed_at) and not all(
+                map(replicas_caught_up, versions.values())
+            ):
+                continue
+            versions[self.tag(pk)] = before[self.tag(pk)]
+            entries[object_key(self.name, pk)] = (versions, payload)
+        cache.set_many(entries, timeout=getattr(settings, self.timeout))
+        return loaded
+
+
+class ProcessIndex:
+    """
+    A per-process structure built by ``build()`` on first use, and rebuilt
+    once one of the ``sources`` versions moved on and the current one is
+    older than the ``max_staleness`` setting in seconds. Requests keep
+    being served from the old structure while one thread rebuilds it.
+    """
+
+    def __init__(self, build, sources, max_staleness):
+        self.build = build
+        self.sources = sources
+        self.max_staleness = max_staleness
+        self.index = None
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        index, built_at = self.index, self.built_at
+        changed_at = max(get_versions(*self.sources).values())
+        if index is not None:
+            if changed_at <= built_at or time.time() - built_at < getattr(
+                settings, self.max_staleness
+            ):
+                return index
+            if not self.lock.acquire(blocking=False):
+                return index
+        else:
+            self.lock.acquire()
+        try:
+            if self.index is index:
+                started = time.time()
+                with read_current(changed_at):
+                    self.index = self.build()
+                self.built_at = started
+            return self.index
+        finally:
+            self.lock.release()
+
+    def version(self):
+        """
+        When the structure ``get()`` serves was built, for the validators
+        of responses built from it.
+        """
+        self.get()
+        return self.built_at
+
+    def clear(self):
+        with self.lock:
+            self.index = None
+            self.built_at = 0.0
@@ -0,0 +1,19 @@
+from django.core.checks import Tags, Warning, register
+
+from .cache import shared_versions
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if shared_versions():
+        return []
+    return [
+        Warning(
+            "The default cache is local to each process, so the stock "
+            "object cache and versioned ETags are turned off.",
+            hint="Set CACHE_URL to a cache every process shares, or "
+            "STOCK_SINGLE_PROCESS = True if only one process serves the "
+            "site.",
+            id="stock.W001",
+        )
+    ]
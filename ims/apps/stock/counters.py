@@ -0,0 +1,328 @@
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.utils.module_loading import import_string
+
+from .inventory import InsufficientStock, apply_movement
+from .models import ProductInventory, RejectedSale, StockMovement
+
+logger = logging.getLogger(__name__)
+
+FLUSH_NOTE = "buffered sales"
+
+
+class LocalCounterStore:
+    """
+    In-process pending-sales buffer, for tests and single-process setups.
+    A worker in another process never sees its sales, so the process that
+    buffers them flushes them itself every ``FLUSH_INTERVAL`` seconds; with
+    ``FLUSH_INTERVAL=None`` only explicit ``flush_counters`` calls do.
+    """
+
+    shared = False
+
+    def __init__(self, FLUSH_INTERVAL=2.0, **options):
+        self.flush_interval = FLUSH_INTERVAL
+        self._pending = defaultdict(int)
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+
+    def add(self, inventory_id, quantity):
+        with self._lock:
+            self._pending[inventory_id] += quantity
+            if self.flush_interval and self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_forever,
+                    name="stock-counter-flush",
+                    daemon=True,
+                )
+                self._flusher.start()
+            return self._pending[inventory_id]
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                flush_counters(self)
+            except Exception:
+                logger.exception("Flushing the buffered sales failed.")
+            finally:
+                # This thread's connection would otherwise never be closed.
+                connection.close()
+
+    def pending(self, inventory_ids):
+        with self._lock:
+            return {
+                pk: self._pending.get(pk, 0)
+                + self._flushing.get(pk, (0, None))[0]
+                for pk in inventory_ids
+            }
+
+    @contextmanager
+    def claim(self):
+        if not self._flush_lock.acquire(blocking=False):
+            yield {}
+            return
+        try:
+            flush_id = uuid.uuid4().hex
+            with self._lock:
+                for pk in list(self._pending):
+                    if pk not in self._flushing:
+                        self._flushing[pk] = (self._pending.pop(pk), flush_id)
+                claimed = dict(self._flushing)
+            yield claimed
+        finally:
+            self._flush_lock.release()
+
+    def settle(self, inventory_id):
+        with self._lock:
+            self._flushing.pop(inventory_id, None)
+
+
+# Moves the pending sales of the items with none in flight into the
+# flushing hash in one step, as "<quantity>:<flush id>"; the sales of the
+# others wait for theirs to settle, so a retried flush applies exactly the
+# quantity it claimed under the same id.
+CLAIM_SCRIPT = """
+local values = redis.call("HGETALL", KEYS[1])
+for i = 1, #values, 2 do
+    local entry = values[i + 1] .. ":" .. ARGV[1]
+    if redis.call("HSETNX", KEYS[2], values[i], entry) == 1 then
+        redis.call("HDEL", KEYS[1], values[i])
+    end
+end
+return redis.call("HGETALL", KEYS[2])
+"""
+
+
+class RedisCounterStore:
+    """
+    Pending-sales buffer shared by every worker, kept in one Redis hash
+    and moved to a second one while it is being flushed.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        LOCATION,
+        KEY="stock:pending-sales",
+        LOCK_TIMEOUT=60,
+        **options,
+    ):
+        import redis
+
+        self.client = redis.Redis.from_url(LOCATION)
+        self.key = KEY
+        self.flushing = "%s:flushing" % KEY
+        self.lock_timeout = LOCK_TIMEOUT
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def add(self, inventory_id, quantity):
+        return self.client.hincrby(self.key, inventory_id, quantity)
+
+    def pending(self, inventory_ids):
+        inventory_ids = list(inventory_ids)
+        if not inventory_ids:
+            return {}
+        pipe = self.client.pipeline()
+        pipe.hmget(self.key, inventory_ids)
+        pipe.hmget(self.flushing, inventory_ids)
+        values, flushing = pipe.execute()
+        return {
+            pk: int(value or 0) + int(claimed.split(b":")[0] if claimed else 0)
+            for pk, value, claimed in zip(inventory_ids, values, flushing)
+        }
+
+    @contextmanager
+    def claim(self):
+        # Sales stay in the flushing hash until ``settle`` drops them, so
+        # the ones a failed flush did not apply are retried by the next;
+        # the flush id makes the ones it did apply a no-op the second time.
+        from redis.exceptions import LockError
+
+        lock = self.client.lock(
+            "%s:lock" % self.key, timeout=self.lock_timeout
+        )
+        if not lock.acquire(blocking=False):
+            yield {}
+            return
+        try:
+            values = self.claim_script(
+                keys=[self.key, self.flushing], args=[uuid.uuid4().hex]
+            )
+            claimed = {}
+            for pk, entry in zip(values[::2], values[1::2]):
+                quantity, flush_id = entry.decode().split(":")
+                claimed[int(pk)] = (int(quantity), flush_id)
+            yield claimed
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning("The pending-sales flush outlived its lock.")
+
+    def settle(self, inventory_id):
+        self.client.hdel(self.flushing, inventory_id)
+
+
+@lru_cache(maxsize=None)
+def get_counter_store():
+    options = dict(settings.STOCK_COUNTER_BUFFER)
+    return import_string(options.pop("BACKEND"))(**options)
+
+
+def buffer_sale(inventory_id, quantity):
+    """
+    Record a sale in the shared buffer instead of updating the row, so hot
+    SKUs take no row lock per sale. Sales that the stored stock minus
+    what is already pending cannot cover are refused straight away.
+    """
+    available = (
+        ProductInventory.objects.filter(pk=inventory_id)
+        .values_list("available", flat=True)
+        .first()
+    )
+    if available is None:
+        raise ProductInventory.DoesNotExist(
+            "No inventory item with id %r." % inventory_id
+        )
+    store = get_counter_store()
+    pending = store.add(inventory_id, quantity)
+    if pending > available:
+        store.add(inventory_id, -quantity)
+        raise InsufficientStock(
+            "Not enough available stock to sell %d items." % quantity
+        )
+    return pending
+
+
+def stock_levels(inventory_ids):
+    """
+    ``sold`` and ``available`` for each item with the pending sales merged
+    in.
+    """
+    pending = get_counter_store().pending(inventory_ids)
+    levels = {}
+    for pk, sold, available in ProductInventory.objects.filter(
+        pk__in=inventory_ids
+    ).values_list("pk", "sold", "available"):
+        levels[pk] = {
+            "sold": sold + pending[pk],
+            "available": available - pending[pk],
+            "pending": pending[pk],
+        }
+    return levels
+
+
+def flush_counters(store=None):
+    """
+    Apply every pending sale with one guarded update and one ledger entry
+    per SKU. Sales that no longer fit the available stock are applied up
+    to what is left, and the rest is recorded as a ``RejectedSale``.
+
+    Each SKU is settled once applied; if the flush fails part way, the
+    rest stays claimed and the next flush retries it. The claim's flush id
+    goes into the ledger entry and the rejection, so sales a crashed flush
+    already applied are not applied again. A flush that finds another one
+    running returns straight away.
+
+    Returns ``(applied, rejected)`` quantities per inventory id.
+    """
+    applied, rejected = {}, {}
+    store = store or get_counter_store()
+    with store.claim() as pending:
+        for inventory_id, (quantity, flush_id) in sorted(pending.items()):
+            if quantity > 0:
+                done = _flushed(inventory_id, flush_id)
+                if done is None:
+                    done = _apply_sale(inventory_id, quantity, flush_id)
+                if done:
+                    applied[inventory_id] = done
+                if done < quantity:
+                    rejected[inventory_id] = quantity - done
+                    _reject_sale(inventory_id, quantity - done, flush_id)
+            store.settle(inventory_id)
+    return applied, rejected
+
+
+def _flushed(inventory_id, flush_id):
+    """
+    How many of the sales claimed under ``flush_id`` an earlier attempt
+    applied, or ``None`` if it settled nothing.
+    """
+    applied = (
+        StockMovement.objects.filter(
+            product_inventory_id=inventory_id, flush_id=flush_id
+        )
+        .values_list("quantity", flat=True)
+        .first()
+    )
+    if applied is not None:
+        return applied
+    if RejectedSale.objects.filter(
+        product_inventory_id=inventory_id, flush_id=flush_id
+    ).exists():
+        return 0
+    return None
+
+
+def _reject_sale(inventory_id, quantity, flush_id):
+    logger.warning(
+        "Rejected %d buffered sales of inventory item %s: not enough stock.",
+        quantity,
+        inventory_id,
+    )
+    if ProductInventory.objects.filter(pk=inventory_id).exists():
+        RejectedSale.objects.bulk_create(
+            [
+                RejectedSale(
+                    product_inventory_id=inventory_id,
+                    quantity=quantity,
+                    flush_id=flush_id,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def _apply_sale(inventory_id, quantity, flush_id):
+    try:
+        return _sell(inventory_id, quantity, flush_id)
+    except ProductInventory.DoesNotExist:
+        return 0
+    except InsufficientStock:
+        pass
+
+    available = (
+        ProductInventory.objects.filter(pk=inventory_id)
+        .values_list("available", flat=True)
+        .first()
+    )
+    fits = min(available or 0, quantity)
+    if fits <= 0:
+        return 0
+    try:
+        return _sell(inventory_id, fits, flush_id)
+    except (ProductInventory.DoesNotExist, InsufficientStock):
+        return 0
+
+
+def _sell(inventory_id, quantity, flush_id):
+    try:
+        apply_movement(
+            inventory_id, StockMovement.SELL, quantity, FLUSH_NOTE, flush_id
+        )
+    except IntegrityError:
+        # A flush that outlived its lock applied the same claim meanwhile.
+        return _flushed(inventory_id, flush_id) or 0
+    return quantity
@@ -0,0 +1,83 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ProductInventory
+
+INVENTORY_EXPORT_COLUMNS = (
+    ("sku", "sku"),
+    ("product", "product__name"),
+    ("brand", "brand__name"),
+    ("supplier", "supplier__name"),
+    ("mrp", "mrp"),
+    ("price", "price"),
+    ("discount", "discount"),
+    ("quantity", "quantity"),
+    ("sold", "sold"),
+    ("available", "available"),
+    ("defective", "defective"),
+)
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """
+    File-like object whose ``write`` hands the line back to ``csv.writer``.
+    """
+
+    def write(self, value):
+        return value
+
+
+def inventory_rows(chunk_size=2000):
+    """
+    Every inventory row as a tuple, streamed from a server-side cursor so
+    memory stays flat whatever the size of the table.
+    """
+    lookups = [lookup for _, lookup in INVENTORY_EXPORT_COLUMNS]
+    return (
+        ProductInventory.objects.order_by("pk")
+        .values_list(*lookups)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def batched(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in INVENTORY_EXPORT_COLUMNS])
+    yield from batched((writer.writerow(row) for row in rows), 500)
+
+
+def export_ndjson(rows):
+    names = [name for name, _ in INVENTORY_EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(",", ":"), ensure_ascii=False)
+    lines = (encoder.encode(dict(zip(names, row))) + "\n" for row in rows)
+    yield from batched(lines, 500)
+
+
+EXPORTERS = {
+    "csv": export_csv,
+    "ndjson": export_ndjson,
+}
+
+
+def export_inventory(export_format, chunk_size=2000):
+    """
+    Lazily render the whole inventory table in ``export_format``.
+    """
+    return EXPORTERS[export_format](inventory_rows(chunk_size))
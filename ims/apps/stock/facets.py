@@ -0,0 +1,222 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import ProcessIndex
+from .models import (
+    Brand,
+    Category,
+    Product,
+    ProductInventory,
+    ProductStock,
+    ProductType,
+    Supplier,
+)
+
+FACET_SOURCES = ("product", "category", "inventory")
+VALUE_FACETS = ("brand", "supplier", "type", "category")
+
+
+def bitmap(ids):
+    """
+    A Python ``int`` with bit ``pk`` set for every id in ``ids``.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        bits[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(bits, "little")
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class FacetIndex:
+    """
+    The product ids behind every facet value, so that the counts of all
+    facets under any combination of filters are a handful of big-int
+    ``AND``s and popcounts, with no ``GROUP BY`` per request.
+
+    Values shared by many products keep a bitmap; rare ones keep a sorted
+    id array instead, so a long tail of brands does not cost a full
+    bitmap each.
+    """
+
+    def __init__(self):
+        products = list(Product.objects.values_list("pk", "type_id"))
+        self.size = max((pk for pk, _ in products), default=0) + 1
+        self.all = bitmap(pk for pk, _ in products)
+        self.labels = {
+            "brand": self.names(Brand),
+            "supplier": self.names(Supplier),
+            "type": self.names(ProductType),
+            "category": {},
+        }
+        members = {facet: defaultdict(set) for facet in VALUE_FACETS}
+        for pk, type_id in products:
+            if type_id is not None:
+                members["type"][type_id].add(pk)
+
+        prices = []
+        items = ProductInventory.objects.values_list(
+            "product_id", "brand_id", "supplier_id", "price"
+        )
+        for product_id, brand_id, supplier_id, price in items.iterator(
+            chunk_size=5000
+        ):
+            members["brand"][brand_id].add(product_id)
+            members["supplier"][supplier_id].add(product_id)
+            prices.append((price, product_id))
+        prices.sort()
+        self.prices = [price for price, _ in prices]
+        self.price_products = array("q", (pk for _, pk in prices))
+
+        self.load_categories(members["category"])
+        self.values = {
+            facet: {
+                pk: self.compact(ids) for pk, ids in members[facet].items()
+            }
+            for facet in VALUE_FACETS
+        }
+        self.in_stock = bitmap(
+            ProductStock.objects.filter(available__gt=0).values_list(
+                "product_id", flat=True
+            )
+        )
+        bounds = list(settings.STOCK_PRICE_FACETS) + [None]
+        self.price_buckets = [
+            (low, high, self.price_range(low, high, closed=False))
+            for low, high in zip(bounds, bounds[1:])
+        ]
+
+    def names(self, model):
+        return {
+            pk: {"id": pk, "name": name}
+            for pk, name in model.objects.values_list("pk", "name")
+        }
+
+    def load_categories(self, members):
+        """
+        Fill ``members`` with every product in each category's subtree,
+        merging children into their parents deepest level first.
+        """
+        memberships = Product.category.through.objects.values_list(
+            "product_id", "category_id"
+        )
+        for product_id, category_id in memberships.iterator(chunk_size=5000):
+            members[category_id].add(product_id)
+        self.slugs = defaultdict(list)
+        for pk, parent_id, name, slug in Category.objects.order_by(
+            "-level"
+        ).values_list("pk", "parent_id", "name", "slug"):
+            self.labels["category"][pk] = {
+                "id": pk,
+                "name": name,
+                "slug": slug,
+            }
+            self.slugs[slug].append(pk)
+            if parent_id is not None and pk in members:
+                members[parent_id] |= members[pk]
+
+    def compact(self, ids):
+        if len(ids) * 64 >= self.size:
+            return bitmap(ids)
+        return array("q", sorted(ids))
+
+    def mask(self, facet, pk):
+        members = self.values[facet].get(pk, 0)
+        return members if isinstance(members, int) else bitmap(members)
+
+    def price_range(self, low=None, high=None, closed=True):
+        """
+        Products with an item priced from ``low`` up to ``high``, which is
+        excluded unless ``closed``.
+        """
+        start = 0 if low is None else bisect_left(self.prices, low)
+        end = len(self.prices)
+        if high is not None:
+            bisect = bisect_right if closed else bisect_left
+            end = bisect(self.prices, high)
+        return bitmap(self.price_products[start:end])
+
+    def count(self, scope, scope_bytes, members):
+        if isinstance(members, int):
+            return popcount(scope & members)
+        return sum(scope_bytes[pk >> 3] >> (pk & 7) & 1 for pk in members)
+
+    def masks(self, filters):
+        """
+        ``{facet: bitmap}`` of the products each active filter lets through.
+        """
+        masks = {}
+        for facet in ("brand", "supplier", "type"):
+            if filters.get(facet) is not None:
+                masks[facet] = self.mask(facet, filters[facet])
+        if filters.get("category"):
+            masks["category"] = 0
+            for pk in self.slugs.get(filters["category"], ()):
+                masks["category"] |= self.mask("category", pk)
+        low, high = filters.get("min_price"), filters.get("max_price")
+        if low is not None or high is not None:
+            masks["price"] = self.price_range(low, high)
+        if filters.get("in_stock") is not None:
+            masks["in_stock"] = (
+                self.in_stock
+                if filters["in_stock"]
+                else self.all & ~self.in_stock
+            )
+        return masks
+
+    def counts(self, filters):
+        """
+        The facet counts of the products matching ``filters``; each facet
+        is counted under every filter but its own, so the other values of
+        a facet stay visible once one is picked.
+        """
+        masks = self.masks(filters)
+
+        def scope(excluded=None):
+            bits = self.all
+            for facet, mask in masks.items():
+                if facet != excluded:
+                    bits &= mask
+            return bits
+
+        facets = {}
+        for facet in VALUE_FACETS:
+            bits = scope(facet)
+            data = bits.to_bytes((self.size + 7) // 8, "little")
+            rows = []
+            for pk, members in self.values[facet].items():
+                count = self.count(bits, data, members)
+                if count and pk in self.labels[facet]:
+                    rows.append(dict(self.labels[facet][pk], count=count))
+            rows.sort(key=lambda row: (-row["count"], row["name"]))
+            facets[facet] = rows
+
+        bits = scope("price")
+        facets["price"] = [
+            {"min": low, "max": high, "count": popcount(bits & members)}
+            for low, high, members in self.price_buckets
+        ]
+        bits = scope("in_stock")
+        in_stock = popcount(bits & self.in_stock)
+        facets["in_stock"] = {
+            "true": in_stock,
+            "false": popcount(bits) - in_stock,
+        }
+        return {"count": popcount(scope()), "facets": facets}
+
+
+facet_index = ProcessIndex(
+    FacetIndex, FACET_SOURCES, "STOCK_FACET_MAX_STALENESS"
+)
+
+
+def facet_counts(filters):
+    return facet_index.get().counts(filters)
@@ -0,0 +1,522 @@
+import csv
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from .aggregates import rebuild_stock_aggregates
+from .cache import bump_version, invalidate_category_tree
+from .inventory import INVALID, NON_NEGATIVE_FIELDS, upsert_inventory
+from .models import (
+    Brand,
+    BrandStock,
+    Category,
+    CategoryStock,
+    Product,
+    ProductInventory,
+    ProductStock,
+    ProductType,
+    Supplier,
+    SupplierStock,
+)
+from .reorder import scan_reorder_levels
+from .search import index_products, rebuild_search_index
+
+CATALOG_FILES = (
+    "brands",
+    "suppliers",
+    "product_types",
+    "categories",
+    "products",
+    "inventory",
+)
+
+INVENTORY_COLUMNS = {
+    "sku": "text",
+    "product": "text",
+    "brand": "text",
+    "supplier": "text",
+    "mrp": "double precision",
+    "price": "numeric(5, 2)",
+    "discount": "numeric(5, 2)",
+    "quantity": "integer",
+    "sold": "integer",
+    "available": "integer",
+    "defective": "integer",
+}
+
+# The inventory columns the COPY merge sets, as SQL over the staging row
+# ``s`` and its resolved references, and what new rows get when the file
+# leaves them empty.
+COPY_INVENTORY_VALUES = {
+    "product_id": "p.id",
+    "brand_id": "b.id",
+    "supplier_id": "su.id",
+    "mrp": "s.mrp",
+    "price": "s.price",
+    "discount": "s.discount",
+    "quantity": "s.quantity",
+    "sold": "s.sold",
+    "available": "s.available",
+    "defective": "s.defective",
+}
+COPY_INVENTORY_DEFAULTS = {
+    "price": "0",
+    "discount": "0",
+    "quantity": "0",
+    "sold": "0",
+    "available": "0",
+    "defective": "0",
+    # Set by the reorder scan that follows the merge.
+    "reorder_threshold": "0",
+    "needs_reorder": "false",
+}
+
+INVENTORY_CONVERTERS = {
+    "mrp": float,
+    "price": Decimal,
+    "discount": Decimal,
+    "quantity": int,
+    "sold": int,
+    "available": int,
+    "defective": int,
+}
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CatalogImporter:
+    """
+    Load a catalog from a directory of CSV files, one per model.
+
+    Files are streamed and written with ``bulk_create`` in batches. Foreign
+    keys are resolved through ``name -> id`` maps built once per model and
+    extended as new rows are inserted. On PostgreSQL, inventory rows are
+    ``COPY``-ed into a staging table and merged with two set-based
+    statements instead.
+    """
+
+    def __init__(self, directory, batch_size=2000, use_copy=None):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        if use_copy is None:
+            use_copy = connection.vendor == "postgresql"
+        self.use_copy = use_copy
+        self.counts = {}
+        self.errors = []
+
+    def run(self):
+        for name in CATALOG_FILES:
+            path = self.directory / ("%s.csv" % name)
+            if path.exists():
+                getattr(self, "load_%s" % name)(path)
+
+        if self.counts.get("categories"):
+            invalidate_category_tree()
+            bump_version("category")
+        if self.counts.get("products"):
+            bump_version("product")
+        if self.counts.get("inventory"):
+            bump_version("sku")
+        return self.counts
+
+    def rows(self, path):
+        with open(path, newline="", encoding="utf-8") as stream:
+            for line, row in enumerate(csv.DictReader(stream), start=2):
+                yield line, {
+                    key: value.strip()
+                    for key, value in row.items()
+                    if key is not None and value is not None
+                }
+
+    def error(self, path, line, message):
+        self.errors.append("%s:%d: %s" % (path.name, line, message))
+
+    def count(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def name_map(self, model, field="name"):
+        """
+        ``field -> id`` for every row of ``model``; the lowest id wins when
+        the natural key is not unique.
+        """
+        mapping = {}
+        for key, pk in model.objects.order_by("-pk").values_list(field, "pk"):
+            mapping[key] = pk
+        return mapping
+
+    def insert_missing(self, model, path, build, key="name", totals=None):
+        """
+        ``bulk_create`` the rows whose ``key`` is not in the table yet, along
+        with their empty ``totals`` rows, and return the refreshed
+        ``key -> id`` map.
+        """
+        known = self.name_map(model, key)
+        for chunk in chunked(self.rows(path), self.batch_size):
+            new = {}
+            for line, row in chunk:
+                value = row.get(key)
+                if not value:
+                    self.error(path, line, "missing %s" % key)
+                elif value not in known and value not in new:
+                    new[value] = build(row)
+            with transaction.atomic():
+                model.objects.bulk_create(new.values())
+                ids = dict(
+                    model.objects.filter(**{"%s__in" % key: list(new)})
+                    .values_list(key, "pk")
+                    .order_by("-pk")
+                )
+                if totals is not None:
+                    totals.objects.bulk_create(
+                        totals(pk=pk) for pk in ids.values()
+                    )
+            known.update(ids)
+            self.count(path.stem, len(new))
+        return known
+
+    def load_brands(self, path):
+        self.insert_missing(
+            Brand,
+            path,
+            lambda row: Brand(name=row["name"]),
+            totals=BrandStock,
+        )
+
+    def load_product_types(self, path):
+        self.insert_missing(
+            ProductType, path, lambda row: ProductType(name=row["name"])
+        )
+
+    def load_suppliers(self, path):
+        self.insert_missing(
+            Supplier,
+            path,
+            lambda row: Supplier(
+                name=row["name"],
+                mobile_number=row.get("mobile_number", ""),
+                email=row.get("email", ""),
+                other_details=row.get("other_details", ""),
+            ),
+            totals=SupplierStock,
+        )
+
+    def load_categories(self, path):
+        """
+        Categories are inserted parents first, one tree level at a time,
+        with the mptt fields left for a single ``rebuild()`` once they are
+        all in.
+        """
+        known = self.name_map(Category, "slug")
+        pending = {}
+        for line, row in self.rows(path):
+            if not row.get("slug"):
+                self.error(path, line, "missing slug")
+            elif row["slug"] not in known:
+                pending[row["slug"]] = (line, row)
+
+        while pending:
+            level = {
+                slug: row
+                for slug, (line, row) in pending.items()
+                if not row.get("parent") or row["parent"] in known
+            }
+            if not level:
+                for line, row in pending.values():
+                    self.error(
+                        path, line, "unknown parent %r" % row.get("parent")
+                    )
+                break
+
+            for chunk in chunked(level.values(), self.batch_size):
+                with transaction.atomic():
+                    Category.objects.bulk_create(
+                        Category(
+                            name=row.get("name") or row["slug"],
+                            slug=row["slug"],
+                            content=row.get("content", ""),
+                            is_active=row.get("is_active", "1").lower()
+                            not in ("0", "false", "no"),
+                            parent_id=known.get(row.get("parent")),
+                            lft=0,
+                            rght=0,
+                            tree_id=0,
+                            level=0,
+                        )
+                        for row in chunk
+                    )
+            known.update(
+                Category.objects.filter(slug__in=list(level)).values_list(
+                    "slug", "pk"
+                )
+            )
+            CategoryStock.objects.bulk_create(
+                CategoryStock(category_id=known[slug]) for slug in level
+            )
+            self.count("categories", len(level))
+            for slug in level:
+                del pending[slug]
+
+        if self.counts.get("categories"):
+            Category.objects.rebuild()
+
+    def load_products(self, path):
+        types = self.name_map(ProductType)
+        categories = self.name_map(Category, "slug")
+        known = self.name_map(Product, "slug")
+        through = Product.category.through
+
+        for chunk in chunked(self.rows(path), self.batch_size):
+            new = {}
+            for line, row in chunk:
+                slug = row.get("slug")
+                if not slug or not row.get("name"):
+                    self.error(path, line, "missing name or slug")
+                    continue
+                if slug in known or slug in new:
+                    continue
+                product_type = row.get("type")
+                if product_type and product_type not in types:
+                    self.error(path, line, "unknown type %r" % product_type)
+                    continue
+                slugs = [s for s in row.get("categories", "").split("|") if s]
+                unknown = [s for s in slugs if s not in categories]
+                if unknown:
+                    self.error(path, line, "unknown categories %r" % unknown)
+                    continue
+                product = Product(
+                    name=row["name"],
+                    slug=slug,
+                    type_id=types.get(product_type),
+                    summary=row.get("summary") or None,
+                    content=row.get("content", ""),
+                )
+                new[slug] = (product, slugs)
+
+            with transaction.atomic():
+                Product.objects.bulk_create(p for p, _ in new.values())
+                ids = dict(
+                    Product.objects.filter(slug__in=list(new))
+                    .order_by("-pk")
+                    .values_list("slug", "pk")
+                )
+                through.objects.bulk_create(
+                    through(product_id=ids[slug], category_id=categories[c])
+                    for slug, (_, slugs) in new.items()
+                    for c in set(slugs)
+                )
+                ProductStock.objects.bulk_create(
+                    ProductStock(product_id=pk) for pk in ids.values()
+                )
+                index_products(ids.values())
+            known.update(ids)
+            self.count("products", len(new))
+
+    def load_inventory(self, path):
+        if self.use_copy:
+            self.copy_inventory(path)
+            # The merge bypasses the incremental updates.
+            rebuild_stock_aggregates()
+            scan_reorder_levels()
+            rebuild_search_index()
+            return
+
+        references = {
+            "product": self.name_map(Product, "slug"),
+            "brand": self.name_map(Brand),
+            "supplier": self.name_map(Supplier),
+        }
+        for chunk in chunked(self.rows(path), self.batch_size):
+            records, lines = [], []
+            for line, row in chunk:
+                try:
+                    records.append(self.inventory_record(row, references))
+                except CatalogImportError as exc:
+                    self.error(path, line, str(exc))
+                else:
+                    lines.append(line)
+
+            for line, (status, errors) in zip(
+                lines, upsert_inventory(records, self.batch_size)
+            ):
+                if status == INVALID:
+                    self.error(path, line, str(errors))
+                else:
+                    self.count("inventory", 1)
+
+    def inventory_record(self, row, references):
+        if not row.get("sku"):
+            raise CatalogImportError("missing sku")
+        record = {"sku": row["sku"]}
+        for field, mapping in references.items():
+            if row.get(field):
+                try:
+                    record[field] = mapping[row[field]]
+                except KeyError:
+                    raise CatalogImportError(
+                        "unknown %s %r" % (field, row[field])
+                    )
+        for field, convert in INVENTORY_CONVERTERS.items():
+            if row.get(field):
+                try:
+                    record[field] = convert(row[field])
+                except (ValueError, InvalidOperation):
+                    raise CatalogImportError(
+                        "invalid %s %r" % (field, row[field])
+                    )
+        return record
+
+    def copy_inventory(self, path):
+        """
+        PostgreSQL fast path: ``COPY`` the file into a temporary staging
+        table, then merge it into the inventory with one ``UPDATE`` and one
+        ``INSERT ... SELECT``.
+        """
+        with open(path, newline="", encoding="utf-8") as stream:
+            header = next(csv.reader(stream), [])
+        columns = [column.strip() for column in header]
+        unknown = set(columns) - set(INVENTORY_COLUMNS)
+        if unknown or "sku" not in columns:
+            raise CatalogImportError(
+                "%s: unexpected columns %s" % (path.name, sorted(unknown))
+            )
+
+        table = ProductInventory._meta.db_table
+        staging = "import_inventory"
+        joins = """
+            FROM {staging} s
+            LEFT JOIN (
+                SELECT slug, min(id) AS id FROM {product} GROUP BY slug
+            ) p ON p.slug = s.product
+            LEFT JOIN (
+                SELECT name, min(id) AS id FROM {brand} GROUP BY name
+            ) b ON b.name = s.brand
+            LEFT JOIN (
+                SELECT name, min(id) AS id FROM {supplier} GROUP BY name
+            ) su ON su.name = s.supplier
+        """.format(
+            staging=staging,
+            product=Product._meta.db_table,
+            brand=Brand._meta.db_table,
+            supplier=Supplier._meta.db_table,
+        )
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE {staging} ({columns}) "
+                "ON COMMIT DROP".format(
+                    staging=staging,
+                    columns=", ".join(
+                        "%s %s" % (name, INVENTORY_COLUMNS[name])
+                        for name in columns
+                    ),
+                )
+            )
+            for name in set(INVENTORY_COLUMNS) - set(columns):
+                cursor.execute(
+                    "ALTER TABLE {staging} ADD COLUMN {name} {type}".format(
+                        staging=staging,
+                        name=name,
+                        type=INVENTORY_COLUMNS[name],
+                    )
+                )
+            with open(path, encoding="utf-8") as stream:
+                cursor.cursor.copy_expert(
+                    "COPY {staging} ({columns}) FROM STDIN "
+                    "WITH (FORMAT csv, HEADER true)".format(
+                        staging=staging, columns=", ".join(columns)
+                    ),
+                    stream,
+                )
+            # The last occurrence of a SKU in the file wins.
+            cursor.execute(
+                "DELETE FROM {staging} a USING {staging} b "
+                "WHERE a.sku = b.sku AND a.ctid < b.ctid".format(
+                    staging=staging
+                )
+            )
+            cursor.execute(
+                "DELETE FROM {staging} WHERE {negative}".format(
+                    staging=staging,
+                    negative=" OR ".join(
+                        "%s < 0" % field for field in NON_NEGATIVE_FIELDS
+                    ),
+                )
+            )
+            if cursor.rowcount:
+                self.errors.append(
+                    "%s: %d rows have a negative %s and were skipped"
+                    % (
+                        path.name,
+                        cursor.rowcount,
+                        ", ".join(NON_NEGATIVE_FIELDS),
+                    )
+                )
+            cursor.execute(
+                "SELECT count(*) {joins} WHERE (s.product IS NOT NULL "
+                "AND p.id IS NULL) OR (s.brand IS NOT NULL AND b.id IS NULL) "
+                "OR (s.supplier IS NOT NULL AND su.id IS NULL)".format(
+                    joins=joins
+                )
+            )
+            unresolved = cursor.fetchone()[0]
+            if unresolved:
+                self.errors.append(
+                    "%s: %d rows refer to an unknown product, brand or "
+                    "supplier and were skipped" % (path.name, unresolved)
+                )
+
+            resolved = (
+                "(s.product IS NULL OR p.id IS NOT NULL) "
+                "AND (s.brand IS NULL OR b.id IS NOT NULL) "
+                "AND (s.supplier IS NULL OR su.id IS NOT NULL)"
+            )
+            cursor.execute(
+                "UPDATE {table} AS inv SET {assignments} {joins} "
+                "WHERE inv.sku = s.sku AND {resolved}".format(
+                    table=table,
+                    assignments=", ".join(
+                        "%s = COALESCE(%s, inv.%s)" % (column, value, column)
+                        for column, value in COPY_INVENTORY_VALUES.items()
+                    ),
+                    joins=joins,
+                    resolved=resolved,
+                )
+            )
+            updated = cursor.rowcount
+            inserted = {
+                column: "COALESCE(%s, %s)"
+                % (value, COPY_INVENTORY_DEFAULTS[column])
+                if column in COPY_INVENTORY_DEFAULTS
+                else value
+                for column, value in COPY_INVENTORY_VALUES.items()
+            }
+            # Columns no file sets take their defaults.
+            for column, default in COPY_INVENTORY_DEFAULTS.items():
+                inserted.setdefault(column, default)
+            cursor.execute(
+                "INSERT INTO {table} (sku, {columns}) "
+                "SELECT s.sku, {values} {joins} "
+                "WHERE {resolved} AND p.id IS NOT NULL AND b.id IS NOT NULL "
+                "AND su.id IS NOT NULL AND s.mrp IS NOT NULL "
+                "ON CONFLICT (sku) DO NOTHING".format(
+                    table=table,
+                    columns=", ".join(inserted),
+                    values=", ".join(inserted.values()),
+                    joins=joins,
+                    resolved=resolved,
+                )
+            )
+            self.count("inventory", updated + cursor.rowcount)
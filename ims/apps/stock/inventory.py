@@ -0,0 +1,264 @@
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .aggregates import StockDeltas, snapshot
+from .cache import bump_version, invalidate_skus
+from .models import Brand, Product, ProductInventory, StockMovement, Supplier
+from .reorder import (
+    category_levels,
+    check_item,
+    raise_alerts,
+    reorder_categories,
+    resolve_alerts,
+    set_threshold,
+)
+from .search import index_products
+
+INVENTORY_RELATIONS = {
+    "product": Product,
+    "brand": Brand,
+    "supplier": Supplier,
+}
+
+INVENTORY_REQUIRED_FIELDS = (
+    "product",
+    "brand",
+    "supplier",
+    "mrp",
+    "defective",
+)
+
+# How each movement kind changes the counters, and the counter that must
+# still cover the quantity for the movement to apply.
+MOVEMENT_EFFECTS = {
+    StockMovement.RECEIVE: ({"quantity": 1, "available": 1}, None),
+    StockMovement.SELL: ({"sold": 1, "available": -1}, "available"),
+    StockMovement.RETURN: ({"sold": -1, "available": 1}, "sold"),
+    StockMovement.DEFECT: ({"defective": 1, "available": -1}, "available"),
+}
+
+# Counters the database constrains to be non-negative.
+NON_NEGATIVE_FIELDS = ("quantity", "sold", "available")
+# Tries at a chunk whose new SKUs keep being created by a concurrent
+# upsert before it manages to insert them.
+CHUNK_ATTEMPTS = 3
+
+CREATED = "created"
+UPDATED = "updated"
+INVALID = "invalid"
+
+
+def _missing_relations(rows):
+    """
+    The ids each row refers to that do not exist, checked with one query
+    per related model for the whole batch.
+    """
+    missing = {}
+    for field, model in INVENTORY_RELATIONS.items():
+        wanted = {row[field] for row in rows if field in row}
+        found = set(
+            model.objects.filter(pk__in=wanted).values_list("pk", flat=True)
+        )
+        missing[field] = wanted - found
+    return missing
+
+
+def duplicate_skus(apps=global_apps):
+    """
+    ``{sku: [ids]}`` of every SKU held by more than one inventory row.
+    """
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+    skus = (
+        ProductInventory.objects.values("sku")
+        .annotate(rows=Count("pk"))
+        .filter(rows__gt=1)
+        .values_list("sku", flat=True)
+    )
+    duplicates = {}
+    for sku, pk in (
+        ProductInventory.objects.filter(sku__in=skus)
+        .order_by("sku", "pk")
+        .values_list("sku", "pk")
+    ):
+        duplicates.setdefault(sku, []).append(pk)
+    return duplicates
+
+
+def upsert_inventory(rows, batch_size=500):
+    """
+    Create or update inventory rows keyed by ``sku``.
+
+    ``rows`` are validated field dicts. Related ids and existing SKUs are
+    resolved for the whole batch up front, then rows are written with
+    ``bulk_create`` / ``bulk_update`` in one transaction per chunk, along
+    with the matching change to the stock aggregates and reorder alerts.
+
+    Returns a ``(status, errors)`` pair for every row, in order.
+    """
+    results = [None] * len(rows)
+    missing = _missing_relations(rows)
+
+    seen = set()
+    for index, row in enumerate(rows):
+        errors = {}
+        for field, ids in missing.items():
+            if row.get(field) in ids:
+                errors[field] = ["Invalid pk %r." % row[field]]
+        for field in NON_NEGATIVE_FIELDS:
+            if row.get(field) is not None and row[field] < 0:
+                errors[field] = [
+                    "Ensure this value is greater than or equal to 0."
+                ]
+        if row["sku"] in seen:
+            errors["sku"] = ["Duplicate sku in this batch."]
+        seen.add(row["sku"])
+        if errors:
+            results[index] = (INVALID, errors)
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    levelled = reorder_categories()
+    searched = set()
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start : start + batch_size]
+        for attempt in range(1, CHUNK_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    _write_chunk(rows, chunk, results, levelled, searched)
+                break
+            except IntegrityError:
+                # Another upsert created some of these SKUs since they were
+                # looked up; run the chunk again to update them instead.
+                if attempt == CHUNK_ATTEMPTS:
+                    raise
+    # The search index is derived data; it is brought up to date once.
+    index_products(searched)
+    if searched:
+        bump_version("sku")
+    return results
+
+
+def _write_chunk(rows, chunk, results, levelled, searched):
+    skus = [rows[index]["sku"] for index in chunk]
+    # Lock the rows the deltas are worked out from until they are written,
+    # in SKU order so concurrent upserts of overlapping chunks queue up.
+    existing = (
+        ProductInventory.objects.select_for_update()
+        .order_by("sku")
+        .in_bulk(skus, field_name="sku")
+    )
+
+    deltas = StockDeltas()
+    to_create, to_update, update_fields = [], [], set()
+    for index in chunk:
+        row = rows[index]
+        fields = {
+            ("%s_id" % key if key in INVENTORY_RELATIONS else key): value
+            for key, value in row.items()
+            if key != "sku"
+        }
+        item = existing.get(row["sku"])
+
+        if item is None:
+            absent = [f for f in INVENTORY_REQUIRED_FIELDS if f not in row]
+            if absent:
+                results[index] = (
+                    INVALID,
+                    {f: ["This field is required."] for f in absent},
+                )
+                continue
+            item = ProductInventory(sku=row["sku"], **fields)
+            to_create.append(item)
+            searched.add(item.product_id)
+            deltas.change(None, snapshot(item))
+            results[index] = (CREATED, {})
+        else:
+            before = snapshot(item)
+            for name, value in fields.items():
+                setattr(item, name, value)
+            deltas.change(before, snapshot(item))
+            if "product_id" in fields:
+                searched.update([before[0][0], item.product_id])
+            update_fields.update(fields)
+            to_update.append(item)
+            results[index] = (UPDATED, {})
+
+    levels = category_levels(
+        {item.product_id for item in to_create + to_update}, levelled
+    )
+    crossed, cleared = [], []
+    for item in to_create + to_update:
+        if set_threshold(item, levels):
+            (crossed if item.needs_reorder else cleared).append(item.sku)
+    if to_update:
+        update_fields.update(["reorder_threshold", "needs_reorder"])
+
+    ProductInventory.objects.bulk_create(to_create)
+    if to_update:
+        ProductInventory.objects.bulk_update(to_update, sorted(update_fields))
+    deltas.apply()
+    invalidate_skus(skus)
+    if crossed:
+        raise_alerts(_ids(crossed))
+    if cleared:
+        resolve_alerts(_ids(cleared))
+
+
+def _ids(skus):
+    return ProductInventory.objects.filter(sku__in=skus).values_list(
+        "pk", flat=True
+    )
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def apply_movement(inventory_id, kind, quantity, note="", flush_id=None):
+    """
+    Apply a stock movement with a single guarded ``UPDATE ... SET x = x + n``
+    and append it to the ledger, in one short transaction.
+
+    The row is never read first, so concurrent movements cannot lose
+    updates; the guard in the ``WHERE`` clause makes a movement that would
+    take a counter below zero match no row, and ``InsufficientStock`` is
+    raised instead. The stock aggregates move by the same amounts.
+
+    ``flush_id`` marks the movements of buffered-sales flushes; the ledger
+    takes one per item, so a retried flush cannot apply its sales twice.
+    """
+    effects, guard = MOVEMENT_EFFECTS[kind]
+    changes = {
+        field: F(field) + sign * quantity for field, sign in effects.items()
+    }
+    rows = ProductInventory.objects.filter(pk=inventory_id)
+
+    with transaction.atomic():
+        guarded = (
+            rows.filter(**{"%s__gte" % guard: quantity}) if guard else rows
+        )
+        if not guarded.update(**changes):
+            if not rows.exists():
+                raise ProductInventory.DoesNotExist(
+                    "No inventory item with id %r." % inventory_id
+                )
+            raise InsufficientStock(
+                "Not enough %s stock to %s %d items." % (guard, kind, quantity)
+            )
+        movement = StockMovement.objects.create(
+            product_inventory_id=inventory_id,
+            kind=kind,
+            quantity=quantity,
+            note=note,
+            flush_id=flush_id,
+        )
+        item = rows.get()
+        check_item(item)
+        after = snapshot(item)
+        for field, sign in effects.items():
+            setattr(item, field, getattr(item, field) - sign * quantity)
+        deltas = StockDeltas()
+        deltas.change(snapshot(item), after)
+        deltas.apply()
+        invalidate_skus([item.sku])
+        return movement
@@ -0,0 +1,84 @@
+import time
+
+from apps.stock.api.fragments import load_categories, load_products
+from apps.stock.api.renderers import ORJSONRenderer
+from apps.stock.api.serializer import CategorySerializer, ProductSerializer
+from apps.stock.models import Category, Product
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Build and render the payloads of a page of products and of every "
+        "category, once through the DRF serializers and JSONRenderer and "
+        "once through the row fast path and ORJSONRenderer, check that the "
+        "bytes match and compare the timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        ids = list(
+            Product.objects.order_by("pk").values_list("pk", flat=True)[
+                : options["products"]
+            ]
+        )
+        if not ids:
+            raise CommandError("No products to render.")
+        category_ids = list(
+            Category.objects.order_by("pk").values_list("pk", flat=True)
+        )
+        cases = [
+            (
+                "%d products" % len(ids),
+                lambda: ProductSerializer(
+                    Product.objects.for_serializer()
+                    .filter(pk__in=ids)
+                    .order_by("pk"),
+                    many=True,
+                ).data,
+                lambda: self.ordered(load_products(ids), ids),
+            ),
+            (
+                "%d categories" % len(category_ids),
+                lambda: CategorySerializer(
+                    Category.objects.filter(pk__in=category_ids).order_by(
+                        "pk"
+                    ),
+                    many=True,
+                ).data,
+                lambda: self.ordered(
+                    load_categories(category_ids), category_ids
+                ),
+            ),
+        ]
+        self.stdout.write(
+            "%-16s %12s %12s %8s" % ("payload", "drf ms", "fast ms", "speedup")
+        )
+        for name, slow, fast in cases:
+            expected = JSONRenderer().render(slow())
+            if ORJSONRenderer().render(fast()) != expected:
+                raise CommandError("%s: the fast path output differs." % name)
+            slow_ms = self.time(slow, JSONRenderer(), options["repeat"])
+            fast_ms = self.time(fast, ORJSONRenderer(), options["repeat"])
+            self.stdout.write(
+                "%-16s %12.2f %12.2f %7.1fx"
+                % (name, slow_ms, fast_ms, slow_ms / fast_ms)
+            )
+
+    def ordered(self, payloads, ids):
+        return [payloads[pk] for pk in ids if pk in payloads]
+
+    def time(self, build, renderer, repeat):
+        """
+        Best milliseconds of ``repeat`` builds and renders.
+        """
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            renderer.render(build())
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
@@ -0,0 +1,151 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve many slow clients through one worker, once through the WSGI "
+        "handler with a fixed pool of threads and once through the ASGI "
+        "handler on one event loop, and compare throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=200)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0.2,
+            help="Seconds each client takes to read its response.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help="Request threads of the WSGI worker, as gunicorn --threads.",
+        )
+        parser.add_argument("--sync-url", default="/stock/api/?page_size=20")
+        parser.add_argument(
+            "--async-url", default="/stock/api/async/?page_size=20"
+        )
+
+    def handle(self, *args, **options):
+        clients, delay = options["clients"], options["delay"]
+        results = [
+            (
+                "wsgi, %d threads" % options["threads"],
+                self.run_wsgi(
+                    options["sync_url"], clients, delay, options["threads"]
+                ),
+            ),
+            (
+                "asgi, 1 event loop",
+                asyncio.run(
+                    self.run_asgi(options["async_url"], clients, delay)
+                ),
+            ),
+        ]
+        self.stdout.write(
+            "%-20s %8s %8s %9s %9s %7s"
+            % ("worker", "wall s", "req/s", "p50 ms", "p95 ms", "errors")
+        )
+        for name, (wall, latencies, errors) in results:
+            latencies.sort()
+            self.stdout.write(
+                "%-20s %8.2f %8.1f %9.1f %9.1f %7d"
+                % (
+                    name,
+                    wall,
+                    clients / wall,
+                    statistics.median(latencies) * 1000,
+                    latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                    errors,
+                )
+            )
+
+    def run_wsgi(self, url, clients, delay, threads):
+        application = get_wsgi_application()
+        path, query = self.split(url)
+
+        def client(queued_at):
+            status = []
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "wsgi.url_scheme": "http",
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": self.stderr,
+            }
+            body = application(
+                environ, lambda code, headers: status.append(code)
+            )
+            for chunk in body:
+                # The worker thread is stuck writing to the slow client.
+                time.sleep(delay)
+            body.close()
+            return time.perf_counter() - queued_at, status[0][:3] != "200"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            done = list(
+                pool.map(client, [time.perf_counter() for _ in range(clients)])
+            )
+        wall = time.perf_counter() - started
+        return wall, [t for t, _ in done], sum(e for _, e in done)
+
+    async def run_asgi(self, url, clients, delay):
+        application = get_asgi_application()
+        path, query = self.split(url)
+
+        async def client():
+            queued_at = time.perf_counter()
+            status = []
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": query.encode(),
+                "headers": [(b"host", b"localhost")],
+                "server": ("localhost", 80),
+            }
+
+            async def receive():
+                return {
+                    "type": "http.request",
+                    "body": b"",
+                    "more_body": False,
+                }
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body"):
+                    # Only this coroutine waits on the slow client.
+                    await asyncio.sleep(delay)
+
+            await application(scope, receive, send)
+            return time.perf_counter() - queued_at, status[0] != 200
+
+        started = time.perf_counter()
+        done = await asyncio.gather(*(client() for _ in range(clients)))
+        wall = time.perf_counter() - started
+        return wall, [t for t, _ in done], sum(e for _, e in done)
+
+    def split(self, url):
+        parts = urlsplit(url)
+        return parts.path, parts.query
@@ -0,0 +1,30 @@
+from apps.stock.export import EXPORTERS, export_inventory
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Stream the whole product inventory as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(EXPORTERS),
+            default="csv",
+            dest="export_format",
+        )
+        parser.add_argument(
+            "--output",
+            help="File to write to, defaults to stdout.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, export_format, output, chunk_size, **options):
+        chunks = export_inventory(export_format, chunk_size)
+        if output is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(output, "w", newline="", encoding="utf-8") as stream:
+            for chunk in chunks:
+                stream.write(chunk)
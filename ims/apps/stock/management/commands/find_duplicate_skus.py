@@ -0,0 +1,16 @@
+from apps.stock.inventory import duplicate_skus
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "List the SKUs held by more than one inventory row, which must be "
+        "merged or renamed before SKUs can be made unique."
+    )
+
+    def handle(self, *args, **options):
+        duplicates = duplicate_skus()
+        for sku, ids in duplicates.items():
+            self.stdout.write("%s\t%s" % (sku, ",".join(map(str, ids))))
+        if duplicates:
+            raise CommandError("%d duplicate SKUs." % len(duplicates))
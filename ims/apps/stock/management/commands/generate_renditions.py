@@ -0,0 +1,28 @@
+from apps.stock.models import Media
+from apps.stock.renditions import generate_all_renditions
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the missing renditions of every product image, in a pool "
+        "of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker processes; defaults to one per CPU, 0 renders "
+            "in this process.",
+        )
+        parser.add_argument("--batch-size", type=int, default=32)
+
+    def handle(self, *args, **options):
+        updated = generate_all_renditions(
+            Media.objects.order_by("pk"),
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write("Rendered images of %d media." % updated)
@@ -0,0 +1,38 @@
+from apps.stock.importer import (
+    CATALOG_FILES,
+    CatalogImporter,
+    CatalogImportError,
+)
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Load brands, suppliers, product types, categories, products and "
+        "inventory from the matching <name>.csv files in a directory: %s."
+        % ", ".join(CATALOG_FILES)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--no-copy",
+            action="store_false",
+            dest="use_copy",
+            default=None,
+            help="Do not use COPY for inventory rows on PostgreSQL.",
+        )
+
+    def handle(self, *args, directory, batch_size, use_copy, **options):
+        importer = CatalogImporter(directory, batch_size, use_copy)
+        try:
+            counts = importer.run()
+        except (CatalogImportError, OSError) as exc:
+            raise CommandError(exc)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        for name in CATALOG_FILES:
+            if name in counts:
+                self.stdout.write("%s: %d" % (name, counts[name]))
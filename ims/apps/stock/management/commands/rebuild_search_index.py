@@ -0,0 +1,12 @@
+from apps.stock.search import rebuild_search_index
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Recreate the product full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rebuild_search_index(batch_size=options["batch_size"])
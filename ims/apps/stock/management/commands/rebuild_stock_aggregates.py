@@ -0,0 +1,9 @@
+from apps.stock.aggregates import rebuild_stock_aggregates
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Recompute the product and category stock totals from scratch."
+
+    def handle(self, *args, **options):
+        rebuild_stock_aggregates()
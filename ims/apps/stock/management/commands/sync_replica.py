@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary database over its local stand-in replicas, "
+        "once or every --interval seconds to mimic replication lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "aliases",
+            nargs="*",
+            help="Replica aliases; defaults to DATABASE_REPLICAS.",
+        )
+        parser.add_argument("--interval", type=float, default=None)
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError("No replica aliases given or configured.")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(
+                    "%s is not SQLite; use the server's replication." % alias
+                )
+        while True:
+            for alias in aliases:
+                self.copy(alias)
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
+
+    def copy(self, alias):
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        self.stdout.write("Copied %s to %s." % (DEFAULT_DB_ALIAS, alias))
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["created_at", "id"], name="stock_produ_created_2f0238_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["name", "id"], name="stock_produ_name_20d1d9_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0002_product_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                fields=["tree_id", "lft"], name="stock_category_tree_lft_idx"
+            ),
+        ),
+    ]
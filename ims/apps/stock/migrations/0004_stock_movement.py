@@ -0,0 +1,112 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:29
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def check_negative_available(apps, schema_editor):
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+    negative = ProductInventory.objects.using(
+        schema_editor.connection.alias
+    ).filter(available__lt=0)
+    count = negative.count()
+    if count:
+        rows = negative.order_by("sku").values_list("sku", "available")
+        listed = "; ".join("%s (%d)" % row for row in rows[:20])
+        raise CommandError(
+            "%d inventory items have a negative available count: %s. "
+            "Correct them before the count is constrained to be at least 0."
+            % (count, listed)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0003_category_tree_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_negative_available, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("receive", "Receive"),
+                            ("sell", "Sell"),
+                            ("return", "Return"),
+                            ("defect", "Defect"),
+                        ],
+                        help_text="format: required, receive, sell, return or defect",
+                        max_length=10,
+                        verbose_name="Kind",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(
+                        help_text="The number of items moved.", verbose_name="quantity"
+                    ),
+                ),
+                (
+                    "note",
+                    models.CharField(
+                        blank=True,
+                        help_text="format: not required, max-255",
+                        max_length=255,
+                        verbose_name="Note",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="format: Y-m-d H:M:S",
+                        verbose_name="date movement applied",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "stock movement",
+                "verbose_name_plural": "stock movements",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="productinventory",
+            constraint=models.CheckConstraint(
+                check=models.Q(("available__gte", 0)),
+                name="stock_inventory_available_gte_0",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockmovement",
+            name="product_inventory",
+            field=models.ForeignKey(
+                help_text="The inventory item the movement was applied to.",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="movements",
+                to="stock.productinventory",
+                verbose_name="Product Inventory",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["product_inventory", "created_at"],
+                name="stock_stock_product_12c039_idx",
+            ),
+        ),
+    ]
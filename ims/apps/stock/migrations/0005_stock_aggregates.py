@@ -0,0 +1,138 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0004_stock_movement"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryStock",
+            fields=[
+                (
+                    "quantity",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity received at the inventory.",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "sold",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity sold to the customers.",
+                        verbose_name="sold",
+                    ),
+                ),
+                (
+                    "available",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The quantity that is available on the stock.",
+                        verbose_name="Available",
+                    ),
+                ),
+                (
+                    "defective",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total defective items.",
+                        verbose_name="Defective",
+                    ),
+                ),
+                (
+                    "stock_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="The price times the available quantity of every item.",
+                        max_digits=18,
+                        verbose_name="Stock value",
+                    ),
+                ),
+                (
+                    "category",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="stock.category",
+                        verbose_name="Category",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "category stock",
+                "verbose_name_plural": "category stock",
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductStock",
+            fields=[
+                (
+                    "quantity",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity received at the inventory.",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "sold",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity sold to the customers.",
+                        verbose_name="sold",
+                    ),
+                ),
+                (
+                    "available",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The quantity that is available on the stock.",
+                        verbose_name="Available",
+                    ),
+                ),
+                (
+                    "defective",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total defective items.",
+                        verbose_name="Defective",
+                    ),
+                ),
+                (
+                    "stock_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="The price times the available quantity of every item.",
+                        max_digits=18,
+                        verbose_name="Stock value",
+                    ),
+                ),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="stock.product",
+                        verbose_name="Product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "product stock",
+                "verbose_name_plural": "product stock",
+            },
+        ),
+    ]
@@ -0,0 +1,256 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, Sum, When
+import django.db.models.deletion
+
+TOTAL_FIELDS = (
+    "quantity",
+    "sold",
+    "available",
+    "defective",
+    "low_stock",
+    "stock_value",
+)
+
+
+def rebuild_aggregates(apps, schema_editor):
+    # Fill every summary from the inventory rows as they are now; a copy
+    # of the rebuild at this point of the history, not the live one.
+    db = schema_editor.connection.alias
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+    threshold = getattr(settings, "STOCK_LOW_STOCK_THRESHOLD", 5)
+    sums = {
+        "%s_sum" % field: Sum(field)
+        for field in ("quantity", "sold", "available", "defective")
+    }
+    sums["low_stock_sum"] = Sum(
+        Case(
+            When(available__lte=threshold, then=1),
+            default=0,
+            output_field=IntegerField(),
+        )
+    )
+    sums["stock_value_sum"] = Sum(
+        F("price") * F("available"),
+        output_field=models.DecimalField(max_digits=18, decimal_places=2),
+    )
+
+    def totals(key):
+        return {
+            row[key]: {field: row["%s_sum" % field] for field in TOTAL_FIELDS}
+            for row in ProductInventory.objects.using(db)
+            .order_by()
+            .values(key)
+            .annotate(**sums)
+        }
+
+    products = totals("product_id")
+    for name, owner, found in (
+        ("ProductStock", "Product", products),
+        ("BrandStock", "Brand", totals("brand_id")),
+        ("SupplierStock", "Supplier", totals("supplier_id")),
+    ):
+        Totals = apps.get_model("stock", name)
+        Owner = apps.get_model("stock", owner)
+        Totals.objects.using(db).all().delete()
+        Totals.objects.using(db).bulk_create(
+            Totals(pk=pk, **found.get(pk, {}))
+            for pk in Owner.objects.using(db).values_list("pk", flat=True)
+        )
+
+    # Each product counts once in every category at or above its own.
+    Category = apps.get_model("stock", "Category")
+    CategoryStock = apps.get_model("stock", "CategoryStock")
+    through = apps.get_model("stock", "Product").category.through
+    parents = dict(Category.objects.using(db).values_list("pk", "parent_id"))
+    reached = {}
+    for product_id, category_id in through.objects.using(db).values_list(
+        "product_id", "category_id"
+    ):
+        while category_id is not None:
+            reached.setdefault(product_id, set()).add(category_id)
+            category_id = parents[category_id]
+    categories = {pk: dict.fromkeys(TOTAL_FIELDS, 0) for pk in parents}
+    for product_id, row in products.items():
+        for category_id in reached.get(product_id, ()):
+            for field in TOTAL_FIELDS:
+                categories[category_id][field] += row[field]
+    CategoryStock.objects.using(db).all().delete()
+    CategoryStock.objects.using(db).bulk_create(
+        CategoryStock(category_id=pk, **row) for pk, row in categories.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0005_stock_aggregates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandStock",
+            fields=[
+                (
+                    "quantity",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity received at the inventory.",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "sold",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity sold to the customers.",
+                        verbose_name="sold",
+                    ),
+                ),
+                (
+                    "available",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The quantity that is available on the stock.",
+                        verbose_name="Available",
+                    ),
+                ),
+                (
+                    "defective",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total defective items.",
+                        verbose_name="Defective",
+                    ),
+                ),
+                (
+                    "low_stock",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of items at or below the low stock level.",
+                        verbose_name="Low stock items",
+                    ),
+                ),
+                (
+                    "stock_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="The price times the available quantity of every item.",
+                        max_digits=18,
+                        verbose_name="Stock value",
+                    ),
+                ),
+                (
+                    "brand",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="stock.brand",
+                        verbose_name="Brand",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "brand stock",
+                "verbose_name_plural": "brand stock",
+            },
+        ),
+        migrations.CreateModel(
+            name="SupplierStock",
+            fields=[
+                (
+                    "quantity",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity received at the inventory.",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "sold",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total quantity sold to the customers.",
+                        verbose_name="sold",
+                    ),
+                ),
+                (
+                    "available",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The quantity that is available on the stock.",
+                        verbose_name="Available",
+                    ),
+                ),
+                (
+                    "defective",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="The total defective items.",
+                        verbose_name="Defective",
+                    ),
+                ),
+                (
+                    "low_stock",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of items at or below the low stock level.",
+                        verbose_name="Low stock items",
+                    ),
+                ),
+                (
+                    "stock_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="The price times the available quantity of every item.",
+                        max_digits=18,
+                        verbose_name="Stock value",
+                    ),
+                ),
+                (
+                    "supplier",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="stock.supplier",
+                        verbose_name="Supplier",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "supplier stock",
+                "verbose_name_plural": "supplier stock",
+            },
+        ),
+        migrations.AddField(
+            model_name="categorystock",
+            name="low_stock",
+            field=models.IntegerField(
+                default=0,
+                help_text="The number of items at or below the low stock level.",
+                verbose_name="Low stock items",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productstock",
+            name="low_stock",
+            field=models.IntegerField(
+                default=0,
+                help_text="The number of items at or below the low stock level.",
+                verbose_name="Low stock items",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productstock",
+            index=models.Index(fields=["-sold"], name="stock_productstock_sold_idx"),
+        ),
+        migrations.RunPython(rebuild_aggregates, migrations.RunPython.noop),
+    ]
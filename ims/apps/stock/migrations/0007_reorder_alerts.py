@@ -0,0 +1,130 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0006_inventory_summaries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReorderAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "available",
+                    models.IntegerField(
+                        help_text="The quantity that was available when raised.",
+                        verbose_name="Available",
+                    ),
+                ),
+                (
+                    "threshold",
+                    models.PositiveIntegerField(
+                        help_text="The reorder threshold in effect when raised.",
+                        verbose_name="reorder threshold",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="format: Y-m-d H:M:S",
+                        verbose_name="date alert raised",
+                    ),
+                ),
+                (
+                    "resolved_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="format: Y-m-d H:M:S",
+                        null=True,
+                        verbose_name="date alert resolved",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "reorder alert",
+                "verbose_name_plural": "reorder alerts",
+            },
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="reorder_level",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="format: not required, items of the category and its subcategories below it need reordering",
+                null=True,
+                verbose_name="reorder level",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinventory",
+            name="needs_reorder",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                help_text="Whether fewer items are available than the threshold.",
+                verbose_name="needs reorder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinventory",
+            name="reorder_level",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="format: not required, overrides the level of the categories",
+                null=True,
+                verbose_name="reorder level",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinventory",
+            name="reorder_threshold",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="The reorder level in effect, from the item or its categories.",
+                verbose_name="reorder threshold",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinventory",
+            index=models.Index(
+                condition=models.Q(("needs_reorder", True)),
+                fields=["id"],
+                name="stock_inventory_reorder_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="reorderalert",
+            name="product_inventory",
+            field=models.ForeignKey(
+                help_text="The inventory item that needs reordering.",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reorder_alerts",
+                to="stock.productinventory",
+                verbose_name="Product Inventory",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="reorderalert",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("resolved_at__isnull", True)),
+                fields=("product_inventory",),
+                name="stock_reorderalert_open_unique",
+            ),
+        ),
+    ]
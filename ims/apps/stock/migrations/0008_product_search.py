@@ -0,0 +1,81 @@
+from collections import defaultdict
+from html import unescape
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+SEARCH_TABLE = "stock_product_search"
+
+
+def create_search_index(apps, schema_editor):
+    # The index as it was first laid out, copied here rather than built
+    # with the live search module. The PostgreSQL table has no foreign key
+    # to stock_product, which would block truncating the products table.
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        create = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(name, sku, "
+            "summary, content, tokenize = 'unicode61 remove_diacritics 2')"
+            % SEARCH_TABLE
+        ]
+        insert = (
+            "INSERT INTO %s (rowid, name, sku, summary, content) "
+            "VALUES (%%s, %%s, %%s, %%s, %%s)" % SEARCH_TABLE
+        )
+    elif connection.vendor == "postgresql":
+        create = [
+            "CREATE TABLE IF NOT EXISTS %s (product_id bigint PRIMARY KEY, "
+            "document tsvector NOT NULL)" % SEARCH_TABLE,
+            "CREATE INDEX IF NOT EXISTS %s_document_idx ON %s "
+            "USING gin (document)" % (SEARCH_TABLE, SEARCH_TABLE),
+        ]
+        insert = (
+            "INSERT INTO %s (product_id, document) VALUES (%%s, "
+            "setweight(to_tsvector('simple', %%s), 'A') || "
+            "setweight(to_tsvector('simple', %%s), 'A') || "
+            "setweight(to_tsvector('simple', %%s), 'B') || "
+            "setweight(to_tsvector('simple', %%s), 'C'))" % SEARCH_TABLE
+        )
+    else:
+        return
+
+    db = connection.alias
+    Product = apps.get_model("stock", "Product")
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+    skus = defaultdict(list)
+    for product_id, sku in ProductInventory.objects.using(db).values_list(
+        "product_id", "sku"
+    ):
+        skus[product_id].append(sku)
+    documents = [
+        [
+            pk,
+            name,
+            " ".join(skus[pk]),
+            summary or "",
+            " ".join(unescape(strip_tags(content or "")).split()),
+        ]
+        for pk, name, summary, content in Product.objects.using(
+            db
+        ).values_list("pk", "name", "summary", "content")
+    ]
+    with connection.cursor() as cursor:
+        for statement in create:
+            cursor.execute(statement)
+        cursor.executemany(insert, documents)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % SEARCH_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0007_reorder_alerts"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:49
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_skus(apps, schema_editor):
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+    items = ProductInventory.objects.using(schema_editor.connection.alias)
+    skus = (
+        items.values("sku")
+        .annotate(rows=Count("pk"))
+        .filter(rows__gt=1)
+        .values_list("sku", flat=True)
+    )
+    duplicates = {}
+    for sku, pk in (
+        items.filter(sku__in=skus).order_by("sku", "pk").values_list("sku", "pk")
+    ):
+        duplicates.setdefault(sku, []).append(pk)
+    if duplicates:
+        listed = "; ".join(
+            "%s (ids %s)" % (sku, ", ".join(map(str, ids)))
+            for sku, ids in list(duplicates.items())[:20]
+        )
+        raise CommandError(
+            "%d SKUs are held by more than one inventory row: %s. Merge or "
+            "rename them before making SKUs unique; "
+            "'manage.py find_duplicate_skus' lists them all."
+            % (len(duplicates), listed)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0008_product_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_skus, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="productinventory",
+            name="sku",
+            field=models.CharField(
+                help_text="The id to identify the item on stock.",
+                max_length=100,
+                unique=True,
+                verbose_name="Stock Keeping Unit",
+            ),
+        ),
+    ]
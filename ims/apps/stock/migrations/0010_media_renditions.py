@@ -0,0 +1,35 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0009_unique_sku"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="image_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="format: sha256 of the image the renditions were made of",
+                max_length=64,
+                verbose_name="image hash",
+            ),
+        ),
+        migrations.AddField(
+            model_name="media",
+            name="renditions",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="format: rendition key -> stored file name",
+                verbose_name="renditions",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+def keep_one_feature_per_item(apps, schema_editor):
+    """
+    Items with several featured images keep the most recently updated one.
+    """
+    Media = apps.get_model("stock", "Media")
+    kept = set()
+    demoted = []
+    for pk, item_id in (
+        Media.objects.filter(is_feature=True)
+        .order_by("product_inventory_id", "-updated_at", "-pk")
+        .values_list("pk", "product_inventory_id")
+    ):
+        if item_id in kept:
+            demoted.append(pk)
+        kept.add(item_id)
+    Media.objects.filter(pk__in=demoted).update(is_feature=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0010_media_renditions"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            keep_one_feature_per_item, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="media",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_feature", True)),
+                fields=("product_inventory",),
+                name="stock_media_one_feature_per_item",
+            ),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0011_featured_media"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RejectedSale",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(
+                        help_text="The number of items that could not be sold.",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "flush_id",
+                    models.CharField(
+                        editable=False,
+                        help_text="The buffered-sales flush that rejected them.",
+                        max_length=32,
+                        verbose_name="flush id",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="format: Y-m-d H:M:S",
+                        verbose_name="date sales rejected",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "rejected sale",
+                "verbose_name_plural": "rejected sales",
+            },
+        ),
+        migrations.AddField(
+            model_name="stockmovement",
+            name="flush_id",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="The buffered-sales flush that applied the movement.",
+                max_length=32,
+                null=True,
+                verbose_name="flush id",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="stockmovement",
+            constraint=models.UniqueConstraint(
+                fields=("product_inventory", "flush_id"),
+                name="stock_stockmovement_flush_unique",
+            ),
+        ),
+        migrations.AddField(
+            model_name="rejectedsale",
+            name="product_inventory",
+            field=models.ForeignKey(
+                help_text="The inventory item the sales were made on.",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rejected_sales",
+                to="stock.productinventory",
+                verbose_name="Product Inventory",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="rejectedsale",
+            constraint=models.UniqueConstraint(
+                fields=("product_inventory", "flush_id"),
+                name="stock_rejectedsale_flush_unique",
+            ),
+        ),
+    ]
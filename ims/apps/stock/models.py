@@ -3,10 +3,19 @@ import uuid
 from ckeditor.fields import RichTextField
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import gettext_lazy as _
+from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey, TreeManyToManyField
 
 
+class CategoryManager(TreeManager):
+    def move_node(self, node, target, position="last-child"):
+        # ``move_to()`` and direct moves bypass ``Category.save``.
+        node._parent_before = node.parent_id
+        super().move_node(node, target, position)
+
+
 class Category(MPTTModel):
     """
     Inventory Category table implemented with MPTT
@@ -51,17 +60,43 @@ class Category(MPTTModel):
         verbose_name=_("parent of category"),
         help_text=_("format: not required"),
     )
+    reorder_level = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("reorder level"),
+        help_text=_(
+            "format: not required, items of the category and its "
+            "subcategories below it need reordering"
+        ),
+    )
+
+    objects = CategoryManager()
 
     class MPTTMeta:
         order_insertion_by = ["name"]
 
     class Meta:
+        indexes = [
+            # Subtree range scans; mptt's own index_together never made it
+            # into the migrations.
+            models.Index(
+                fields=["tree_id", "lft"], name="stock_category_tree_lft_idx"
+            ),
+        ]
         verbose_name = _("product category")
         verbose_name_plural = _("product categories")
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # mptt moves the node, and forgets where from, before any signal
+        # runs; the stock aggregates take its totals away from there.
+        parent_id = self._mptt_cached_fields.get("parent")
+        if parent_id not in (DeferredAttribute, self.parent_id):
+            self._parent_before = parent_id
+        super().save(*args, **kwargs)
+
 
 class ProductType(models.Model):
     """
@@ -81,6 +116,67 @@ class ProductType(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def for_serializer(self):
+        """
+        Load the relations ``ProductSerializer`` reads in a constant number
+        of queries, whatever the size of the page.
+        """
+        return (
+            self.select_related("type")
+            .prefetch_related("category")
+            .with_featured_image()
+        )
+
+    def with_featured_image(self):
+        """
+        Annotate ``featured_image_id``: the featured image of the product's
+        first inventory item that has one, from a correlated subquery on
+        the featured-image index.
+        """
+        featured = Media.objects.filter(
+            product_inventory__product=models.OuterRef("pk"), is_feature=True
+        ).order_by("product_inventory_id")
+        return self.annotate(
+            featured_image_id=models.Subquery(featured.values("pk")[:1])
+        )
+
+    def for_pages(self):
+        """
+        Only the columns keyset pagination needs; the products on the page
+        are filled in from the cached payloads.
+        """
+        return self.only("id", "name", "created_at")
+
+    def in_category(self, slug, include_descendants=False):
+        """
+        Products attached to the categories matching ``slug``.
+
+        With ``include_descendants`` the slug is resolved once and products
+        anywhere in those subtrees are matched through a single range scan
+        on ``(tree_id, lft)``, instead of an ``IN`` list of descendants.
+        """
+        categories = Category.objects.filter(slug=slug)
+        if include_descendants:
+            subtrees = models.Q()
+            for tree_id, lft, rght in categories.values_list(
+                "tree_id", "lft", "rght"
+            ):
+                subtrees |= models.Q(
+                    tree_id=tree_id, lft__gte=lft, lft__lte=rght
+                )
+            if not subtrees:
+                return self.none()
+            categories = Category.objects.filter(subtrees)
+
+        through = self.model.category.through
+        return self.filter(
+            pk__in=through.objects.filter(
+                category__in=categories.values("pk")
+            ).values("product_id")
+        )
+
+
 class Product(models.Model):
     """
     Product details table
@@ -124,6 +220,14 @@ class Product(models.Model):
         ),
     )
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["name", "id"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -173,6 +277,7 @@ class ProductInventory(models.Model):
     )
     sku = models.CharField(
         max_length=100,
+        unique=True,
         verbose_name=_("Stock Keeping Unit"),
         help_text=_("The id to identify the item on stock."),
     )
@@ -227,8 +332,44 @@ class ProductInventory(models.Model):
             "The total defective items either received at the inventory or returned by the customers."
         ),
     )
+    reorder_level = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("reorder level"),
+        help_text=_(
+            "format: not required, overrides the level of the categories"
+        ),
+    )
+    reorder_threshold = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("reorder threshold"),
+        help_text=_(
+            "The reorder level in effect, from the item or its categories."
+        ),
+    )
+    needs_reorder = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name=_("needs reorder"),
+        help_text=_("Whether fewer items are available than the threshold."),
+    )
 
     class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(available__gte=0),
+                name="stock_inventory_available_gte_0",
+            ),
+        ]
+        indexes = [
+            # Only the few items below their threshold are indexed.
+            models.Index(
+                fields=["id"],
+                condition=models.Q(needs_reorder=True),
+                name="stock_inventory_reorder_idx",
+            ),
+        ]
         verbose_name = _("Product Inventory")
         verbose_name_plural = _("Products Inventory")
 
@@ -236,6 +377,172 @@ class ProductInventory(models.Model):
         return self.product
 
 
+class StockMovement(models.Model):
+    """
+    Append-only ledger of the stock changes applied to an inventory item.
+    """
+
+    RECEIVE = "receive"
+    SELL = "sell"
+    RETURN = "return"
+    DEFECT = "defect"
+    KIND_CHOICES = (
+        (RECEIVE, _("Receive")),
+        (SELL, _("Sell")),
+        (RETURN, _("Return")),
+        (DEFECT, _("Defect")),
+    )
+
+    product_inventory = models.ForeignKey(
+        ProductInventory,
+        on_delete=models.CASCADE,
+        related_name="movements",
+        verbose_name=_("Product Inventory"),
+        help_text=_("The inventory item the movement was applied to."),
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        verbose_name=_("Kind"),
+        help_text=_("format: required, receive, sell, return or defect"),
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_("quantity"),
+        help_text=_("The number of items moved."),
+    )
+    note = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name=_("Note"),
+        help_text=_("format: not required, max-255"),
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name=_("date movement applied"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+    flush_id = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("flush id"),
+        help_text=_("The buffered-sales flush that applied the movement."),
+    )
+
+    class Meta:
+        constraints = [
+            # A flush retried after a crash finds its sales already applied.
+            models.UniqueConstraint(
+                fields=["product_inventory", "flush_id"],
+                name="stock_stockmovement_flush_unique",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["product_inventory", "created_at"]),
+        ]
+        verbose_name = _("stock movement")
+        verbose_name_plural = _("stock movements")
+
+    def __str__(self):
+        return "%s %s" % (self.kind, self.quantity)
+
+
+class ReorderAlert(models.Model):
+    """
+    An inventory item that went below its reorder threshold; at most one
+    alert per item is open at a time.
+    """
+
+    product_inventory = models.ForeignKey(
+        ProductInventory,
+        on_delete=models.CASCADE,
+        related_name="reorder_alerts",
+        verbose_name=_("Product Inventory"),
+        help_text=_("The inventory item that needs reordering."),
+    )
+    available = models.IntegerField(
+        verbose_name=_("Available"),
+        help_text=_("The quantity that was available when raised."),
+    )
+    threshold = models.PositiveIntegerField(
+        verbose_name=_("reorder threshold"),
+        help_text=_("The reorder threshold in effect when raised."),
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name=_("date alert raised"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+    resolved_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_("date alert resolved"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_inventory"],
+                condition=models.Q(resolved_at__isnull=True),
+                name="stock_reorderalert_open_unique",
+            ),
+        ]
+        verbose_name = _("reorder alert")
+        verbose_name_plural = _("reorder alerts")
+
+    def __str__(self):
+        return "%s below %s" % (self.available, self.threshold)
+
+
+class RejectedSale(models.Model):
+    """
+    Buffered sales a flush could not apply because the stock ran out in
+    the meantime; they were acknowledged, so they are kept to be refunded
+    or backordered.
+    """
+
+    product_inventory = models.ForeignKey(
+        ProductInventory,
+        on_delete=models.CASCADE,
+        related_name="rejected_sales",
+        verbose_name=_("Product Inventory"),
+        help_text=_("The inventory item the sales were made on."),
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_("quantity"),
+        help_text=_("The number of items that could not be sold."),
+    )
+    flush_id = models.CharField(
+        max_length=32,
+        editable=False,
+        verbose_name=_("flush id"),
+        help_text=_("The buffered-sales flush that rejected them."),
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name=_("date sales rejected"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_inventory", "flush_id"],
+                name="stock_rejectedsale_flush_unique",
+            ),
+        ]
+        verbose_name = _("rejected sale")
+        verbose_name_plural = _("rejected sales")
+
+    def __str__(self):
+        return "%s rejected" % self.quantity
+
+
 class Media(models.Model):
     """
     The product image table.
@@ -268,6 +575,20 @@ class Media(models.Model):
         verbose_name=_("product default image"),
         help_text=_("format: default=false, true=default image"),
     )
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name=_("image hash"),
+        help_text=_("format: sha256 of the image the renditions were made of"),
+    )
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("renditions"),
+        help_text=_("format: rendition key -> stored file name"),
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         editable=False,
@@ -281,6 +602,13 @@ class Media(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_inventory"],
+                condition=models.Q(is_feature=True),
+                name="stock_media_one_feature_per_item",
+            ),
+        ]
         verbose_name = _("product image")
         verbose_name_plural = _("product images")
 
@@ -352,3 +680,121 @@ class Supplier(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class StockTotals(models.Model):
+    """
+    Running inventory totals, kept up to date on every inventory change.
+    """
+
+    quantity = models.BigIntegerField(
+        default=0,
+        verbose_name=_("quantity"),
+        help_text=_("The total quantity received at the inventory."),
+    )
+    sold = models.BigIntegerField(
+        default=0,
+        verbose_name=_("sold"),
+        help_text=_("The total quantity sold to the customers."),
+    )
+    available = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Available"),
+        help_text=_("The quantity that is available on the stock."),
+    )
+    defective = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Defective"),
+        help_text=_("The total defective items."),
+    )
+    low_stock = models.IntegerField(
+        default=0,
+        verbose_name=_("Low stock items"),
+        help_text=_("The number of items at or below the low stock level."),
+    )
+    stock_value = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("Stock value"),
+        help_text=_("The price times the available quantity of every item."),
+    )
+
+    class Meta:
+        abstract = True
+
+
+class ProductStock(StockTotals):
+    """
+    Stock totals of a product across all of its inventory items.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stock",
+        verbose_name=_("Product"),
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-sold"], name="stock_productstock_sold_idx"),
+        ]
+        verbose_name = _("product stock")
+        verbose_name_plural = _("product stock")
+
+
+class CategoryStock(StockTotals):
+    """
+    Stock totals of every product in a category or any of its descendants,
+    each product counted once.
+    """
+
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stock",
+        verbose_name=_("Category"),
+    )
+
+    class Meta:
+        verbose_name = _("category stock")
+        verbose_name_plural = _("category stock")
+
+
+class BrandStock(StockTotals):
+    """
+    Stock totals of every inventory item of a brand.
+    """
+
+    brand = models.OneToOneField(
+        Brand,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stock",
+        verbose_name=_("Brand"),
+    )
+
+    class Meta:
+        verbose_name = _("brand stock")
+        verbose_name_plural = _("brand stock")
+
+
+class SupplierStock(StockTotals):
+    """
+    Stock totals of every inventory item of a supplier.
+    """
+
+    supplier = models.OneToOneField(
+        Supplier,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stock",
+        verbose_name=_("Supplier"),
+    )
+
+    class Meta:
+        verbose_name = _("supplier stock")
+        verbose_name_plural = _("supplier stock")
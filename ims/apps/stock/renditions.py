@@ -0,0 +1,187 @@
+import hashlib
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .cache import bump_version, invalidate_tags
+from .models import Media
+
+RENDITION_DIR = "renditions"
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+
+def rendition_keys():
+    """
+    ``"<name>.<format>"`` for every configured size and format, e.g.
+    ``"thumb.webp"``.
+    """
+    return [
+        "%s.%s" % (name, image_format)
+        for name in settings.STOCK_MEDIA_RENDITIONS
+        for image_format in settings.STOCK_MEDIA_RENDITION_FORMATS
+    ]
+
+
+def parse_key(key):
+    name, _, image_format = key.partition(".")
+    if (
+        name not in settings.STOCK_MEDIA_RENDITIONS
+        or image_format not in settings.STOCK_MEDIA_RENDITION_FORMATS
+    ):
+        raise KeyError(key)
+    return settings.STOCK_MEDIA_RENDITIONS[name], image_format
+
+
+def rendition_name(image_hash, key):
+    """
+    The storage name of a rendition: derived from the source content and
+    the rendition size, so it can be cached forever and never collides.
+    """
+    (width, height), image_format = parse_key(key)
+    name = key.partition(".")[0]
+    return posixpath.join(
+        RENDITION_DIR,
+        image_hash[:2],
+        "%s-%s-%dx%d.%s"
+        % (image_hash[:16], name, width, height, EXTENSIONS[image_format]),
+    )
+
+
+def render(data, size, image_format):
+    """
+    ``data`` scaled down to fit ``size``, encoded as ``image_format``.
+
+    A plain function of bytes, so it can run in a worker process.
+    """
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail(size, Image.LANCZOS)
+        if image_format == "jpeg":
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        out = BytesIO()
+        image.save(out, image_format, quality=82, optimize=True)
+    return out.getvalue()
+
+
+def render_all(data, sizes):
+    """
+    ``{key: bytes}`` for ``sizes``, a list of ``(key, size, format)``.
+    """
+    return {
+        key: render(data, size, image_format)
+        for key, size, image_format in sizes
+    }
+
+
+def read_source(media):
+    with media.image.open("rb") as stream:
+        data = stream.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def prepare(media, keys=None):
+    """
+    Read the image of ``media`` and work out which of ``keys`` (all by
+    default) still need rendering; files already stored for an identical
+    image are reused as they are. Returns ``None`` when nothing is missing.
+    """
+    data, image_hash = read_source(media)
+    done = media.renditions if media.image_hash == image_hash else {}
+    storage = media.image.storage
+    sizes, found = [], {}
+    for key in rendition_keys() if keys is None else keys:
+        if key in done:
+            continue
+        name = rendition_name(image_hash, key)
+        if storage.exists(name):
+            found[key] = name
+        else:
+            size, image_format = parse_key(key)
+            sizes.append((key, size, image_format))
+    if not sizes and not found and media.image_hash == image_hash:
+        return None
+    return data, image_hash, sizes, found
+
+
+def store(media, image_hash, rendered, found):
+    """
+    Save the ``rendered`` files and record them on ``media`` along with the
+    ``found`` ones.
+    """
+    storage = media.image.storage
+    renditions = dict(
+        media.renditions if media.image_hash == image_hash else {}
+    )
+    renditions.update(found)
+    for key, content in rendered.items():
+        name = rendition_name(image_hash, key)
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(content))
+        renditions[key] = name
+    # ``update`` rather than ``save``, so the upload signals stay quiet; a
+    # row whose image was replaced meanwhile is left alone.
+    Media.objects.filter(pk=media.pk, image=media.image.name).update(
+        image_hash=image_hash, renditions=renditions
+    )
+    media.image_hash, media.renditions = image_hash, renditions
+    if media.is_feature:
+        # Product payloads show the renditions of their featured image.
+        invalidate_tags(["product:%s" % media.product_inventory.product_id])
+        bump_version("media")
+
+
+def generate_renditions(media, keys=None):
+    """
+    Render the missing ``keys`` (all by default) of one ``Media`` in this
+    process; returns its ``{key: name}`` map.
+    """
+    job = prepare(media, keys)
+    if job is not None:
+        data, image_hash, sizes, found = job
+        store(media, image_hash, render_all(data, sizes), found)
+    return media.renditions
+
+
+def generate_all_renditions(media, workers=None, batch_size=32):
+    """
+    Render every missing rendition of the ``media`` queryset, with the
+    Pillow work spread over a pool of ``workers`` processes, ``batch_size``
+    images at a time; ``workers=0`` renders in this process. Returns the
+    number of images updated.
+    """
+    pool = ProcessPoolExecutor(workers) if workers != 0 else None
+    render_map = map if pool is None else pool.map
+    jobs = (
+        (item, prepare(item)) for item in media.iterator(chunk_size=batch_size)
+    )
+    jobs = ((item, job) for item, job in jobs if job is not None)
+    updated = 0
+    try:
+        while True:
+            batch = list(islice(jobs, batch_size))
+            if not batch:
+                return updated
+            rendered = render_map(
+                render_all,
+                [job[0] for _, job in batch],
+                [job[2] for _, job in batch],
+            )
+            for (item, job), files in zip(batch, rendered):
+                store(item, job[1], files, job[3])
+            updated += len(batch)
+    finally:
+        if pool is not None:
+            pool.shutdown()
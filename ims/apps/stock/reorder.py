@@ -0,0 +1,196 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Category, Product, ProductInventory, ReorderAlert
+
+
+def reorder_categories():
+    """
+    ``[(tree_id, lft, rght, reorder_level)]`` of the categories that set a
+    reorder level; there are few, so they are matched in Python.
+    """
+    return list(
+        Category.objects.filter(reorder_level__isnull=False).values_list(
+            "tree_id", "lft", "rght", "reorder_level"
+        )
+    )
+
+
+def category_levels(product_ids, levelled=None):
+    """
+    ``{product_id: level}``, the highest reorder level set on any category
+    of each product or on any of their ancestors.
+    """
+    if levelled is None:
+        levelled = reorder_categories()
+    if not levelled or not product_ids:
+        return {}
+    by_tree = defaultdict(list)
+    for tree_id, lft, rght, level in levelled:
+        by_tree[tree_id].append((lft, rght, level))
+
+    levels = {}
+    memberships = Product.category.through.objects.filter(
+        product_id__in=list(product_ids)
+    ).values_list(
+        "product_id", "category__tree_id", "category__lft", "category__rght"
+    )
+    for product_id, tree_id, lft, rght in memberships:
+        for a_lft, a_rght, level in by_tree[tree_id]:
+            if a_lft <= lft and a_rght >= rght:
+                levels[product_id] = max(levels.get(product_id, 0), level)
+    return levels
+
+
+def set_threshold(item, levels):
+    """
+    Work out the threshold and flag of an unsaved ``item``; returns
+    whether the flag changed.
+    """
+    if item.reorder_level is not None:
+        item.reorder_threshold = item.reorder_level
+    else:
+        item.reorder_threshold = levels.get(item.product_id, 0)
+    was = item.needs_reorder
+    item.needs_reorder = item.available < item.reorder_threshold
+    return item.needs_reorder != was
+
+
+def check_item(item):
+    """
+    Flag or clear a saved ``item`` right after its available count changed,
+    raising or resolving its alert on a crossing.
+    """
+    below = item.available < item.reorder_threshold
+    if below == item.needs_reorder:
+        return
+    ProductInventory.objects.filter(pk=item.pk).update(needs_reorder=below)
+    item.needs_reorder = below
+    flags_changed()
+    if below:
+        raise_alerts([item.pk])
+    else:
+        resolve_alerts([item.pk])
+
+
+def flags_changed():
+    """
+    Mark the low-stock figures built on ``needs_reorder`` stale, now and
+    once the flags are committed.
+    """
+    bump_version("reorder")
+    transaction.on_commit(lambda: bump_version("reorder"))
+
+
+def raise_alerts(inventory_ids):
+    """
+    Open an alert for each item that has none open yet; the partial unique
+    constraint drops duplicates from concurrent writers and rescans.
+    """
+    ReorderAlert.objects.bulk_create(
+        (
+            ReorderAlert(
+                product_inventory_id=pk, available=available, threshold=level
+            )
+            for pk, available, level in ProductInventory.objects.filter(
+                ~Exists(
+                    ReorderAlert.objects.filter(
+                        product_inventory=OuterRef("pk"),
+                        resolved_at__isnull=True,
+                    )
+                ),
+                pk__in=list(inventory_ids),
+                needs_reorder=True,
+            ).values_list("pk", "available", "reorder_threshold")
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def resolve_alerts(inventory_ids):
+    ReorderAlert.objects.filter(
+        product_inventory_id__in=list(inventory_ids), resolved_at__isnull=True
+    ).update(resolved_at=timezone.now())
+
+
+def sync_flags(items):
+    """
+    Bring the flags and alerts of the ``items`` queryset in line with their
+    thresholds; returns the ids flagged and cleared.
+    """
+    crossed = list(
+        items.filter(
+            needs_reorder=False, available__lt=F("reorder_threshold")
+        ).values_list("pk", flat=True)
+    )
+    cleared = list(
+        items.filter(
+            needs_reorder=True, available__gte=F("reorder_threshold")
+        ).values_list("pk", flat=True)
+    )
+    if crossed:
+        ProductInventory.objects.filter(pk__in=crossed).update(
+            needs_reorder=True
+        )
+    if cleared:
+        ProductInventory.objects.filter(pk__in=cleared).update(
+            needs_reorder=False
+        )
+        resolve_alerts(cleared)
+    if crossed or cleared:
+        flags_changed()
+    # Also re-raises alerts for flagged items that lost theirs.
+    raise_alerts(items.filter(needs_reorder=True).values_list("pk", flat=True))
+    return crossed, cleared
+
+
+def refresh_thresholds(items, levelled=None):
+    """
+    Recompute the threshold of every item in the ``items`` queryset from
+    its own and its categories' reorder levels, then sync the flags.
+    """
+    with transaction.atomic():
+        product_ids = set(items.values_list("product_id", flat=True))
+        levels = category_levels(product_ids, levelled)
+
+        items.filter(reorder_level__isnull=False).exclude(
+            reorder_threshold=F("reorder_level")
+        ).update(reorder_threshold=F("reorder_level"))
+        by_level = defaultdict(list)
+        for product_id in product_ids:
+            by_level[levels.get(product_id, 0)].append(product_id)
+        for level, ids in by_level.items():
+            items.filter(
+                reorder_level__isnull=True, product_id__in=ids
+            ).exclude(reorder_threshold=level).update(reorder_threshold=level)
+        return sync_flags(items)
+
+
+def scan_reorder_levels(chunk_size=1000):
+    """
+    Walk the whole inventory in primary key order, one chunk at a time,
+    and fix any threshold, flag or alert the write-time hooks missed.
+    """
+    levelled = reorder_categories()
+    flagged = cleared = 0
+    last = 0
+    while True:
+        ids = list(
+            ProductInventory.objects.filter(pk__gt=last)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        crossed, resolved = refresh_thresholds(
+            ProductInventory.objects.filter(pk__gt=last, pk__lte=ids[-1]),
+            levelled,
+        )
+        flagged += len(crossed)
+        cleared += len(resolved)
+        last = ids[-1]
+    return flagged, cleared
@@ -0,0 +1,134 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+PIN_COOKIE = "db_primary_until"
+
+# The routing state of the request being served, if any.
+_request = ContextVar("stock_replica_request", default=None)
+_primary = ContextVar("stock_replica_primary", default=False)
+
+
+class RequestRouting:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Send every read in the block to the primary.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def replicas_caught_up(changed_at):
+    """
+    Whether the replicas hold a change made at the ``changed_at``
+    timestamp; they are taken to catch up within
+    ``DATABASE_REPLICA_PIN_SECONDS``, the bound the pin cookie relies on.
+    """
+    return time.time() - changed_at >= settings.DATABASE_REPLICA_PIN_SECONDS
+
+
+@contextmanager
+def read_current(changed_at):
+    """
+    Send the reads in the block to the primary while the replicas may still
+    lag behind a change made at ``changed_at``, for data that is cached or
+    validated under the versions current now.
+    """
+    if replicas_caught_up(changed_at):
+        yield
+    else:
+        with read_from_primary():
+            yield
+
+
+class ReplicaRouter:
+    """
+    Reads made by the views in ``DATABASE_REPLICA_VIEWS`` go to one of the
+    ``DATABASE_REPLICAS``; everything else, and every write, goes to the
+    primary. Once a request writes, its remaining reads stay on the primary,
+    and ``ReplicaMiddleware`` keeps the client there for
+    ``DATABASE_REPLICA_PIN_SECONDS`` so it reads its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            not replicas
+            or state is None
+            or not state.replica_reads
+            or state.pinned
+            or _primary.get()
+            # Reads inside a transaction must see its uncommitted writes.
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """
+    Tracks the routing state of each request for ``ReplicaRouter``: whether
+    its view may read from a replica, and whether the client wrote recently
+    enough that it must not.
+    """
+
+    def process_request(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        _request.set(RequestRouting(pinned))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request.get()
+        view = getattr(view_func, "view_class", view_func)
+        if state is not None:
+            state.replica_reads = view.__module__.startswith(
+                tuple(settings.DATABASE_REPLICA_VIEWS)
+            )
+
+    def process_response(self, request, response):
+        state = _request.get()
+        _request.set(None)
+        if state is not None and state.wrote:
+            seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE,
+                "%d" % (time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
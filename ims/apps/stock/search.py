@@ -0,0 +1,238 @@
+import re
+from collections import defaultdict
+from html import unescape
+
+from django.apps import apps as global_apps
+from django.db import connection
+from django.utils.html import strip_tags
+
+SEARCH_TABLE = "stock_product_search"
+SEARCH_FIELDS = ("name", "sku", "summary", "content")
+TOKEN_RE = re.compile(r"\w+")
+
+
+def plain_text(html):
+    """
+    The words of a ckeditor field, without its markup or entities.
+    """
+    return " ".join(unescape(strip_tags(html or "")).split())
+
+
+def tokens(query, limit=8):
+    return TOKEN_RE.findall(query.lower())[:limit]
+
+
+class SQLiteSearchBackend:
+    """
+    An FTS5 table keyed by product id, ranked with ``bm25`` so matches in
+    the name and SKUs weigh more than matches in the description.
+    """
+
+    weights = (10.0, 10.0, 3.0, 1.0)
+
+    def create(self, cursor):
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+            % (SEARCH_TABLE, ", ".join(SEARCH_FIELDS))
+        )
+
+    def drop(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS %s" % SEARCH_TABLE)
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM %s" % SEARCH_TABLE)
+
+    def replace(self, cursor, documents):
+        self.remove(cursor, [pk for pk, _ in documents])
+        cursor.executemany(
+            "INSERT INTO %s (rowid, %s) VALUES (%%s, %%s, %%s, %%s, %%s)"
+            % (SEARCH_TABLE, ", ".join(SEARCH_FIELDS)),
+            [
+                [pk] + [document[field] for field in SEARCH_FIELDS]
+                for pk, document in documents
+            ],
+        )
+
+    def remove(self, cursor, product_ids):
+        cursor.executemany(
+            "DELETE FROM %s WHERE rowid = %%s" % SEARCH_TABLE,
+            [[pk] for pk in product_ids],
+        )
+
+    def search(self, cursor, terms, limit):
+        match = " ".join('"%s"*' % term for term in terms)
+        cursor.execute(
+            "SELECT rowid FROM %s WHERE %s MATCH %%s "
+            "ORDER BY bm25(%s, %s) LIMIT %%s"
+            % (
+                SEARCH_TABLE,
+                SEARCH_TABLE,
+                SEARCH_TABLE,
+                ", ".join(map(str, self.weights)),
+            ),
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLSearchBackend:
+    """
+    A ``tsvector`` column with a GIN index, weighted A for the name and
+    SKUs, B for the summary and C for the description.
+
+    The table has no foreign key to ``stock_product``, which would stop
+    Django from truncating the products table when tests flush it; rows
+    of deleted products are removed by the ``post_delete`` signal.
+    """
+
+    config = "simple"
+    weights = {"name": "A", "sku": "A", "summary": "B", "content": "C"}
+
+    def create(self, cursor):
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS %s ("
+            "product_id bigint PRIMARY KEY, "
+            "document tsvector NOT NULL)" % SEARCH_TABLE
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS %s_document_idx ON %s "
+            "USING gin (document)" % (SEARCH_TABLE, SEARCH_TABLE)
+        )
+
+    def drop(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS %s" % SEARCH_TABLE)
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM %s" % SEARCH_TABLE)
+
+    def replace(self, cursor, documents):
+        vector = " || ".join(
+            "setweight(to_tsvector('%s', %%s), '%s')" % (self.config, weight)
+            for weight in self.weights.values()
+        )
+        cursor.executemany(
+            "INSERT INTO %s (product_id, document) VALUES (%%s, %s) "
+            "ON CONFLICT (product_id) DO UPDATE "
+            "SET document = EXCLUDED.document" % (SEARCH_TABLE, vector),
+            [
+                [pk] + [document[field] for field in self.weights]
+                for pk, document in documents
+            ],
+        )
+
+    def remove(self, cursor, product_ids):
+        cursor.execute(
+            "DELETE FROM %s WHERE product_id = ANY(%%s)" % SEARCH_TABLE,
+            [list(product_ids)],
+        )
+
+    def search(self, cursor, terms, limit):
+        query = " & ".join("%s:*" % term for term in terms)
+        cursor.execute(
+            "SELECT product_id FROM %s, to_tsquery('%s', %%s) query "
+            "WHERE document @@ query "
+            "ORDER BY ts_rank(document, query) DESC, product_id LIMIT %%s"
+            % (SEARCH_TABLE, self.config),
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(conn=connection):
+    backend = SEARCH_BACKENDS.get(conn.vendor)
+    return backend() if backend is not None else None
+
+
+def product_documents(product_ids, apps=global_apps):
+    """
+    ``[(product_id, {field: text})]`` for the given products, with their
+    SKUs joined and the markup stripped from the description.
+    """
+    Product = apps.get_model("stock", "Product")
+    ProductInventory = apps.get_model("stock", "ProductInventory")
+
+    skus = defaultdict(list)
+    for product_id, sku in ProductInventory.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "sku"):
+        skus[product_id].append(sku)
+    return [
+        (
+            pk,
+            {
+                "name": name,
+                "sku": " ".join(skus[pk]),
+                "summary": summary or "",
+                "content": plain_text(content),
+            },
+        )
+        for pk, name, summary, content in Product.objects.filter(
+            pk__in=product_ids
+        ).values_list("pk", "name", "summary", "content")
+    ]
+
+
+def index_products(product_ids, apps=global_apps):
+    """
+    (Re)index the given products; ids of deleted products are dropped.
+    """
+    backend = get_search_backend()
+    product_ids = list(set(product_ids))
+    if backend is None or not product_ids:
+        return
+    documents = product_documents(product_ids, apps)
+    with connection.cursor() as cursor:
+        backend.remove(cursor, set(product_ids) - {pk for pk, _ in documents})
+        backend.replace(cursor, documents)
+
+
+def unindex_products(product_ids):
+    backend = get_search_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, list(product_ids))
+
+
+def rebuild_search_index(apps=global_apps, batch_size=2000):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    Product = apps.get_model("stock", "Product")
+    with connection.cursor() as cursor:
+        backend.create(cursor)
+        backend.clear(cursor)
+    ids = Product.objects.values_list("pk", flat=True).order_by("pk")
+    batch = []
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) == batch_size:
+            index_products(batch, apps)
+            batch = []
+    index_products(batch, apps)
+
+
+def search_products(query, limit=20):
+    """
+    Ids of the products matching every word of ``query`` as a prefix, best
+    match first.
+    """
+    terms = tokens(query)
+    if not terms:
+        return []
+    backend = get_search_backend()
+    if backend is None:
+        Product = global_apps.get_model("stock", "Product")
+        return list(
+            Product.objects.filter(name__icontains=" ".join(terms))
+            .order_by("name")
+            .values_list("pk", flat=True)[:limit]
+        )
+    with connection.cursor() as cursor:
+        return backend.search(cursor, terms, limit)
@@ -0,0 +1,392 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from .aggregates import (
+    CategoryLineage,
+    StockDeltas,
+    move_categories,
+    move_product_categories,
+    snapshot,
+)
+from .cache import (
+    bump_version,
+    invalidate_category_tree,
+    invalidate_skus,
+    invalidate_tags,
+)
+from .models import (
+    Brand,
+    BrandStock,
+    Category,
+    CategoryStock,
+    Media,
+    Product,
+    ProductInventory,
+    ProductStock,
+    Supplier,
+    SupplierStock,
+)
+from .reorder import (
+    category_levels,
+    raise_alerts,
+    refresh_thresholds,
+    resolve_alerts,
+    set_threshold,
+)
+from .search import index_products, unindex_products
+from .tasks import schedule_renditions
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def category_changed(sender, **kwargs):
+    # Drop the tree now and again once the transaction commits, so a reader
+    # that cached the old rows while we were still writing does not win.
+    invalidate_category_tree()
+    transaction.on_commit(invalidate_category_tree)
+    bump_version("category")
+    transaction.on_commit(lambda: bump_version("category"))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(m2m_changed, sender=Product.category.through)
+def product_changed(sender, **kwargs):
+    bump_version("product")
+    transaction.on_commit(lambda: bump_version("product"))
+
+
+def retire_tags(*tags):
+    # Now and again on commit, as for the versions above.
+    invalidate_tags(tags)
+    transaction.on_commit(lambda: invalidate_tags(tags))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_payload_changed(sender, instance, **kwargs):
+    retire_tags("product:%s" % instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def product_categories_payload_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith("post_"):
+            retire_tags("product:%s" % instance.pk)
+    elif action == "pre_clear":
+        # The cleared products are only known before the clear.
+        retire_tags(
+            *(
+                "product:%s" % pk
+                for pk in Product.objects.filter(
+                    category=instance
+                ).values_list("pk", flat=True)
+            )
+        )
+    elif action.startswith("post_") and pk_set:
+        retire_tags(*("product:%s" % pk for pk in pk_set))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def category_payload_changed(sender, instance, **kwargs):
+    retire_tags("category:%s" % instance.pk)
+
+
+@receiver(post_save, sender=Media)
+@receiver(post_delete, sender=Media)
+def featured_image_changed(sender, instance, raw=False, **kwargs):
+    bump_version("media")
+    transaction.on_commit(lambda: bump_version("media"))
+    if not raw:
+        retire_product_of(instance.product_inventory_id)
+
+
+def retire_product_of(inventory_id):
+    product_id = (
+        ProductInventory.objects.filter(pk=inventory_id)
+        .values_list("product_id", flat=True)
+        .first()
+    )
+    if product_id is not None:
+        retire_tags("product:%s" % product_id)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def brand_payload_changed(sender, instance, **kwargs):
+    retire_tags("brand:%s" % instance.pk)
+    bump_version("brand")
+    transaction.on_commit(lambda: bump_version("brand"))
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def supplier_payload_changed(sender, instance, **kwargs):
+    retire_tags("supplier:%s" % instance.pk)
+    bump_version("supplier")
+    transaction.on_commit(lambda: bump_version("supplier"))
+
+
+@receiver(post_save, sender=Product)
+def product_saved_for_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted_for_search(sender, instance, **kwargs):
+    unindex_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductInventory)
+@receiver(post_delete, sender=ProductInventory)
+def inventory_changed_for_search(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_stock_before", None)
+    product_ids = {instance.product_id}
+    if before is not None:
+        product_ids.add(before[0][0])
+    index_products(product_ids)
+
+
+@receiver(post_save, sender=ProductInventory)
+@receiver(post_delete, sender=ProductInventory)
+def inventory_skus_changed(sender, instance, **kwargs):
+    bump_version("sku")
+    transaction.on_commit(lambda: bump_version("sku"))
+    skus = {instance.sku, getattr(instance, "_sku_before", instance.sku)}
+    invalidate_skus(skus)
+    transaction.on_commit(lambda: invalidate_skus(skus))
+
+
+@receiver(post_save, sender=Product)
+def create_product_stock(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProductStock.objects.get_or_create(product=instance)
+
+
+@receiver(post_save, sender=Category)
+def create_category_stock(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CategoryStock.objects.get_or_create(category=instance)
+
+
+@receiver(post_save, sender=Brand)
+def create_brand_stock(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        BrandStock.objects.get_or_create(brand=instance)
+
+
+@receiver(post_save, sender=Supplier)
+def create_supplier_stock(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        SupplierStock.objects.get_or_create(supplier=instance)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, origin=None, **kwargs):
+    lineage = CategoryLineage()
+    if isinstance(origin, QuerySet):
+        # The categories a queryset delete protects go with it, so its rows
+        # are whole subtrees; work them out on the first signal, while all
+        # of them are still there.
+        if getattr(origin, "_stock_moved", False):
+            return
+        origin._stock_moved = True
+        deleted = set(origin.values_list("pk", flat=True))
+    elif origin is None or origin is instance:
+        # The node and everything under it, which mptt deletes along.
+        deleted = lineage.subtree(instance.pk)
+    else:
+        return
+    # The deleted categories' own totals go with them; take their products
+    # out of the categories above that they no longer reach.
+    product_ids = set(
+        Product.category.through.objects.filter(
+            category_id__in=deleted
+        ).values_list("product_id", flat=True)
+    )
+    before = {
+        pk: categories - deleted
+        for pk, categories in lineage.products(product_ids).items()
+    }
+    move_categories(before, lineage.products(product_ids, exclude=deleted))
+
+
+@receiver(node_moved, sender=Category)
+def category_tree_changed(sender, instance, **kwargs):
+    # ``Category.save`` and ``CategoryManager.move_node`` record where the
+    # node was.
+    old_parent_id = getattr(instance, "_parent_before", instance.parent_id)
+    instance._parent_before = instance.parent_id
+    if old_parent_id == instance.parent_id:
+        # Reordered among its siblings; no category gained or lost it.
+        return
+    before = CategoryLineage()
+    before.parents[instance.pk] = old_parent_id
+    after = before.moved(instance.pk, instance.parent_id)
+    product_ids = set(
+        Product.category.through.objects.filter(
+            category_id__in=before.subtree(instance.pk)
+        ).values_list("product_id", flat=True)
+    )
+    move_categories(before.products(product_ids), after.products(product_ids))
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # The category memberships go before the inventory items do, so take
+    # the product out of its categories while they are still known.
+    move_product_categories(instance.pk, -1)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def product_categories_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if reverse:
+        if action.startswith("pre_"):
+            if action == "pre_clear":
+                pk_set = Product.objects.filter(category=instance).values_list(
+                    "pk", flat=True
+                )
+            instance._stock_members = CategoryLineage().products(
+                set(pk_set or ())
+            )
+        elif action.startswith("post_"):
+            before = getattr(instance, "_stock_members", {})
+            instance._stock_members = {}
+            move_categories(before, CategoryLineage().products(before))
+    elif action.startswith("pre_"):
+        move_product_categories(instance.pk, -1)
+    elif action.startswith("post_"):
+        move_product_categories(instance.pk, 1)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def product_reorder_levels_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # A cleared category no longer knows its products; the scanner
+        # picks those up.
+        items = ProductInventory.objects.filter(product_id__in=pk_set or [])
+    else:
+        items = ProductInventory.objects.filter(product_id=instance.pk)
+    refresh_thresholds(items)
+
+
+def category_items(category):
+    return ProductInventory.objects.filter(
+        product_id__in=Product.category.through.objects.filter(
+            category__in=category.get_descendants(include_self=True)
+        ).values("product_id")
+    )
+
+
+@receiver(pre_save, sender=Category)
+def remember_reorder_level(sender, instance, raw=False, **kwargs):
+    instance._reorder_level_before = None
+    if instance.pk and not raw:
+        instance._reorder_level_before = (
+            Category.objects.filter(pk=instance.pk)
+            .values_list("reorder_level", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Category)
+def category_reorder_level_changed(
+    sender, instance, created, raw=False, **kwargs
+):
+    before = getattr(instance, "_reorder_level_before", None)
+    if not created and not raw and instance.reorder_level != before:
+        refresh_thresholds(category_items(instance))
+
+
+@receiver(node_moved, sender=Category)
+def category_moved(sender, instance, **kwargs):
+    refresh_thresholds(category_items(instance))
+
+
+@receiver(pre_save, sender=ProductInventory)
+def remember_inventory(sender, instance, raw=False, **kwargs):
+    instance._stock_before = None
+    instance._reorder_before = False
+    instance._sku_before = instance.sku
+    if instance.pk and not raw:
+        previous = ProductInventory.objects.filter(pk=instance.pk).first()
+        if previous is not None:
+            instance._stock_before = snapshot(previous)
+            instance._reorder_before = previous.needs_reorder
+            instance._sku_before = previous.sku
+
+
+@receiver(pre_save, sender=ProductInventory)
+def set_inventory_threshold(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    set_threshold(instance, category_levels([instance.product_id]))
+    instance._reorder_crossed = instance.needs_reorder != getattr(
+        instance, "_reorder_before", False
+    )
+
+
+@receiver(post_save, sender=ProductInventory)
+def inventory_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = StockDeltas()
+    deltas.change(getattr(instance, "_stock_before", None), snapshot(instance))
+    deltas.apply()
+    if getattr(instance, "_reorder_crossed", False):
+        if instance.needs_reorder:
+            raise_alerts([instance.pk])
+        else:
+            resolve_alerts([instance.pk])
+
+
+@receiver(post_delete, sender=ProductInventory)
+def inventory_deleted(sender, instance, **kwargs):
+    deltas = StockDeltas()
+    deltas.change(snapshot(instance), None)
+    deltas.apply()
+
+
+@receiver(pre_save, sender=Media)
+def media_image_replaced(sender, instance, raw=False, **kwargs):
+    instance._image_changed = not instance.pk
+    if instance.pk and not raw:
+        previous = (
+            Media.objects.filter(pk=instance.pk)
+            .values_list("image", flat=True)
+            .first()
+        )
+        if previous != instance.image.name:
+            instance._image_changed = True
+            instance.image_hash = ""
+            instance.renditions = {}
+
+
+@receiver(post_save, sender=Media)
+def media_uploaded(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, "_image_changed", False):
+        pk = instance.pk
+        transaction.on_commit(lambda: schedule_renditions(pk))
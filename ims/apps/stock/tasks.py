@@ -0,0 +1,45 @@
+import logging
+
+from celery import shared_task
+from kombu.exceptions import OperationalError
+
+from .counters import flush_counters, get_counter_store
+from .models import Media
+from .renditions import generate_renditions
+from .reorder import scan_reorder_levels
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def flush_stock_counters(self):
+    if not self.request.called_directly and not get_counter_store().shared:
+        # The local store is flushed by the processes that buffered the
+        # sales; this worker has none.
+        return {"applied": {}, "rejected": {}}
+    applied, rejected = flush_counters()
+    return {"applied": applied, "rejected": rejected}
+
+
+@shared_task
+def scan_reorder_alerts(chunk_size=1000):
+    flagged, cleared = scan_reorder_levels(chunk_size)
+    return {"flagged": flagged, "cleared": cleared}
+
+
+@shared_task
+def render_media_renditions(media_id):
+    media = Media.objects.filter(pk=media_id).first()
+    if media is not None:
+        return generate_renditions(media)
+
+
+def schedule_renditions(media_id):
+    """
+    Queue the renditions of a freshly uploaded image; without a broker they
+    are left to be generated on first request.
+    """
+    try:
+        render_media_renditions.delay(media_id)
+    except OperationalError:
+        logger.warning("Could not queue renditions of media %s", media_id)
@@ -1,3 +1,2138 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from apps.stock.api.fragments import (
+    load_categories,
+    load_products,
+    product_fragments,
+)
+from apps.stock.api.renderers import ORJSONRenderer
+from apps.stock.api.serializer import CategorySerializer, ProductSerializer
+from apps.stock.autocomplete import autocomplete_index
+from apps.stock.cache import object_key
+from apps.stock.checks import check_shared_cache
+from apps.stock.counters import (
+    LocalCounterStore,
+    flush_counters,
+    get_counter_store,
+)
+from apps.stock.facets import facet_index
+from apps.stock.importer import COPY_INVENTORY_DEFAULTS, COPY_INVENTORY_VALUES
+from apps.stock.inventory import apply_movement
+from apps.stock.models import (
+    Brand,
+    Category,
+    CategoryStock,
+    Media,
+    Product,
+    ProductInventory,
+    ProductStock,
+    ProductType,
+    RejectedSale,
+    ReorderAlert,
+    StockMovement,
+    Supplier,
+)
+from apps.stock.routers import PIN_COOKIE
+from apps.stock.tasks import (
+    flush_stock_counters,
+    render_media_renditions,
+    scan_reorder_alerts,
+)
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    connection,
+    connections,
+    router,
+    transaction,
+)
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+
+def make_category(name, parent=None):
+    return Category.objects.create(
+        name=name, slug=name.lower(), content=name, parent=parent
+    )
+
+
+def make_product(name, *categories, product_type=None):
+    product = Product.objects.create(
+        name=name,
+        slug=name.lower(),
+        type=product_type,
+        content="<p>%s</p>" % name,
+    )
+    product.category.set(categories)
+    return product
+
+
+def make_supplier(name):
+    index = Supplier.objects.count()
+    return Supplier.objects.create(
+        name=name,
+        mobile_number="01%08d" % index,
+        email="supplier%d@example.com" % index,
+        other_details="",
+    )
+
+
+def make_inventory(product, sku, brand, supplier, **fields):
+    fields.setdefault("mrp", 10.0)
+    fields.setdefault("price", "8.00")
+    fields.setdefault("defective", 0)
+    return ProductInventory.objects.create(
+        product=product, sku=sku, brand=brand, supplier=supplier, **fields
+    )
+
+
+def make_user(superuser=True, **fields):
+    index = get_user_model().objects.count()
+    email = fields.pop("email", "staff%d@example.com" % index)
+    fields.setdefault("username", "staff%d" % index)
+    fields.setdefault("first_name", "Staff")
+    fields.setdefault("mobile_number", "01%08d" % index)
+    fields.setdefault("is_active", True)
+    create = (
+        get_user_model().objects.create_superuser
+        if superuser
+        else get_user_model().objects.create_user
+    )
+    return create(email, "password", **fields)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category("Phones")
+        cls.products = [
+            make_product("Product %02d" % i, cls.category) for i in range(12)
+        ]
+
+    def walk(self, url):
+        ids, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            queries.extend(q["sql"] for q in ctx.captured_queries)
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        return ids, queries
+
+    def test_pages_cover_every_product_once(self):
+        url = reverse("products_api") + "?page_size=5"
+        ids, queries = self.walk(url)
+        self.assertEqual(ids, [p.id for p in self.products])
+        for sql in queries:
+            self.assertNotIn("COUNT(", sql.upper())
+            self.assertNotIn("OFFSET", sql.upper())
+
+    def test_name_ordering_and_previous_link(self):
+        url = reverse("products_api") + "?page_size=5&ordering=-name"
+        first = self.client.get(url).data
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(back["results"], first["results"])
+        names = [item["name"] for item in first["results"]]
+        self.assertEqual(names, sorted(names, reverse=True))
+
+    def test_category_endpoint_is_paginated(self):
+        url = reverse("category_api", args=["phones"]) + "?page_size=5"
+        ids, _ = self.walk(url)
+        self.assertEqual(ids, [p.id for p in self.products])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("products_api") + "?cursor=junk")
+        self.assertEqual(response.status_code, 404)
+        for ordering, value in (("created", 5), ("name", None)):
+            cursor = urlsafe_b64encode(
+                json.dumps({"o": ordering, "p": [value, 1]}).encode()
+            ).decode()
+            response = self.client.get(
+                reverse("products_api"),
+                {"cursor": cursor, "ordering": ordering},
+            )
+            self.assertEqual(response.status_code, 404)
+
+
+class ProductQueryBudgetTests(TestCase):
+    """
+    Each endpoint must serialize any number of products in a fixed number
+    of queries: one for the page, and on a cold cache one for the products
+    and one for the category prefetch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = make_category("Phones")
+        cls.tablets = make_category("Tablets")
+        cls.product_type = ProductType.objects.create(name="Device")
+        Product.objects.bulk_create(
+            Product(
+                name="Product %04d" % i,
+                slug="product-%04d" % i,
+                type=cls.product_type,
+                content="",
+            )
+            for i in range(1000)
+        )
+        through = Product.category.through
+        through.objects.bulk_create(
+            through(product_id=pk, category_id=category.pk)
+            for pk in Product.objects.values_list("pk", flat=True)
+            for category in (cls.phones, cls.tablets)
+        )
+
+    def setUp(self):
+        cache.clear()
+        facet_index.clear()
+        facet_index.get()
+        self.addCleanup(facet_index.clear)
+
+    def test_product_list(self):
+        url = reverse("products_api") + "?page_size=500"
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 500)
+        self.assertEqual(
+            sorted(response.data["results"][0]["category"]),
+            [self.phones.pk, self.tablets.pk],
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.client.get(url + "&x=1").data["results"],
+                response.data["results"],
+            )
+
+    def test_product_by_category(self):
+        url = reverse("category_api", args=["tablets"]) + "?page_size=500"
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 500)
+        with self.assertNumQueries(1):
+            self.client.get(url + "&x=1")
+
+    def test_product_detail(self):
+        product = Product.objects.first()
+        url = reverse("product_api", args=[product.pk])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data["type"], self.product_type.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get(url, HTTP_X_NOCACHE="1").data, response.data
+            )
+
+
+class CategorySubtreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.electronics = make_category("Electronics")
+        cls.phones = make_category("Phones", parent=cls.electronics)
+        cls.android = make_category("Android", parent=cls.phones)
+        cls.garden = make_category("Garden")
+        cls.radio = make_product("Radio", cls.electronics)
+        cls.pixel = make_product("Pixel", cls.android, cls.phones)
+        cls.hose = make_product("Hose", cls.garden)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, slug, **params):
+        url = reverse("category_api", args=[slug])
+        response = self.client.get(url, params)
+        return sorted(item["id"] for item in response.data["results"])
+
+    def test_direct_members_only_by_default(self):
+        self.assertEqual(self.get_ids("electronics"), [self.radio.pk])
+
+    def test_include_descendants(self):
+        with self.assertNumQueries(4):
+            ids = self.get_ids("electronics", include_descendants="true")
+        self.assertEqual(ids, sorted([self.radio.pk, self.pixel.pk]))
+        self.assertEqual(
+            self.get_ids("android", include_descendants="1"), [self.pixel.pk]
+        )
+
+    def test_unknown_slug(self):
+        self.assertEqual(self.get_ids("nope", include_descendants="1"), [])
+
+
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.electronics = make_category("Electronics")
+        cls.phones = make_category("Phones", parent=cls.electronics)
+        cls.laptops = make_category("Laptops", parent=cls.electronics)
+        cls.garden = make_category("Garden")
+
+    def setUp(self):
+        cache.clear()
+
+    def get_tree(self):
+        response = self.client.get(reverse("category_tree_api"))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, nodes):
+        return [(n["name"], self.names(n["children"])) for n in nodes]
+
+    def test_nested_tree_is_cached(self):
+        with self.assertNumQueries(1):
+            tree = self.get_tree()
+        self.assertEqual(
+            self.names(tree),
+            [
+                ("Electronics", [("Laptops", []), ("Phones", [])]),
+                ("Garden", []),
+            ],
+        )
+        self.assertEqual(tree[0]["children"][0]["parent"], self.electronics.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_tree(), tree)
+
+    def test_save_move_and_delete_invalidate(self):
+        self.get_tree()
+        self.laptops.name = "Notebooks"
+        self.laptops.save()
+        self.assertEqual(
+            self.names(self.get_tree())[0],
+            ("Electronics", [("Notebooks", []), ("Phones", [])]),
+        )
+
+        self.laptops.move_to(self.garden)
+        self.assertEqual(
+            self.names(self.get_tree()),
+            [
+                ("Electronics", [("Phones", [])]),
+                ("Garden", [("Notebooks", [])]),
+            ],
+        )
+
+        self.laptops.delete()
+        self.assertEqual(self.names(self.get_tree())[1], ("Garden", []))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category("Phones")
+        cls.product = make_product("Pixel", cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_unchanged_endpoints_answer_304(self):
+        for url in [
+            reverse("products_api"),
+            reverse("categories_api"),
+            reverse("category_tree_api"),
+            reverse("category_api", args=["phones"]),
+            reverse("product_api", args=[self.product.pk]),
+        ]:
+            with self.subTest(url=url):
+                self.assertRevalidates(url)
+
+    def test_changes_invalidate_etag(self):
+        url = reverse("products_api")
+        etag = self.assertRevalidates(url)
+        self.product.category.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_have_distinct_etags(self):
+        first = self.client.get(reverse("products_api"))
+        other = self.client.get(reverse("products_api") + "?ordering=name")
+        self.assertNotEqual(first["ETag"], other["ETag"])
+
+    @override_settings(STOCK_SINGLE_PROCESS=False)
+    def test_per_process_caches_turn_versions_off(self):
+        self.assertEqual(
+            [message.id for message in check_shared_cache(None)],
+            ["stock.W001"],
+        )
+        response = self.client.get(reverse("products_api"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        self.assertIsNone(cache.get(object_key("product", self.product.pk)))
+        with self.settings(STOCK_SINGLE_PROCESS=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class InventoryExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Acme")
+        supplier = make_supplier("Wholesale, Inc")
+        product = make_product("Pixel")
+        make_inventory(product, "PX-1", brand, supplier, quantity=5)
+        make_inventory(product, "PX-2", brand, supplier, available=3)
+
+    def test_csv_stream(self):
+        self.client.force_login(make_user())
+        response = self.client.get(reverse("inventory_export", args=["csv"]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "sku,product,brand,supplier,mrp,price,discount,quantity,sold,"
+            "available,defective",
+        )
+        self.assertEqual(
+            lines[1], 'PX-1,Pixel,Acme,"Wholesale, Inc",10.0,8.00,0.00,5,0,0,0'
+        )
+        self.assertEqual(len(lines), 3)
+
+    def test_ndjson_stream(self):
+        self.client.force_login(make_user())
+        response = self.client.get(
+            reverse("inventory_export", args=["ndjson"])
+        )
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["sku"] for row in rows], ["PX-1", "PX-2"])
+        self.assertEqual(rows[1]["available"], 3)
+        self.assertEqual(rows[1]["price"], "8.00")
+
+    def test_requires_permission(self):
+        self.client.force_login(make_user(superuser=False))
+        response = self.client.get(reverse("inventory_export", args=["csv"]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export_inventory", "--format=ndjson", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class InventoryBulkUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name="Acme")
+        cls.supplier = make_supplier("Wholesale")
+        cls.product = make_product("Pixel")
+        cls.existing = make_inventory(
+            cls.product, "PX-1", cls.brand, cls.supplier, quantity=1
+        )
+
+    def setUp(self):
+        self.client.force_login(make_user())
+
+    def post(self, records):
+        return self.client.post(
+            reverse("inventory_bulk_api"),
+            records,
+            content_type="application/json",
+        )
+
+    def new_record(self, sku, **fields):
+        record = {
+            "sku": sku,
+            "product": self.product.pk,
+            "brand": self.brand.pk,
+            "supplier": self.supplier.pk,
+            "mrp": 12.5,
+            "defective": 0,
+        }
+        record.update(fields)
+        return record
+
+    def test_skus_created_meanwhile_are_updated(self):
+        make_inventory(self.product, "PX-7", self.brand, self.supplier)
+        in_bulk = QuerySet.in_bulk
+        # The first lookup runs before another request inserts PX-7.
+        lookups = iter([lambda *args, **kwargs: {}, in_bulk, in_bulk])
+        with mock.patch.object(
+            QuerySet,
+            "in_bulk",
+            lambda *args, **kwargs: next(lookups)(*args, **kwargs),
+        ):
+            response = self.post([self.new_record("PX-7", quantity=4)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["status"], "updated")
+        self.assertEqual(ProductInventory.objects.get(sku="PX-7").quantity, 4)
+
+    def test_creates_updates_and_reports_each_row(self):
+        records = [
+            {"sku": "PX-1", "quantity": 40, "price": "9.99"},
+            self.new_record("PX-2", quantity=7),
+            self.new_record("PX-3", brand=999999),
+            {"sku": "PX-4", "quantity": 1},
+            {"sku": "PX-5", "quantity": -1},
+            self.new_record("PX-2"),
+            self.new_record("PX-6", available=-1),
+        ]
+        response = self.post(records)
+        self.assertEqual(response.status_code, 200)
+        statuses = [row["status"] for row in response.data["results"]]
+        self.assertEqual(
+            statuses,
+            ["updated", "created"] + ["invalid"] * 5,
+        )
+        self.assertEqual(
+            response.data["counts"], {"updated": 1, "created": 1, "invalid": 5}
+        )
+        self.assertIn("available", response.data["results"][6]["errors"])
+        self.assertIn("brand", response.data["results"][2]["errors"])
+        self.assertIn("product", response.data["results"][3]["errors"])
+        self.assertIn("quantity", response.data["results"][4]["errors"])
+        self.assertIn("sku", response.data["results"][5]["errors"])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.quantity, 40)
+        self.assertEqual(str(self.existing.price), "9.99")
+        self.assertEqual(ProductInventory.objects.get(sku="PX-2").quantity, 7)
+
+    def test_query_count_is_independent_of_batch_size(self):
+        records = [self.new_record("BULK-%04d" % i) for i in range(1200)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(records)
+        self.assertEqual(response.data["counts"], {"created": 1200})
+        # SQLite splits each bulk INSERT by its bound-variable limit.
+        self.assertLess(
+            len(
+                [
+                    q
+                    for q in ctx.captured_queries
+                    if not q["sql"].startswith("INSERT")
+                ]
+            ),
+            40,
+        )
+
+    def test_requires_staff(self):
+        self.client.force_login(make_user(superuser=False))
+        self.assertEqual(self.post([]).status_code, 403)
+
+    def test_rejects_non_list(self):
+        self.assertEqual(self.post({"sku": "PX-1"}).status_code, 400)
+
+
+class ImportCatalogTests(TestCase):
+    files = {
+        "brands.csv": "name\nAcme\nGlobex\n",
+        "suppliers.csv": (
+            "name,mobile_number,email,other_details\n"
+            "Wholesale,0100000001,wholesale@example.com,\n"
+        ),
+        "product_types.csv": "name\nDevice\n",
+        "categories.csv": (
+            "name,slug,parent,content\n"
+            "Android,android,phones,\n"
+            "Electronics,electronics,,\n"
+            "Phones,phones,electronics,\n"
+        ),
+        "products.csv": (
+            "name,slug,type,categories,summary,content\n"
+            "Pixel,pixel,Device,android|phones,,<p>Pixel</p>\n"
+            "Radio,radio,Device,electronics,,\n"
+            "Broken,broken,Device,nowhere,,\n"
+        ),
+        "inventory.csv": (
+            "sku,product,brand,supplier,mrp,price,quantity,available,"
+            "defective\n"
+            "PX-1,pixel,Acme,Wholesale,99.5,80.00,10,10,0\n"
+            "RD-1,radio,Globex,Wholesale,20,15.50,3,3,1\n"
+            "XX-1,missing,Acme,Wholesale,1,1,1,1,0\n"
+            "NG-1,radio,Acme,Wholesale,1,1,1,-1,0\n"
+        ),
+    }
+
+    def import_catalog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, content in self.files.items():
+                Path(directory, name).write_text(content)
+            out, err = StringIO(), StringIO()
+            call_command("import_catalog", directory, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        out, err = self.import_catalog()
+        self.assertIn("inventory: 2", out)
+        self.assertIn("products.csv:4", err)
+        self.assertIn("inventory.csv:4", err)
+        self.assertIn("inventory.csv:5", err)
+        self.assertIn("available", err)
+
+        android = Category.objects.get(slug="android")
+        self.assertEqual(
+            [c.slug for c in android.get_ancestors()],
+            ["electronics", "phones"],
+        )
+        pixel = Product.objects.get(slug="pixel")
+        self.assertEqual(pixel.type.name, "Device")
+        self.assertEqual(
+            sorted(pixel.category.values_list("slug", flat=True)),
+            ["android", "phones"],
+        )
+        item = ProductInventory.objects.get(sku="RD-1")
+        self.assertEqual(
+            (item.product.slug, item.brand.name, item.defective),
+            ("radio", "Globex", 1),
+        )
+
+    def test_reimport_updates_in_place(self):
+        self.import_catalog()
+        self.files = dict(
+            self.files,
+            **{
+                "inventory.csv": (
+                    "sku,product,brand,supplier,mrp,quantity\n"
+                    "PX-1,pixel,Acme,Wholesale,99.5,25\n"
+                )
+            },
+        )
+        self.import_catalog()
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ProductInventory.objects.get(sku="PX-1").quantity, 25)
+
+    def test_copy_merge_sets_every_required_column(self):
+        # The INSERT ... SELECT of the PostgreSQL path gets no help from
+        # model defaults; each NOT NULL column needs a value or a default.
+        required = {
+            field.column
+            for field in ProductInventory._meta.concrete_fields
+            if not field.null and not field.primary_key
+        }
+        self.assertEqual(
+            required - {"sku"},
+            set(COPY_INVENTORY_VALUES) | set(COPY_INVENTORY_DEFAULTS),
+        )
+        self.assertLessEqual(
+            required - {"sku", "product_id", "brand_id", "supplier_id", "mrp"},
+            set(COPY_INVENTORY_DEFAULTS),
+        )
+
+
+class StockMovementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = make_inventory(
+            make_product("Pixel"),
+            "PX-1",
+            Brand.objects.create(name="Acme"),
+            make_supplier("Wholesale"),
+        )
+
+    def setUp(self):
+        self.client.force_login(make_user())
+
+    def move(self, kind, quantity, item=None):
+        return self.client.post(
+            reverse("stock_movement_api", args=[(item or self.item).pk]),
+            {"kind": kind, "quantity": quantity},
+            content_type="application/json",
+        )
+
+    def counters(self):
+        self.item.refresh_from_db()
+        return (
+            self.item.quantity,
+            self.item.sold,
+            self.item.available,
+            self.item.defective,
+        )
+
+    def test_movements_update_counters_and_ledger(self):
+        self.assertEqual(self.move("receive", 10).status_code, 201)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.move("sell", 4)
+        self.assertEqual(response.status_code, 201)
+        statements = [q["sql"] for q in ctx.captured_queries]
+        first_update = next(
+            i for i, sql in enumerate(statements) if sql.startswith("UPDATE")
+        )
+        self.assertFalse(
+            [
+                sql
+                for sql in statements[:first_update]
+                if "productinventory" in sql and sql.startswith("SELECT")
+            ]
+        )
+        self.move("return", 1)
+        self.move("defect", 2)
+        self.assertEqual(self.counters(), (10, 3, 5, 2))
+        self.assertEqual(
+            list(
+                StockMovement.objects.order_by("pk").values_list(
+                    "kind", "quantity"
+                )
+            ),
+            [("receive", 10), ("sell", 4), ("return", 1), ("defect", 2)],
+        )
+
+    def test_guards_against_negative_stock(self):
+        self.move("receive", 2)
+        response = self.move("sell", 3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.move("return", 1).status_code, 409)
+        self.assertEqual(self.counters(), (2, 0, 2, 0))
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_validation(self):
+        self.assertEqual(self.move("steal", 1).status_code, 400)
+        self.assertEqual(self.move("sell", 0).status_code, 400)
+        response = self.client.post(
+            reverse("stock_movement_api", args=[999999]),
+            {"kind": "receive", "quantity": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class StockAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = make_category("Phones")
+        cls.android = make_category("Android", cls.phones)
+        cls.tablets = make_category("Tablets")
+        cls.brand = Brand.objects.create(name="Acme")
+        cls.supplier = make_supplier("Wholesale")
+        cls.pixel = make_product("Pixel", cls.phones, cls.android)
+
+    def setUp(self):
+        self.client.force_login(make_user())
+
+    def stock(self, model, instance):
+        row = model.objects.get(pk=instance.pk)
+        return (row.quantity, row.sold, row.available, str(row.stock_value))
+
+    def add_item(self, sku="PX-1", product=None, **fields):
+        fields.setdefault("quantity", 10)
+        fields.setdefault("available", 10)
+        return make_inventory(
+            product or self.pixel, sku, self.brand, self.supplier, **fields
+        )
+
+    def test_rows_exist_for_new_products_and_categories(self):
+        self.assertEqual(
+            self.stock(ProductStock, self.pixel), (0, 0, 0, "0.00")
+        )
+        self.assertEqual(
+            self.stock(CategoryStock, self.tablets), (0, 0, 0, "0.00")
+        )
+
+    def test_saves_and_movements_update_totals(self):
+        item = self.add_item()
+        self.add_item("PX-2", quantity=5, available=5)
+        self.assertEqual(
+            self.stock(ProductStock, self.pixel), (15, 0, 15, "120.00")
+        )
+
+        apply_movement(item.pk, StockMovement.SELL, 4)
+        item.refresh_from_db()
+        item.price = "10.00"
+        item.save()
+        self.assertEqual(
+            self.stock(ProductStock, self.pixel), (15, 4, 11, "100.00")
+        )
+        self.assertEqual(
+            self.stock(CategoryStock, self.phones), (15, 4, 11, "100.00")
+        )
+        self.assertEqual(
+            self.stock(CategoryStock, self.android), (15, 4, 11, "100.00")
+        )
+
+        item.delete()
+        self.assertEqual(
+            self.stock(CategoryStock, self.phones), (5, 0, 5, "40.00")
+        )
+
+    def test_bulk_upsert_updates_totals(self):
+        self.add_item()
+        response = self.client.post(
+            reverse("inventory_bulk_api"),
+            [
+                {"sku": "PX-1", "available": 4},
+                {
+                    "sku": "PX-9",
+                    "product": self.pixel.pk,
+                    "brand": self.brand.pk,
+                    "supplier": self.supplier.pk,
+                    "mrp": 9,
+                    "price": "2.50",
+                    "quantity": 2,
+                    "available": 2,
+                    "defective": 0,
+                },
+            ],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.stock(CategoryStock, self.phones), (12, 0, 6, "37.00")
+        )
+
+    def test_membership_changes_move_totals(self):
+        self.add_item()
+        self.pixel.category.set([self.tablets])
+        self.assertEqual(
+            self.stock(CategoryStock, self.phones), (0, 0, 0, "0.00")
+        )
+        self.assertEqual(
+            self.stock(CategoryStock, self.tablets), (10, 0, 10, "80.00")
+        )
+
+        self.pixel.delete()
+        self.assertEqual(
+            self.stock(CategoryStock, self.tablets), (0, 0, 0, "0.00")
+        )
+
+    def assertMatchesRebuild(self):
+        def totals():
+            return sorted(
+                CategoryStock.objects.values_list(
+                    "pk", "quantity", "available", "stock_value"
+                )
+            )
+
+        incremental = totals()
+        call_command("rebuild_stock_aggregates")
+        self.assertEqual(incremental, totals())
+
+    def test_category_changes_move_totals_without_a_rebuild(self):
+        self.add_item()
+        tab = make_product("Tab", self.tablets)
+        self.add_item("TB-1", tab, quantity=3, available=3)
+        self.android.parent = self.tablets
+        self.android.save()
+        self.assertEqual(
+            self.stock(CategoryStock, self.tablets), (13, 0, 13, "104.00")
+        )
+        self.assertEqual(
+            self.stock(CategoryStock, self.phones), (10, 0, 10, "80.00")
+        )
+        self.assertMatchesRebuild()
+
+        self.tablets.product_set.remove(tab)
+        self.assertEqual(self.stock(CategoryStock, self.tablets)[0], 10)
+        self.phones.product_set.add(tab)
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 13)
+        self.phones.product_set.clear()
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 0)
+        self.assertEqual(self.stock(CategoryStock, self.tablets)[0], 10)
+        self.assertMatchesRebuild()
+
+        self.phones.product_set.add(self.pixel)
+        Category.objects.get(pk=self.android.pk).delete()
+        self.assertEqual(self.stock(CategoryStock, self.tablets)[0], 0)
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 10)
+        self.assertMatchesRebuild()
+
+        self.tablets.product_set.add(tab)
+        self.tablets.move_to(self.phones)
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 13)
+        self.assertMatchesRebuild()
+
+        tablets = make_category("Tablets", self.phones)
+        tablets.product_set.add(self.pixel)
+        Category.objects.filter(pk__in=[self.tablets.pk, tablets.pk]).delete()
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 10)
+        self.assertMatchesRebuild()
+
+    def test_rebuild_matches_incremental_totals(self):
+        self.add_item()
+        self.add_item("TB-1", make_product("Tab", self.tablets, self.phones))
+        expected = {
+            model: sorted(model.objects.values_list(*(["pk"] + fields)))
+            for model, fields in (
+                (ProductStock, ["quantity", "available", "stock_value"]),
+                (CategoryStock, ["quantity", "available", "stock_value"]),
+            )
+        }
+        ProductStock.objects.update(quantity=0, available=0)
+        CategoryStock.objects.all().delete()
+
+        call_command("rebuild_stock_aggregates")
+        for model, rows in expected.items():
+            self.assertEqual(
+                sorted(
+                    model.objects.values_list(
+                        "pk", "quantity", "available", "stock_value"
+                    )
+                ),
+                rows,
+            )
+        self.assertEqual(self.stock(CategoryStock, self.phones)[0], 20)
+
+    def test_totals_endpoints(self):
+        self.add_item()
+        response = self.client.get(
+            reverse("category_stock_api", args=[self.phones.pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["available"], 10)
+        response = self.client.get(
+            reverse("product_stock_api", args=[self.pixel.pk])
+        )
+        self.assertEqual(response.data["stock_value"], "80.00")
+
+
+@override_settings(
+    STOCK_COUNTER_BUFFER={
+        "BACKEND": "apps.stock.counters.LocalCounterStore",
+        "FLUSH_INTERVAL": None,
+    }
+)
+class BufferedSalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = make_inventory(
+            make_product("Pixel"),
+            "PX-1",
+            Brand.objects.create(name="Acme"),
+            make_supplier("Wholesale"),
+            quantity=10,
+            available=10,
+        )
+
+    def setUp(self):
+        get_counter_store.cache_clear()
+        self.addCleanup(get_counter_store.cache_clear)
+        self.client.force_login(make_user())
+        self.url = reverse("stock_level_api", args=[self.item.pk])
+
+    def sell(self, quantity):
+        return self.client.post(
+            self.url, {"quantity": quantity}, content_type="application/json"
+        )
+
+    def test_sales_are_buffered_then_flushed_in_one_update(self):
+        for _ in range(3):
+            self.assertEqual(self.sell(2).status_code, 202)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.sold, self.item.available), (0, 10))
+        self.assertEqual(
+            self.client.get(self.url).data,
+            {"id": self.item.pk, "sold": 6, "available": 4, "pending": 6},
+        )
+
+        self.assertEqual(self.sell(5).status_code, 409)
+
+        with CaptureQueriesContext(connection) as ctx:
+            applied, rejected = flush_counters()
+        updates = [
+            q
+            for q in ctx.captured_queries
+            if q["sql"].startswith('UPDATE "stock_productinventory"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual((applied, rejected), ({self.item.pk: 6}, {}))
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.sold, self.item.available), (6, 4))
+        self.assertEqual(
+            StockMovement.objects.get().quantity, 6, "one coalesced entry"
+        )
+        self.assertEqual(self.client.get(self.url).data["pending"], 0)
+
+    def test_oversell_guard_applies_at_flush(self):
+        self.sell(8)
+        ProductInventory.objects.filter(pk=self.item.pk).update(available=5)
+        applied, rejected = flush_counters()
+        self.assertEqual(applied, {self.item.pk: 5})
+        self.assertEqual(rejected, {self.item.pk: 3})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.available, 0)
+        self.assertEqual(
+            RejectedSale.objects.get(product_inventory=self.item).quantity, 3
+        )
+
+    def test_sales_stay_claimed_until_applied(self):
+        self.sell(4)
+        with mock.patch(
+            "apps.stock.counters.apply_movement",
+            side_effect=DatabaseError("gone"),
+        ), self.assertRaises(DatabaseError):
+            flush_counters()
+        self.assertEqual(self.client.get(self.url).data["pending"], 4)
+        self.sell(1)
+        # Sales made meanwhile wait for the claimed ones to settle.
+        self.assertEqual(flush_counters(), ({self.item.pk: 4}, {}))
+        self.assertEqual(flush_counters(), ({self.item.pk: 1}, {}))
+        self.assertEqual(self.client.get(self.url).data["pending"], 0)
+        self.assertEqual(flush_counters(), ({}, {}))
+
+    def test_a_retried_flush_does_not_apply_sales_twice(self):
+        self.sell(4)
+        store = get_counter_store()
+        # The flush dies after applying the sales, before settling them.
+        with mock.patch.object(
+            store, "settle", side_effect=DatabaseError("gone")
+        ), self.assertRaises(DatabaseError):
+            flush_counters()
+        self.sell(1)
+        self.assertEqual(flush_counters(), ({self.item.pk: 4}, {}))
+        self.assertEqual(flush_counters(), ({self.item.pk: 1}, {}))
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.sold, self.item.available), (5, 5))
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list("quantity", flat=True)),
+            [1, 4],
+        )
+
+    def test_workers_leave_the_local_store_to_its_process(self):
+        self.sell(2)
+        # As a worker runs it, rather than called in this process.
+        flush_stock_counters.push_request(called_directly=False)
+        try:
+            self.assertEqual(
+                flush_stock_counters.run(), {"applied": {}, "rejected": {}}
+            )
+        finally:
+            flush_stock_counters.pop_request()
+        self.assertEqual(flush_stock_counters()["applied"], {self.item.pk: 2})
+
+    def test_the_local_store_flushes_itself(self):
+        store = LocalCounterStore(FLUSH_INTERVAL=2.0)
+        with mock.patch.object(LocalCounterStore, "_flush_forever") as loop:
+            store.add(self.item.pk, 1)
+            store.add(self.item.pk, 1)
+            store._flusher.join()
+        loop.assert_called_once_with()
+        self.assertTrue(store._flusher.daemon)
+
+
+class ReorderAlertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = make_category("Phones")
+        cls.android = make_category("Android", cls.phones)
+        cls.brand = Brand.objects.create(name="Acme")
+        cls.supplier = make_supplier("Wholesale")
+        cls.pixel = make_product("Pixel", cls.android)
+
+    def setUp(self):
+        self.client.force_login(make_user())
+
+    def add_item(self, sku="PX-1", **fields):
+        fields.setdefault("quantity", 10)
+        fields.setdefault("available", 10)
+        return make_inventory(
+            self.pixel, sku, self.brand, self.supplier, **fields
+        )
+
+    def open_alerts(self):
+        return list(
+            ReorderAlert.objects.filter(resolved_at__isnull=True)
+            .order_by("pk")
+            .values_list("product_inventory__sku", "available", "threshold")
+        )
+
+    def test_movements_raise_one_alert_per_crossing(self):
+        item = self.add_item(reorder_level=5)
+        apply_movement(item.pk, StockMovement.SELL, 5)
+        self.assertEqual(self.open_alerts(), [])
+
+        apply_movement(item.pk, StockMovement.SELL, 1)
+        apply_movement(item.pk, StockMovement.SELL, 1)
+        self.assertEqual(self.open_alerts(), [("PX-1", 4, 5)])
+        self.assertTrue(
+            ProductInventory.objects.filter(
+                pk=item.pk, needs_reorder=True
+            ).exists()
+        )
+
+        apply_movement(item.pk, StockMovement.RETURN, 2)
+        self.assertEqual(self.open_alerts(), [])
+        self.assertEqual(ReorderAlert.objects.count(), 1)
+
+    def test_category_levels_apply_to_the_subtree(self):
+        item = self.add_item("PX-1", available=3)
+        own = self.add_item("PX-2", available=3, reorder_level=2)
+        self.assertEqual(self.open_alerts(), [])
+
+        self.phones.reorder_level = 4
+        self.phones.save()
+        self.assertEqual(self.open_alerts(), [("PX-1", 3, 4)])
+        own.refresh_from_db()
+        self.assertEqual(own.reorder_threshold, 2)
+
+        self.pixel.category.clear()
+        self.assertEqual(self.open_alerts(), [])
+        item.refresh_from_db()
+        self.assertEqual(item.reorder_threshold, 0)
+
+    def test_bulk_upsert_flags_crossings(self):
+        self.add_item(reorder_level=5)
+        response = self.client.post(
+            reverse("inventory_bulk_api"),
+            [{"sku": "PX-1", "available": 1}],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.open_alerts(), [("PX-1", 1, 5)])
+
+        response = self.client.get(reverse("reorder_alerts_api"))
+        self.assertEqual(
+            [row["sku"] for row in response.data["results"]], ["PX-1"]
+        )
+
+    def test_scanner_fixes_missed_crossings_in_chunks(self):
+        items = [self.add_item("PX-%d" % i, available=i) for i in range(5)]
+        # Bypass every hook, as a raw SQL fix or a COPY import would.
+        ProductInventory.objects.update(reorder_level=3, reorder_threshold=0)
+        ReorderAlert.objects.all().delete()
+
+        result = scan_reorder_alerts.apply(kwargs={"chunk_size": 2}).get()
+        self.assertEqual(result, {"flagged": 3, "cleared": 0})
+        self.assertEqual(
+            [sku for sku, _, _ in self.open_alerts()],
+            [item.sku for item in items[:3]],
+        )
+        self.assertEqual(
+            scan_reorder_alerts.apply().get(), {"flagged": 0, "cleared": 0}
+        )
+        self.assertEqual(len(self.open_alerts()), 3)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Acme")
+        supplier = make_supplier("Wholesale")
+        cls.pixel = make_product("Pixel")
+        cls.pixel.content = (
+            "<p>Android phone with a <b>great</b>&nbsp;camera</p>"
+        )
+        cls.pixel.save()
+        cls.case = make_product("Case")
+        cls.case.summary = "Fits the pixel camera bump"
+        cls.case.save()
+        make_inventory(cls.pixel, "PX-100", brand, supplier)
+        # Enough unrelated products for the matches to be rare terms.
+        for name in ("Charger", "Cable", "Stand", "Dock", "Speaker"):
+            make_product(name)
+
+    def search(self, query):
+        response = self.client.get(reverse("product_search_api"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search("pixel"), ["Pixel", "Case"])
+        self.assertCountEqual(self.search("pix cam"), ["Pixel", "Case"])
+        self.assertEqual(self.search("great"), ["Pixel"])
+        self.assertNotIn("Pixel", self.search("<b>"))
+        self.assertEqual(self.search("nbsp"), [])
+        self.assertEqual(self.search(""), [])
+
+    def test_skus_and_changes_are_indexed(self):
+        self.assertEqual(self.search("px-100"), ["Pixel"])
+        ProductInventory.objects.get(sku="PX-100").delete()
+        self.assertEqual(self.search("px-100"), [])
+
+        self.case.name = "Sleeve"
+        self.case.save()
+        self.assertEqual(self.search("sleeve"), ["Sleeve"])
+        self.pixel.delete()
+        self.assertEqual(self.search("camera"), ["Sleeve"])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM stock_product_search")
+        self.assertEqual(self.search("pixel"), [])
+        call_command("rebuild_search_index")
+        self.assertEqual(self.search("pixel"), ["Pixel", "Case"])
+
+
+@override_settings(STOCK_AUTOCOMPLETE_MAX_STALENESS=0)
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pixel = make_product("Google Pixel 7")
+        cls.pixie = make_product("Pixie Lights")
+        cls.item = make_inventory(
+            cls.pixel,
+            "GP7-128",
+            Brand.objects.create(name="Acme"),
+            make_supplier("Wholesale"),
+        )
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.clear()
+        self.addCleanup(autocomplete_index.clear)
+
+    def complete(self, prefix, **params):
+        response = self.client.get(
+            reverse("autocomplete_api"), dict(params, q=prefix)
+        )
+        self.assertEqual(response.status_code, 200)
+        return [row["label"] for row in response.data["results"]]
+
+    def test_matches_word_and_sku_prefixes(self):
+        self.assertEqual(
+            self.complete("pix"), ["Google Pixel 7", "Pixie Lights"]
+        )
+        self.assertEqual(self.complete("PIXEL  7"), ["Google Pixel 7"])
+        self.assertEqual(self.complete("gp7"), ["GP7-128"])
+        self.assertEqual(self.complete("g"), ["Google Pixel 7", "GP7-128"])
+        self.assertEqual(self.complete("pix", limit=1), ["Google Pixel 7"])
+        self.assertEqual(self.complete("zzz"), [])
+        self.assertEqual(self.complete(""), [])
+
+    def test_keystrokes_do_not_query_the_database(self):
+        self.complete("pix")
+        with CaptureQueriesContext(connection) as ctx:
+            for prefix in ("p", "pi", "pix", "pixe"):
+                self.complete(prefix)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if "stock_" in q["sql"]]
+        )
+
+    def test_rebuilt_after_changes(self):
+        self.assertEqual(self.complete("pixie"), ["Pixie Lights"])
+        self.pixie.name = "Fairy Lights"
+        self.pixie.save()
+        self.item.sku = "PIXIE-1"
+        self.item.save()
+        self.assertEqual(self.complete("pixie"), ["PIXIE-1"])
+        self.assertEqual(self.complete("fairy"), ["Fairy Lights"])
+
+
+@override_settings(STOCK_FACET_MAX_STALENESS=0)
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = make_category("Phones")
+        android = make_category("Android", phones)
+        cases = make_category("Cases")
+        gadget = ProductType.objects.create(name="Gadget")
+        cls.acme = Brand.objects.create(name="Acme")
+        cls.zeta = Brand.objects.create(name="Zeta")
+        cls.wholesale = make_supplier("Wholesale")
+        cls.pixel = make_product("Pixel", android, product_type=gadget)
+        cls.iphone = make_product("iPhone", phones, product_type=gadget)
+        cls.case = make_product("Case", cases)
+        cls.pixel_item = make_inventory(
+            cls.pixel, "PX-1", cls.acme, cls.wholesale, price="450.00"
+        )
+        make_inventory(
+            cls.iphone, "IP-1", cls.zeta, cls.wholesale, price="900.00"
+        )
+        make_inventory(cls.case, "CS-1", cls.acme, cls.wholesale, price="9.00")
+        make_inventory(
+            cls.case, "CS-2", cls.zeta, cls.wholesale, price="60.00"
+        )
+        ProductInventory.objects.update(available=3)
+        call_command("rebuild_stock_aggregates")
+
+    def setUp(self):
+        cache.clear()
+        facet_index.clear()
+        self.addCleanup(facet_index.clear)
+
+    def get(self, **params):
+        response = self.client.get(reverse("products_api"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def names(self, **params):
+        return sorted(item["name"] for item in self.get(**params)["results"])
+
+    def test_filters(self):
+        self.assertEqual(self.names(brand=self.acme.pk), ["Case", "Pixel"])
+        self.assertEqual(self.names(category="phones"), ["Pixel", "iPhone"])
+        self.assertEqual(
+            self.names(type=self.pixel.type_id), ["Pixel", "iPhone"]
+        )
+        self.assertEqual(
+            self.names(min_price=50, max_price=500), ["Case", "Pixel"]
+        )
+        self.assertEqual(self.names(min_price=10, max_price=50), [])
+        self.assertEqual(
+            self.names(brand=self.zeta.pk, max_price=100), ["Case"]
+        )
+        self.assertEqual(
+            self.names(supplier=self.wholesale.pk, in_stock="false"), []
+        )
+        response = self.client.get(reverse("products_api"), {"brand": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_counts_exclude_their_own_filter(self):
+        data = self.get(brand=self.acme.pk, category="phones")
+        self.assertEqual(data["count"], 1)
+        brands = {row["name"]: row["count"] for row in data["facets"]["brand"]}
+        self.assertEqual(brands, {"Acme": 1, "Zeta": 1})
+        categories = {
+            row["slug"]: row["count"] for row in data["facets"]["category"]
+        }
+        self.assertEqual(categories, {"phones": 1, "android": 1, "cases": 1})
+        prices = {row["min"]: row["count"] for row in data["facets"]["price"]}
+        self.assertEqual(prices, {0: 0, 10: 0, 50: 0, 100: 1, 500: 0})
+        self.assertEqual(data["facets"]["in_stock"], {"true": 1, "false": 0})
+
+    def test_warm_index_runs_no_group_by(self):
+        self.get(brand=self.acme.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            self.get(category="phones", in_stock="true")
+        for query in ctx.captured_queries:
+            self.assertNotIn("GROUP BY", query["sql"].upper())
+            self.assertNotIn("COUNT(", query["sql"].upper())
+
+    def test_rebuilt_after_inventory_changes(self):
+        self.assertEqual(self.get(in_stock="true")["count"], 3)
+        apply_movement(self.pixel_item.pk, StockMovement.SELL, 3)
+        data = self.get(in_stock="true")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(data["facets"]["in_stock"], {"true": 2, "false": 1})
+
+    def test_rebuilt_index_changes_the_etag(self):
+        url = reverse("products_api")
+        self.client.get(url)
+        with override_settings(STOCK_FACET_MAX_STALENESS=3600):
+            apply_movement(self.pixel_item.pk, StockMovement.SELL, 3)
+            response = self.client.get(url)
+            self.assertEqual(
+                response.data["facets"]["in_stock"], {"true": 3, "false": 0}
+            )
+        etag = response["ETag"]
+        with override_settings(STOCK_FACET_MAX_STALENESS=0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            response.data["facets"]["in_stock"], {"true": 2, "false": 1}
+        )
+
+
+class SKULookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = make_inventory(
+            make_product("Pixel"),
+            "PX 1A",
+            Brand.objects.create(name="Acme"),
+            make_supplier("Wholesale"),
+            quantity=4,
+            available=4,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def lookup(self, sku):
+        return self.client.get(reverse("sku_api", args=[sku]))
+
+    def test_one_joined_query_then_cached(self):
+        with self.assertNumQueries(1):
+            response = self.lookup("PX 1A")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["sku"], "PX 1A")
+        self.assertEqual(response.data["product"]["name"], "Pixel")
+        self.assertEqual(response.data["brand"]["name"], "Acme")
+        self.assertEqual(response.data["supplier"]["name"], "Wholesale")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup("PX 1A").data, response.data)
+        self.assertEqual(self.lookup("px 1a").status_code, 404)
+
+    def test_writes_drop_the_cached_row(self):
+        self.lookup("PX 1A")
+        apply_movement(self.item.pk, StockMovement.SELL, 1)
+        self.assertEqual(self.lookup("PX 1A").data["available"], 3)
+        self.item.refresh_from_db()
+        self.item.sku = "PX-2"
+        self.item.save()
+        self.assertEqual(self.lookup("PX 1A").status_code, 404)
+        self.assertEqual(self.lookup("PX-2").data["id"], self.item.pk)
+
+    def test_sku_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_inventory(
+                self.item.product,
+                "PX 1A",
+                self.item.brand,
+                self.item.supplier,
+            )
+        out = StringIO()
+        call_command("find_duplicate_skus", stdout=out)
+        self.assertEqual(out.getvalue(), "")
+
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = make_category("Phones")
+        cls.tablets = make_category("Tablets")
+        cls.pixel = make_product("Pixel", cls.phones)
+        cls.ipad = make_product("iPad", cls.tablets)
+        cls.brand = Brand.objects.create(name="Acme")
+        make_inventory(cls.pixel, "PX-1", cls.brand, make_supplier("Bulk"))
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self):
+        response = self.client.get(reverse("products_api"))
+        return [item["name"] for item in response.data["results"]]
+
+    def test_list_reads_fragments_with_one_get_many(self):
+        self.names()
+        with mock.patch.object(
+            cache, "get_many", wraps=cache.get_many
+        ) as get_many:
+            payloads = product_fragments.get_many(
+                [self.pixel.pk, self.ipad.pk]
+            )
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(payloads[self.ipad.pk]["name"], "iPad")
+
+    def test_tags_retire_payloads(self):
+        self.assertEqual(self.names(), ["Pixel", "iPad"])
+        self.ipad.name = "iPad Air"
+        self.ipad.save()
+        self.pixel.category.add(self.tablets)
+        self.assertEqual(self.names(), ["Pixel", "iPad Air"])
+        response = self.client.get(
+            reverse("product_api", args=[self.pixel.pk])
+        )
+        self.assertCountEqual(
+            response.data["category"], [self.phones.pk, self.tablets.pk]
+        )
+
+        self.tablets.product_set.clear()
+        response = self.client.get(
+            reverse("product_api", args=[self.pixel.pk])
+        )
+        self.assertEqual(response.data["category"], [self.phones.pk])
+
+        self.phones.name = "Mobiles"
+        self.phones.save()
+        categories = self.client.get(reverse("categories_api")).data
+        self.assertIn("Mobiles", [item["name"] for item in categories])
+
+    def test_sku_payload_follows_its_brand(self):
+        url = reverse("sku_api", args=["PX-1"])
+        self.assertEqual(self.client.get(url).data["brand"]["name"], "Acme")
+        self.brand.name = "Acme Corp"
+        self.brand.save()
+        self.assertEqual(
+            self.client.get(url).data["brand"]["name"], "Acme Corp"
+        )
+
+    def test_file_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.filebased."
+                        "FileBasedCache",
+                        "LOCATION": location,
+                    }
+                }
+            ):
+                self.assertEqual(self.names(), ["Pixel", "iPad"])
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.names(), ["Pixel", "iPad"])
+                self.ipad.name = "iPad Mini"
+                self.ipad.save()
+                self.assertEqual(self.names(), ["Pixel", "iPad Mini"])
+
+
+def make_image(size=(2000, 1000), mode="RGBA", color=(200, 30, 30, 128)):
+    out = BytesIO()
+    Image.new(mode, size, color).save(out, "PNG")
+    return ContentFile(out.getvalue(), name="photo.png")
+
+
+class MediaRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = make_inventory(
+            make_product("Pixel"),
+            "PX-1",
+            Brand.objects.create(name="Acme"),
+            make_supplier("Wholesale"),
+        )
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self):
+        with mock.patch(
+            "apps.stock.tasks.render_media_renditions.delay"
+        ) as delay, self.captureOnCommitCallbacks(execute=True):
+            media = Media.objects.create(
+                product_inventory=self.item,
+                image=make_image(),
+                alt_text="Pixel",
+            )
+        delay.assert_called_once_with(media.pk)
+        return media
+
+    def test_upload_queues_every_rendition(self):
+        media = self.upload()
+        render_media_renditions(media.pk)
+        media.refresh_from_db()
+        self.assertEqual(
+            sorted(media.renditions),
+            [
+                "card.jpeg",
+                "card.webp",
+                "large.jpeg",
+                "large.webp",
+                "thumb.jpeg",
+                "thumb.webp",
+            ],
+        )
+        name = media.renditions["thumb.webp"]
+        self.assertIn(media.image_hash[:16], name)
+        with default_storage.open(name) as stream:
+            with Image.open(stream) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (160, 80))
+        with default_storage.open(media.renditions["large.jpeg"]) as stream:
+            with Image.open(stream) as image:
+                self.assertEqual((image.format, image.mode), ("JPEG", "RGB"))
+
+    def test_missing_rendition_is_rendered_on_first_request(self):
+        media = self.upload()
+        url = reverse("media_rendition", args=[media.pk, "card.webp"])
+        response = self.client.get(url)
+        media.refresh_from_db()
+        self.assertEqual(list(media.renditions), ["card.webp"])
+        self.assertRedirects(
+            response,
+            default_storage.url(media.renditions["card.webp"]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(
+            self.client.get(url)["Location"], response["Location"]
+        )
+        missing = reverse("media_rendition", args=[media.pk, "huge.gif"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+        data = self.client.get(
+            reverse("inventory_media_api", args=[self.item.pk])
+        ).data
+        renditions = data[0]["renditions"]
+        self.assertEqual(renditions["card.webp"], response["Location"])
+        self.assertEqual(
+            renditions["thumb.webp"],
+            reverse("media_rendition", args=[media.pk, "thumb.webp"]),
+        )
+
+    def test_replaced_image_drops_its_renditions(self):
+        media = self.upload()
+        render_media_renditions(media.pk)
+        media.refresh_from_db()
+        old = media.renditions["thumb.webp"]
+        with mock.patch(
+            "apps.stock.tasks.render_media_renditions.delay"
+        ) as delay, self.captureOnCommitCallbacks(execute=True):
+            media.image = make_image(color=(0, 0, 255, 255))
+            media.save()
+        delay.assert_called_once_with(media.pk)
+        media.refresh_from_db()
+        self.assertEqual((media.image_hash, media.renditions), ("", {}))
+        render_media_renditions(media.pk)
+        media.refresh_from_db()
+        self.assertNotEqual(media.renditions["thumb.webp"], old)
+
+    def test_command_renders_in_a_process_pool(self):
+        media = [self.upload() for _ in range(3)]
+        out = StringIO()
+        call_command("generate_renditions", workers=2, stdout=out)
+        self.assertIn("3 media", out.getvalue())
+        for item in media:
+            item.refresh_from_db()
+            self.assertEqual(len(item.renditions), 6)
+        # Identical images share their files.
+        self.assertEqual(
+            media[0].renditions["thumb.webp"],
+            media[2].renditions["thumb.webp"],
+        )
+        call_command("generate_renditions", workers=0, stdout=out)
+        self.assertIn("0 media", out.getvalue())
+
+
+class FeaturedImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.media_root = tempfile.mkdtemp()
+        brand = Brand.objects.create(name="Acme")
+        supplier = make_supplier("Wholesale")
+        cls.products = []
+        with override_settings(MEDIA_ROOT=cls.media_root):
+            for i in range(6):
+                product = make_product("Product %d" % i)
+                plain = make_inventory(product, "P%d-A" % i, brand, supplier)
+                item = make_inventory(product, "P%d-B" % i, brand, supplier)
+                Media.objects.create(
+                    product_inventory=plain, image=make_image(), alt_text="a"
+                )
+                Media.objects.create(
+                    product_inventory=item,
+                    image=make_image(),
+                    alt_text="Product %d" % i,
+                    is_feature=True,
+                )
+                cls.products.append(product)
+        cls.bare = make_product("Bare")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root)
+
+    def setUp(self):
+        cache.clear()
+        facet_index.clear()
+        facet_index.get()
+        self.addCleanup(facet_index.clear)
+
+    def featured(self, **params):
+        response = self.client.get(reverse("products_api"), params)
+        return {
+            item["name"]: item["featured_image"]
+            for item in response.data["results"]
+        }
+
+    def test_one_featured_image_per_item(self):
+        item = ProductInventory.objects.get(sku="P0-B")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Media.objects.create(
+                product_inventory=item,
+                image="images/default.png",
+                alt_text="b",
+                is_feature=True,
+            )
+        Media.objects.create(
+            product_inventory=item, image="images/default.png", alt_text="c"
+        )
+
+    def test_page_resolves_featured_images_in_one_query(self):
+        with self.assertNumQueries(4):
+            featured = self.featured(page_size=3)
+        with self.assertNumQueries(4):
+            featured.update(self.featured(page_size=50))
+        self.assertIsNone(featured["Bare"])
+        self.assertEqual(featured["Product 3"]["alt_text"], "Product 3")
+        self.assertTrue(featured["Product 3"]["is_feature"])
+        self.assertIn("thumb.webp", featured["Product 3"]["renditions"])
+
+    def test_payload_follows_the_featured_image(self):
+        self.assertEqual(self.featured()["Product 1"]["alt_text"], "Product 1")
+        media = Media.objects.get(alt_text="Product 1")
+        media.is_feature = False
+        media.save()
+        self.assertIsNone(self.featured()["Product 1"])
+
+    def test_featured_image_changes_revalidate(self):
+        url = reverse("products_api")
+        etag = self.client.get(url)["ETag"]
+        media = Media.objects.get(alt_text="Product 2")
+        media.alt_text = "Renamed"
+        media.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Renamed")
+
+        etag = response["ETag"]
+        with override_settings(MEDIA_ROOT=self.media_root):
+            render_media_renditions(media.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "renditions/")
+
+
+class AsyncAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = make_category("Phones")
+        android = make_category("Android", phones)
+        cls.products = [
+            make_product("Phone %d" % i, android if i % 2 else phones)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    async def compare(self, sync_name, async_name, *args, query=""):
+        expected = await sync_to_async(self.client.get)(
+            reverse(sync_name, args=args) + query
+        )
+        response = await self.async_client.get(
+            reverse(async_name, args=args) + query
+        )
+        self.assertEqual(response.status_code, expected.status_code)
+        if response.status_code == 200:
+            data = json.loads(response.content)
+            for item in (
+                data.get("results", ()) if isinstance(data, dict) else ()
+            ):
+                self.assertIn("featured_image", item)
+            self.assertEqual(
+                data,
+                json.loads(
+                    expected.content.replace(
+                        b"/stock/api/", b"/stock/api/async/"
+                    )
+                ),
+            )
+        return response
+
+    async def test_same_payloads_as_the_sync_views(self):
+        await self.compare("products_api", "async_products_api")
+        await self.compare(
+            "products_api", "async_products_api", query="?page_size=2"
+        )
+        await self.compare(
+            "products_api", "async_products_api", query="?category=phones"
+        )
+        await self.compare("categories_api", "async_categories_api")
+        await self.compare(
+            "category_api",
+            "async_category_api",
+            "phones",
+            query="?include_descendants=1",
+        )
+        await self.compare(
+            "product_api", "async_product_api", self.products[0].pk
+        )
+        await self.compare("product_api", "async_product_api", 999999)
+        await self.compare(
+            "products_api", "async_products_api", query="?cursor=junk"
+        )
+        await self.compare(
+            "products_api", "async_products_api", query="?brand=x"
+        )
+
+    async def test_conditional_get(self):
+        url = reverse("async_product_api", args=[self.products[1].pk])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # The async test client takes plain header names.
+        second = await self.async_client.get(
+            url, **{"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(second.status_code, 304)
+
+    def test_pages_link_to_the_async_endpoint(self):
+        response = self.client.get(
+            reverse("async_products_api"), {"page_size": 2}
+        )
+        data = json.loads(response.content)
+        self.assertIn("/stock/api/async/?", data["next"])
+        following = json.loads(self.client.get(data["next"]).content)
+        self.assertEqual(len(following["results"]), 2)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        facet_index.clear()
+        category = make_category("Phones")
+        make_product("Pixel", category)
+        self.item = make_inventory(
+            make_product("Galaxy", category),
+            "GAL-1",
+            Brand.objects.create(name="Samsung"),
+            make_supplier("Acme"),
+            quantity=10,
+            available=10,
+        )
+        self.client.force_login(make_user())
+
+    def get(self, url):
+        with CaptureQueriesContext(
+            connections["default"]
+        ) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Leave out the session and user lookups every logged-in page makes.
+        return tuple(
+            len(
+                [
+                    query
+                    for query in queries
+                    if "django_session" not in query["sql"]
+                    and "users_user" not in query["sql"]
+                ]
+            )
+            for queries in (primary, replica)
+        )
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=0)
+    def test_api_reads_go_to_a_replica(self):
+        # Once the replicas caught up, pages and the payloads cached for
+        # them come from a replica.
+        for _ in range(2):
+            primary, replica = self.get(reverse("products_api"))
+            self.assertEqual(primary, 0)
+            self.assertGreater(replica, 0)
+        self.assertEqual(self.get(reverse("categories"))[1], 0)
+
+    def test_recent_changes_are_read_from_the_primary(self):
+        # ETags and cached payloads carry the current versions, so they
+        # are not built from a replica that may lag behind them.
+        url = reverse("products_api")
+        primary, replica = self.get(url)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        etag = self.client.get(url)["ETag"]
+        product = Product.objects.get(name="Pixel")
+        product.name = "Pixel 2"
+        product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(b"Pixel 2", response.content)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        url = reverse("stock_level_api", args=[self.item.pk])
+        self.assertGreater(self.get(url)[1], 0)
+        response = self.client.post(
+            reverse("stock_movement_api", args=[self.item.pk]),
+            {"kind": "receive", "quantity": 5},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.get(url)[1], 0)
+        self.assertEqual(
+            self.client.get(url).data["available"], 15, "reads its write"
+        )
+        del self.client.cookies[PIN_COOKIE]
+        self.assertGreater(self.get(url)[1], 0)
+
+    def test_outside_requests_everything_uses_the_primary(self):
+        self.assertEqual(router.db_for_read(Product), "default")
+        self.assertTrue(router.allow_migrate("default", "stock"))
+        self.assertFalse(router.allow_migrate("replica", "stock"))
+
+
+class StorefrontPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = make_category("Phones")
+        cls.android = make_category("Android", cls.phones)
+        cls.products = [
+            make_product("Phone-%d" % i, cls.android) for i in range(3)
+        ]
+        cls.user = make_user()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def render(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Leave out the session and user lookups every logged-in page makes.
+        data = [
+            query
+            for query in queries
+            if "django_session" not in query["sql"]
+            and "users_user" not in query["sql"]
+        ]
+        return response.content.decode(), len(data)
+
+    def test_pages_are_rendered_server_side(self):
+        html, _ = self.render(reverse("categories"))
+        self.assertIn(
+            'href="%s"' % reverse("category", args=["android"]), html
+        )
+        self.assertNotIn("fetch(", html)
+        html, _ = self.render(reverse("category", args=["android"]))
+        for product in self.products:
+            self.assertIn(product.name, html)
+        html, _ = self.render(reverse("product", args=["phone-1"]))
+        self.assertIn("<h1>Phone-1</h1>", html)
+        self.assertIn("<p>Phone-1</p>", html)
+        self.assertIn("Android", html)
+
+    def test_repeat_renders_come_from_the_fragment_cache(self):
+        for url in (
+            reverse("categories"),
+            reverse("category", args=["android"]) + "?page_size=2",
+            reverse("product", args=["phone-1"]),
+        ):
+            cold, queries = self.render(url)
+            self.assertGreater(queries, 0)
+            warm, queries = self.render(url)
+            self.assertEqual(queries, 0)
+            self.assertEqual(warm, cold)
+
+    def test_changes_retire_the_cached_fragments(self):
+        url = reverse("product", args=["phone-1"])
+        self.render(url)
+        self.render(reverse("category", args=["android"]))
+        product = self.products[1]
+        product.name = "Renamed"
+        product.save()
+        self.assertIn("<h1>Renamed</h1>", self.render(url)[0])
+        self.assertIn(
+            "Renamed", self.render(reverse("category", args=["android"]))[0]
+        )
+        self.android.name = "Droids"
+        self.android.save()
+        self.assertIn("Droids", self.render(url)[0])
+        self.assertIn("Droids", self.render(reverse("categories"))[0])
+
+    def test_unknown_products_and_bad_cursors_are_not_found(self):
+        self.assertEqual(
+            self.client.get(reverse("product", args=["nope"])).status_code,
+            404,
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("category", args=["android"]) + "?cursor=junk"
+            ).status_code,
+            404,
+        )
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = make_category("Phones")
+        brand = Brand.objects.create(name="Acme")
+        supplier = make_supplier("Wholesale")
+        cls.products = []
+        for i in range(4):
+            product = make_product("Phone-%d" % i, phones)
+            for suffix in "AB":
+                item = make_inventory(
+                    product, "P%d-%s" % (i, suffix), brand, supplier
+                )
+            Media.objects.create(
+                product_inventory=item,
+                image="images/default.png",
+                alt_text="Phone %d" % i,
+                is_feature=True,
+            )
+            cls.products.append(product)
+        cls.brand = brand
+
+    def setUp(self):
+        cache.clear()
+        facet_index.clear()
+        facet_index.get()
+        self.addCleanup(facet_index.clear)
+
+    def get(self, name="products_api", args=(), **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_fields_trim_the_payload_and_the_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(fields="id,name,slug", page_size=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [set(item) for item in response.data["results"]],
+            [{"id", "name", "slug"}] * 2,
+        )
+        # The page, then the trimmed products; no prefetches.
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("content", queries[1]["sql"])
+        response = self.get(
+            "product_api", [self.products[0].pk], fields="name,category"
+        )
+        self.assertEqual(
+            response.data,
+            {
+                "name": "Phone-0",
+                "category": [self.products[0].category.get().pk],
+            },
+        )
+
+    def test_expansions_are_prefetched_once_per_page(self):
+        with self.assertNumQueries(4):
+            response = self.get(
+                fields="id", expand="inventory,brand,media", page_size=50
+            )
+        items = response.data["results"][0]["inventory"]
+        self.assertEqual([item["sku"] for item in items], ["P0-A", "P0-B"])
+        self.assertEqual(
+            items[0]["brand"], {"id": self.brand.pk, "name": "Acme"}
+        )
+        self.assertIsInstance(items[0]["supplier"], int)
+        self.assertEqual(items[0]["media"], [])
+        self.assertEqual(items[1]["media"][0]["alt_text"], "Phone 0")
+        self.assertEqual(len(response.data["results"]), 4)
+        # The default representation still comes from the cache.
+        self.assertNotIn("inventory", self.get().data["results"][0])
+
+    def test_unknown_fields_and_expansions_are_rejected(self):
+        response = self.get(fields="id,secret", expand="owner")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.data)
+        self.assertIn("expand", response.data)
+        self.assertEqual(self.get(fields="").status_code, 400)
+
+    def test_expansions_change_the_etag(self):
+        url = reverse("product_api", args=[self.products[0].pk])
+        etag = self.client.get(url, {"expand": "brand"})["ETag"]
+        self.assertEqual(
+            self.client.get(
+                url, {"expand": "brand"}, HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            304,
+        )
+        self.brand.name = "Renamed"
+        self.brand.save()
+        response = self.client.get(
+            url, {"expand": "brand"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["inventory"][0]["brand"]["name"], "Renamed"
+        )
+
+    def test_search_and_async_views_accept_fieldsets(self):
+        response = self.get(
+            "async_products_api", fields="id,name", expand="supplier"
+        )
+        self.assertEqual(
+            json.loads(response.content)["results"],
+            json.loads(self.get(fields="id,name", expand="supplier").content)[
+                "results"
+            ],
+        )
+        self.assertEqual(
+            self.get("async_products_api", fields="bogus").status_code, 400
+        )
+
+
+class FastPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = make_category("Phones")
+        android = make_category("Android", phones)
+        tablets = make_category("Tablets")
+        phone_type = ProductType.objects.create(name="Phone")
+        brand = Brand.objects.create(name="Acme")
+        supplier = make_supplier("Wholesale")
+        cls.products = [
+            make_product("Pixel", android, tablets, product_type=phone_type),
+            make_product("Plain"),
+            make_product("Odd", phones),
+        ]
+        Product.objects.filter(pk=cls.products[2].pk).update(
+            summary="Line\u2028separator — ünïcode",
+            content='<p class="x"> "quoted"</p>',
+        )
+        item = make_inventory(cls.products[0], "PX-1", brand, supplier)
+        Media.objects.create(
+            product_inventory=item,
+            image="images/default.png",
+            alt_text="Pixel",
+            is_feature=True,
+            renditions={"thumb.webp": "renditions/ab/thumb.webp"},
+        )
+
+    def test_product_payloads_match_the_serializer_byte_for_byte(self):
+        ids = [product.pk for product in self.products]
+        expected = JSONRenderer().render(
+            ProductSerializer(
+                Product.objects.for_serializer()
+                .filter(pk__in=ids)
+                .order_by("pk"),
+                many=True,
+            ).data
+        )
+        with self.assertNumQueries(3):
+            payloads = load_products(ids)
+        self.assertEqual(
+            ORJSONRenderer().render([payloads[pk] for pk in sorted(ids)]),
+            expected,
+        )
+        self.assertIn(b"\\u2028", expected)
+
+    def test_category_payloads_match_the_serializer_byte_for_byte(self):
+        categories = Category.objects.order_by("pk")
+        self.assertEqual(
+            ORJSONRenderer().render(
+                list(load_categories([c.pk for c in categories]).values())
+            ),
+            JSONRenderer().render(
+                CategorySerializer(categories, many=True).data
+            ),
+        )
+
+    def test_renderer_matches_drf_on_other_types(self):
+        data = {
+            "when": timezone.now(),
+            "price": Decimal("9.50"),
+            "ratio": 0.1,
+            1: ["é", None, True],
+        }
+        self.assertEqual(
+            ORJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_renderer_matches_drf_on_floats_and_big_ints(self):
+        for value in [
+            1e16,
+            1e-7,
+            1e-5,
+            -2.5e-10,
+            1.5e300,
+            1e15,
+            0.0001,
+            2**64,
+            [12.5, {"mrp": 1e22}],
+        ]:
+            with self.subTest(value=value):
+                data = {"mrp": value, "sku": "3e4f:1e5,"}
+                self.assertEqual(
+                    ORJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                )
+
+    def test_list_endpoints_render_with_orjson(self):
+        response = self.client.get(reverse("categories_api"))
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
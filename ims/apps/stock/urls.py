@@ -1,18 +1,34 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 
-from .views import Categories, ProductByCategory, ProductDetail
+from .views import (
+    Categories,
+    InventoryExport,
+    MediaRendition,
+    ProductByCategory,
+    ProductDetail,
+)
 
 urlpatterns = [
+    path("api/", include("apps.stock.api.urls")),
     path("categories/", Categories.as_view(), name="categories"),
     path(
         "categories/<slug:slug>/",
         ProductByCategory.as_view(),
         name="category",
     ),
+    re_path(
+        r"^inventory/export\.(?P<export_format>csv|ndjson)$",
+        InventoryExport.as_view(),
+        name="inventory_export",
+    ),
+    path(
+        "media/<int:id>/<str:key>/",
+        MediaRendition.as_view(),
+        name="media_rendition",
+    ),
     path(
         "<slug:slug>/",
         ProductDetail.as_view(),
         name="product",
     ),
-    path("api/", include("apps.stock.api.urls")),
 ]
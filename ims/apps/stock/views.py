@@ -1,15 +1,199 @@
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib.auth.mixins import (
+    LoginRequiredMixin,
+    PermissionRequiredMixin,
+)
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
+from django.views import View
 from django.views.generic import TemplateView
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
 
+from .api.fragments import category_fragments, product_fragments
+from .api.pagination import KeysetPagination
+from .cache import get_versions, object_key, tag_versions
+from .export import EXPORT_CONTENT_TYPES, export_inventory
+from .models import Category, Media, Product
+from .renditions import generate_renditions, parse_key
 
-class Categories(LoginRequiredMixin, TemplateView):
+
+class CachedFragmentView(TemplateView):
+    """
+    Pages rendered inside a ``{% cache %}`` block keyed by the versions of
+    what they show. Their data is handed to the template as lazy objects,
+    so a cached fragment costs neither queries nor template rendering.
+    """
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["cache_timeout"] = settings.STOCK_OBJECT_CACHE_TIMEOUT
+        return context
+
+
+class Categories(LoginRequiredMixin, CachedFragmentView):
     template_name = "products/categories.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["version"] = get_versions("category")["category"]
+        context["categories"] = SimpleLazyObject(self.get_categories)
+        return context
+
+    def get_categories(self):
+        ids = list(
+            Category.objects.order_by("tree_id", "lft").values_list(
+                "pk", flat=True
+            )
+        )
+        payloads = category_fragments.get_many(ids)
+        return [payloads[pk] for pk in ids if pk in payloads]
+
+
+class ProductByCategory(LoginRequiredMixin, CachedFragmentView):
+    """
+    One keyset page of the products in a category, as served by
+    ``ProductByCategoryAPIView``.
+    """
 
-class ProductByCategory(LoginRequiredMixin, TemplateView):
     template_name = "products/product_by_category.html"
 
+    def get(self, request, *args, **kwargs):
+        # Reject bad paging parameters before anything is cached.
+        try:
+            KeysetPagination().page_queryset(
+                Product.objects.none(), Request(request)
+            )
+        except APIException:
+            raise Http404("Invalid page.")
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["versions"] = get_versions("product", "category")
+        context["query"] = self.request.GET.urlencode()
+        context["page"] = SimpleLazyObject(self.get_page)
+        return context
+
+    def get_page(self):
+        request = Request(self.request)
+        include_descendants = request.query_params.get(
+            "include_descendants", ""
+        ).lower() in ("1", "true", "yes")
+        queryset = Product.objects.in_category(
+            self.kwargs["slug"], include_descendants
+        ).for_pages()
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(queryset, request)
+        payloads = product_fragments.get_many([row.pk for row in rows])
+        return {
+            "products": [
+                payloads[row.pk] for row in rows if row.pk in payloads
+            ],
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+        }
+
+
+class ProductDetail(LoginRequiredMixin, CachedFragmentView):
+    """
+    A product page built from its cached API payload; the slug is resolved
+    through the cache too, so a warm page makes no queries.
+    """
 
-class ProductDetail(LoginRequiredMixin, TemplateView):
     template_name = "products/product_detail.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        product = self.get_product(self.kwargs["slug"])
+        tags = ["product:%s" % product["id"]] + [
+            "category:%s" % pk for pk in product["category"]
+        ]
+        context["product"] = product
+        context["image"] = self.get_image(product["featured_image"])
+        context["versions"] = sorted(tag_versions(tags).items())
+        context["categories"] = SimpleLazyObject(
+            lambda: list(
+                category_fragments.get_many(product["category"]).values()
+            )
+        )
+        return context
+
+    def get_image(self, media):
+        """
+        The largest rendition of the featured image in every format, the
+        last format being the fallback.
+        """
+        if media is None:
+            return None
+        name = max(
+            settings.STOCK_MEDIA_RENDITIONS,
+            key=lambda name: settings.STOCK_MEDIA_RENDITIONS[name],
+        )
+        sources = [
+            {
+                "format": image_format,
+                "url": media["renditions"]["%s.%s" % (name, image_format)],
+            }
+            for image_format in settings.STOCK_MEDIA_RENDITION_FORMATS
+        ]
+        return {
+            "sources": sources[:-1],
+            "src": sources[-1]["url"],
+            "alt_text": media["alt_text"],
+        }
+
+    def get_product(self, slug):
+        key = object_key("product-slug", slug)
+        pk = cache.get(key)
+        product = None if pk is None else product_fragments.get(pk)
+        if product is None or product["slug"] != slug:
+            pk = (
+                Product.objects.filter(slug=slug)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            product = None if pk is None else product_fragments.get(pk)
+            if product is None:
+                raise Http404("No product matches the given slug.")
+            cache.set(key, pk, timeout=settings.STOCK_OBJECT_CACHE_TIMEOUT)
+        return product
+
+
+class InventoryExport(LoginRequiredMixin, PermissionRequiredMixin, View):
+    """
+    Stream the whole inventory table as CSV or NDJSON.
+    """
+
+    permission_required = "stock.view_productinventory"
+
+    def get(self, request, export_format):
+        response = StreamingHttpResponse(
+            export_inventory(export_format),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = (
+            'attachment; filename="inventory.%s"' % export_format
+        )
+        return response
+
+
+class MediaRendition(View):
+    """
+    Redirect to a rendition of a product image, rendering it first if the
+    upload worker has not got to it yet.
+    """
+
+    def get(self, request, id, key):
+        media = get_object_or_404(Media, pk=id)
+        try:
+            parse_key(key)
+        except KeyError:
+            raise Http404("Unknown rendition.")
+        name = media.renditions.get(key)
+        if name is None:
+            name = generate_renditions(media, [key])[key]
+        return redirect(media.image.storage.url(name))
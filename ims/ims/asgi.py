@@ -0,0 +1,19 @@
+"""
+ASGI config for ims project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Serve it with uvicorn workers under gunicorn, e.g.
+``gunicorn ims.asgi:application -k uvicorn.workers.UvicornWorker``; the
+async stock API lives under ``/stock/api/async/``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ims.settings")
+
+application = get_asgi_application()
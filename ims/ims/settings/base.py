@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
     "mptt",
     "ckeditor",
     "rest_framework",
+    "django_filters",
 ]
 
 MIDDLEWARE = [
@@ -40,6 +42,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.stock.routers.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -63,6 +66,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "ims.wsgi.application"
+ASGI_APPLICATION = "ims.asgi.application"
 
 
 # Database
@@ -72,8 +76,25 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    # A local stand-in for a read replica: a copy of the primary refreshed
+    # by ``manage.py sync_replica``.
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db-replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
 }
+DATABASE_ROUTERS = ["apps.stock.routers.ReplicaRouter"]
+
+# Aliases the stock API and dashboard read from, e.g. ["replica"]; empty
+# reads everything from the primary. Reads move to the primary for the
+# rest of a request once it writes, and for this many seconds after it;
+# cached data and ETags are built from the primary for as long after the
+# change they carry. Keep it above the replicas' worst lag.
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_VIEWS = ("apps.stock.api", "apps.dashboard")
+DATABASE_REPLICA_PIN_SECONDS = 10
 
 AUTH_USER_MODEL = "users.User"
 LOGIN_REDIRECT_URL = "/"
@@ -120,6 +141,91 @@ MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "media/"
 # EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Cache. Version counters and cached payloads are shared through it, so
+# wherever more than one process serves the site, set CACHE_URL to a
+# shared Redis, e.g. redis://localhost:6379/2.
+CACHE_URL = os.environ.get("CACHE_URL")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            # Room for a payload and a tag version per object.
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        },
+    }
+
+# Whether a single process serves the site, as runserver does. Otherwise
+# a per-process cache cannot carry the versions, and the object cache and
+# versioned ETags stay off until CACHE_URL is set.
+STOCK_SINGLE_PROCESS = DEBUG
+
+# Celery
+CELERY_BROKER_URL = "redis://localhost:6379/0"
+CELERY_BEAT_SCHEDULE = {
+    "flush-stock-counters": {
+        "task": "apps.stock.tasks.flush_stock_counters",
+        "schedule": 2.0,
+    },
+    # Write-time hooks flag crossings; this only catches what they missed.
+    "scan-reorder-alerts": {
+        "task": "apps.stock.tasks.scan_reorder_alerts",
+        "schedule": 3600.0,
+    },
+}
+
+# Write-behind buffer for hot-SKU sales. The local store only sees its own
+# process, which flushes it every FLUSH_INTERVAL seconds, and the Celery
+# flush task leaves it alone; its pending sales die with the process and
+# its oversell check only counts that process's sales, so point every
+# worker at the same Redis in production:
+# STOCK_COUNTER_BUFFER = {
+#     "BACKEND": "apps.stock.counters.RedisCounterStore",
+#     "LOCATION": "redis://localhost:6379/1",
+# }
+STOCK_COUNTER_BUFFER = {
+    "BACKEND": "apps.stock.counters.LocalCounterStore",
+    "FLUSH_INTERVAL": 2.0,
+}
+
+# Items with this many or fewer available count as low stock. Run
+# ``manage.py rebuild_stock_aggregates`` after changing it.
+STOCK_LOW_STOCK_THRESHOLD = 5
+
+# Seconds the in-process autocomplete index may lag behind product and SKU
+# changes before it is rebuilt.
+STOCK_AUTOCOMPLETE_MAX_STALENESS = 5
+
+# Seconds a SKU lookup is served from the cache, and the seconds a cached
+# product or category payload is kept; tags retire them on every change.
+STOCK_SKU_CACHE_TIMEOUT = 10
+STOCK_OBJECT_CACHE_TIMEOUT = 3600
+
+# Product image renditions: the box each size is fitted into, and the
+# formats every size is rendered in. Run ``manage.py generate_renditions``
+# after changing them; anything missed is rendered on first request.
+STOCK_MEDIA_RENDITIONS = {
+    "thumb": (160, 160),
+    "card": (480, 480),
+    "large": (1200, 1200),
+}
+STOCK_MEDIA_RENDITION_FORMATS = ("webp", "jpeg")
+
+# Price bucket lower bounds of the product price facet, and the seconds the
+# in-process facet index may lag behind catalog and inventory changes.
+STOCK_PRICE_FACETS = (0, 10, 50, 100, 500)
+STOCK_FACET_MAX_STALENESS = 30
+
+# Seconds a dashboard widget may keep showing figures older than the last
+# inventory change before it is recomputed.
+DASHBOARD_WIDGET_MAX_STALENESS = 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 